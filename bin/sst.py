@@ -64,7 +64,7 @@ toolkitdir = os.path.join(scriptdir, 'mt_seismicsource')
 
 metadata = {}
 
-MODE_IDENTIFIERS = ('ASZ', 'FSZ')
+MODE_IDENTIFIERS = ('ASZ', 'ASZMR', 'ASZML', 'ASZWEI', 'FSZ')
 
 CATALOG_PATH = os.path.join(layers.DATA_DIR, eqcatalog.CATALOG_DIR, 
     eqcatalog.CATALOG_FILES[0])
@@ -106,6 +106,10 @@ def setUp():
     in_infile_name = None
     in_mode = None
     in_outfile_name = None
+    in_decluster = False
+    in_append_catalog_name = None
+    in_complete_only = False
+    in_bootstrap = False
 
     # Read commandline arguments
     cmdParams = sys.argv[1:]
@@ -113,13 +117,25 @@ def setUp():
         PrintHelp()
         sys.exit()
             
-    opts, args = getopt.gnu_getopt(cmdParams, 'hwi:m:o:', [])
+    opts, args = getopt.gnu_getopt(cmdParams, 'hbcdwa:i:m:o:', [])
 
     for option, parameter in opts:
 
         if option == '-w':
             in_overwrite = True
 
+        if option == '-d':
+            in_decluster = True
+
+        if option == '-a':
+            in_append_catalog_name = parameter
+
+        if option == '-c':
+            in_complete_only = True
+
+        if option == '-b':
+            in_bootstrap = True
+
         if option == '-i':
             in_infile_name = parameter
 
@@ -140,6 +156,9 @@ def setUp():
     else:
         metadata['mode'] = in_mode
 
+    metadata['complete_only'] = in_complete_only
+    metadata['bootstrap'] = in_bootstrap
+
     # check if input file exists
     if os.path.isfile(in_infile_name):
         metadata['infile_name'] = in_infile_name
@@ -176,7 +195,18 @@ def setUp():
     metadata['data'] = data.Datasets(ui_mode=False)
     
     # EQ catalog
-    (foo, metadata['catalog']) = eqcatalog.loadEQCatalogFromFile(CATALOG_PATH)
+    (foo, metadata['catalog']) = eqcatalog.loadEQCatalogFromFile(
+        CATALOG_PATH, create_layer=False, decluster_catalog=in_decluster)
+
+    # additional EQ catalog file, appended to EQ catalog (declustered if
+    # EQ catalog is declustered)
+    if in_append_catalog_name is not None:
+        if not os.path.isfile(in_append_catalog_name):
+            error_str = "EQ catalog file to append does not exist"
+            raise ValueError, error_str
+
+        engine.appendCatalogEvents(metadata['catalog'], 
+            in_append_catalog_name, ui_mode=False)
     
     # background zones
     metadata['background_layer'] = background.loadBackgroundZoneFromFile(
@@ -191,6 +221,12 @@ def run():
     # choose mode
     if metadata['mode'] == 'ASZ':
         layer = processASZ()
+    elif metadata['mode'] == 'ASZMR':
+        layer = processASZMomentRate()
+    elif metadata['mode'] == 'ASZML':
+        layer = processASZMaxLikelihood()
+    elif metadata['mode'] == 'ASZWEI':
+        layer = processASZWeichert()
     elif metadata['mode'] == 'FSZ':
         layer = processFSZ()
     else:
@@ -209,10 +245,72 @@ def run():
 def processASZ():
     """Compute attributes for Area Source Zones:
         - activity parameters using Roger Musson's code
+        - seismic moment rates
     """
     
     global metadata
     
+    loadASZ()
+    
+    print "computing attributes for ASZ layer"
+    engine.computeASZ(metadata['asz_layer'], metadata['catalog'], 
+        metadata['data'], complete_only=metadata['complete_only'], 
+        bootstrap=metadata['bootstrap'], ui_mode=False)
+
+    return metadata['asz_layer']
+
+def processASZMomentRate():
+    """Compute seismic moment rate attributes for Area Source Zones, 
+    using existing activity attributes.
+    """
+    
+    global metadata
+    
+    loadASZ()
+    
+    print "computing moment rates for ASZ layer"
+    engine.updateASZMomentRate(metadata['asz_layer'], metadata['catalog'], 
+        metadata['data'], complete_only=metadata['complete_only'], 
+        ui_mode=False)
+
+    return metadata['asz_layer']
+
+def processASZMaxLikelihood():
+    """Compute maximum likelihood a/b value attributes for Area Source 
+    Zones.
+    """
+    
+    global metadata
+    
+    loadASZ()
+    
+    print "computing max likelihood a/b values for ASZ layer"
+    engine.updateASZMaxLikelihoodAB(metadata['asz_layer'], 
+        metadata['catalog'], bootstrap=metadata['bootstrap'], ui_mode=False)
+
+    return metadata['asz_layer']
+
+def processASZWeichert():
+    """Compute a/b value attributes for Area Source Zones with Weichert's
+    method, using completeness periods of zones (quick-look alternative
+    to Roger Musson's code).
+    """
+    
+    global metadata
+    
+    loadASZ()
+    
+    print "computing Weichert a/b values for ASZ layer"
+    engine.updateASZWeichertAB(metadata['asz_layer'], metadata['catalog'], 
+        ui_mode=False)
+
+    return metadata['asz_layer']
+
+def loadASZ():
+    """Load ASZ layer and select all features."""
+    
+    global metadata
+    
     print "loading ASZ layer"
     metadata['asz_layer'] = areasource.loadAreaSourceFromSHP(
         metadata['infile_name'], metadata['data'].mmax, 
@@ -226,12 +324,6 @@ def processASZ():
     all_features = [feat.id() for feat in pr]
     #all_features = [292]
     metadata['asz_layer'].setSelectedFeatures(all_features)
-    
-    print "computing attributes for ASZ layer"
-    engine.computeASZ(metadata['asz_layer'], 
-        metadata['catalog'], ui_mode=False)
-
-    return metadata['asz_layer']
 
 def processFSZ():
     """Compute attributes for Fault Source Zones:
@@ -283,9 +375,15 @@ def PrintHelp():
     print 'Usage: %s [OPTION]' % scriptname
     print '  Options'
     print '   -i FILE      Input file'
-    print '   -m VALUE     Mode (ASZ/FSZ)'
+    print '   -m VALUE     Mode (ASZ/ASZMR/ASZML/ASZWEI/FSZ)'
     print '   -o FILE      Output file'
     print '   -w           Overwrite existing attributes'
+    print '   -d           Decluster EQ catalog (Gardner-Knopoff windows)'
+    print '   -a FILE      Append events of ZMAP catalog file to EQ catalog'
+    print '   -c           Use only complete EQs (zone mcdist) for ASZ EQ '\
+        'moment rate'
+    print '   -b           Bootstrap confidence intervals of ML Mc and b '\
+        'value (ASZ/ASZML)'
     print '   -h, --help   Print this information'
     
 if __name__ == "__main__":
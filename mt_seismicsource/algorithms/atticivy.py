@@ -36,8 +36,6 @@ from PyQt4.QtGui import *
 
 from qgis.core import *
 
-import QPCatalog
-
 from mt_seismicsource import attributes
 from mt_seismicsource import features
 from mt_seismicsource import utils
@@ -84,7 +82,7 @@ def assignActivityAtticIvy(layer, catalog, mmin=ATTICIVY_MMIN,
 
     Input:
         layer       QGis layer with area zone features
-        catalog     earthquake catalog as QuakePy object
+        catalog     earthquake catalog as ColumnarCatalog object
     """
 
     # get attribute indexes
@@ -98,7 +96,7 @@ def assignActivityAtticIvy(layer, catalog, mmin=ATTICIVY_MMIN,
     mcdist_idx = zone_attribute_map[mcdist_name][0]
 
     fts = layer.selectedFeatures()
-    polygons, vertices = utils.polygonsQGS2Shapely(fts)
+    polygons, vertices = utils.polygonsQGS2Shapely(fts, layer=layer)
 
     # get mmax and mcdist from layer zone attributes
     mmax = []
@@ -144,7 +142,7 @@ def computeActivityAtticIvy(polygons, mmax, mcdist, catalog,
         polygons        list of Shapely polygons for input zones
         mmax            list of mmax values
         mcdist          list of mcdist strings
-        catalog         earthquake catalog as QuakePy object
+        catalog         earthquake catalog as ColumnarCatalog object
         mmin            minimum magnitude used for AtticIvy computation
 
     Output: 
@@ -168,13 +166,11 @@ def computeActivityAtticIvy(polygons, mmax, mcdist, catalog,
 
     # do depth filtering on catalog
     # don't exclude events with 'NaN' values
-    cat_cut = QPCatalog.QPCatalog()
-    cat_cut.merge(catalog)
-    cat_cut.cut(mindepth=mindepth, maxdepth=maxdepth)
+    cat_cut = catalog.cutDepth(mindepth, maxdepth)
     
     # write catalog to temp file in AtticIvy format
     catalog_file_path = os.path.join(temp_dir, ATTICIVY_CATALOG_FILE)
-    cat_cut.exportAtticIvy(catalog_file_path)
+    cat_cut.toQPCatalog().exportAtticIvy(catalog_file_path)
 
     # start AtticIvy computation (subprocess)
     exec_file = os.path.basename(ATTICIVY_EXECUTABLE)
@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+"""
+SHARE Seismic Source Toolkit
+
+Bootstrap confidence intervals of completeness magnitude (Mc) and
+maximum likelihood b value, for many zones at once.
+
+Author: Fabian Euchner, fabian@sed.ethz.ch
+"""
+
+############################################################################
+#    This program is free software; you can redistribute it and/or modify  #
+#    it under the terms of the GNU General Public License as published by  #
+#    the Free Software Foundation; either version 2 of the License, or     #
+#    (at your option) any later version.                                   #
+#                                                                          #
+#    This program is distributed in the hope that it will be useful,       #
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of        #
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         #
+#    GNU General Public License for more details.                          #
+#                                                                          #
+#    You should have received a copy of the GNU General Public License     #
+#    along with this program; if not, write to the                         #
+#    Free Software Foundation, Inc.,                                       #
+#    59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.             #
+############################################################################
+
+import multiprocessing
+import numpy
+
+from mt_seismicsource.algorithms import completeness
+
+BOOTSTRAP_SAMPLES = 200
+BOOTSTRAP_CONFIDENCE = 0.95
+BOOTSTRAP_SEED = 42
+
+# zones with less events get NaN confidence intervals
+BOOTSTRAP_MIN_EVENTS = 50
+
+# number of worker processes (None: number of CPUs), zones are only
+# distributed to worker processes if there are at least that many zones
+BOOTSTRAP_PROCESSES = None
+BOOTSTRAP_MIN_ZONES_PARALLEL = 4
+
+# max number of resampled magnitudes held in memory at once
+BOOTSTRAP_CHUNK_SIZE = 5000000
+
+def bootstrapMcB(zone_magnitudes, binsize=0.1, 
+    Mc=completeness.MC_METHOD_MAXC,
+    sample_cnt=BOOTSTRAP_SAMPLES, confidence=BOOTSTRAP_CONFIDENCE,
+    min_events=BOOTSTRAP_MIN_EVENTS, processes=BOOTSTRAP_PROCESSES,
+    seed=BOOTSTRAP_SEED):
+    """Bootstrap confidence intervals of Mc and b value for each zone.
+
+    The magnitudes of each zone are resampled with replacement, all
+    samples of a zone at once (vectorized index sampling). In each sample,
+    Mc is determined with the Mc method (see 
+    completeness.completenessMagnitude()), or fixed, and b with the 
+    Aki/Utsu maximum likelihood estimator from the events at or above Mc.
+    Zones are distributed across a process pool. Results do not depend on
+    the number of processes, since each zone has its own random seed.
+
+    Input:
+        zone_magnitudes     list of arrays of event magnitudes, one per zone
+        binsize             magnitude bin width
+        Mc                  fixed Mc value, or name of Mc method
+        sample_cnt          number of bootstrap samples
+        confidence          confidence level of intervals
+        processes           number of worker processes (1: no process pool,
+                            None: number of CPUs)
+
+    Output:
+        (mc_low, mc_high, b_low, b_high)
+        arrays of lower and upper confidence limits, one value per zone
+    """
+
+    tasks = [(magnitudes, binsize, Mc, sample_cnt, confidence, min_events,
+        seed + zone_idx) for zone_idx, magnitudes in enumerate(
+            zone_magnitudes)]
+
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+
+    if processes > 1 and len(tasks) >= BOOTSTRAP_MIN_ZONES_PARALLEL:
+        try:
+            pool = multiprocessing.Pool(processes)
+        except (OSError, ImportError):
+            pool = None
+    else:
+        pool = None
+
+    if pool is None:
+        result = map(_bootstrapZone, tasks)
+    else:
+        try:
+            result = pool.map(_bootstrapZone, tasks)
+        finally:
+            pool.close()
+            pool.join()
+
+    if len(result) == 0:
+        return tuple([numpy.array([]) for x in xrange(4)])
+    else:
+        return tuple(numpy.array(result).T)
+
+def _bootstrapZone(task):
+    """Bootstrap confidence limits of Mc and b value for one zone. Worker
+    function for process pool, has to be at module level."""
+
+    (magnitudes, binsize, Mc, sample_cnt, confidence, min_events,
+        seed) = task
+
+    magnitudes = numpy.asarray(magnitudes, dtype=float)
+    magnitudes = magnitudes[numpy.isfinite(magnitudes)]
+    event_cnt = magnitudes.size
+
+    if event_cnt < max(min_events, 2):
+        return 4 * (numpy.nan,)
+
+    random_state = numpy.random.RandomState(seed)
+
+    # magnitude bins of zone
+    mag_min = numpy.round(magnitudes.min() / binsize) * binsize
+    bin_idx = numpy.round((magnitudes - mag_min) / binsize).astype(int)
+    bin_cnt = bin_idx.max() + 1
+
+    mc = numpy.zeros(sample_cnt)
+    b = numpy.zeros(sample_cnt)
+
+    chunk_samples = max(1, BOOTSTRAP_CHUNK_SIZE / event_cnt)
+    for start in xrange(0, sample_cnt, chunk_samples):
+        end = min(start + chunk_samples, sample_cnt)
+        curr_cnt = end - start
+
+        # resampled event indices, one row per sample
+        sample_idx = random_state.randint(0, event_cnt,
+            (curr_cnt, event_cnt))
+        sample_bins = bin_idx[sample_idx]
+
+        if Mc in completeness.MC_METHOD_NAMES:
+
+            # binned FMD of each sample
+            cell_idx = (sample_bins + bin_cnt * \
+                numpy.arange(curr_cnt)[:, numpy.newaxis]).ravel()
+            histogram = numpy.bincount(cell_idx,
+                minlength=curr_cnt*bin_cnt).reshape((curr_cnt, bin_cnt))
+            mag_sum = numpy.bincount(cell_idx, 
+                weights=magnitudes[sample_idx].ravel(),
+                minlength=curr_cnt*bin_cnt).reshape((curr_cnt, bin_cnt))
+
+            mc_sample = completeness.completenessMagnitude(histogram, 
+                mag_sum, mag_min + binsize * numpy.arange(bin_cnt), 
+                binsize, Mc)
+            mc_bin = numpy.round((mc_sample - mag_min) / binsize)
+        else:
+            mc_bin = numpy.round((Mc - mag_min) / binsize) * numpy.ones(
+                curr_cnt)
+
+        with numpy.errstate(invalid='ignore', divide='ignore'):
+            above = (sample_bins >= mc_bin[:, numpy.newaxis])
+            mag_mean = (magnitudes[sample_idx] * above).sum(axis=1) / \
+                above.sum(axis=1)
+            mc[start:end] = mag_min + binsize * mc_bin
+            b[start:end] = numpy.log10(numpy.e) / (mag_mean - \
+                (mc[start:end] - 0.5 * binsize))
+
+    percentiles = (50.0 * (1.0 - confidence), 50.0 * (1.0 + confidence))
+    b = b[numpy.isfinite(b)]
+    if b.size == 0:
+        (b_low, b_high) = (numpy.nan, numpy.nan)
+    else:
+        (b_low, b_high) = numpy.percentile(b, percentiles)
+
+    mc = mc[numpy.isfinite(mc)]
+    if mc.size == 0:
+        (mc_low, mc_high) = (numpy.nan, numpy.nan)
+    else:
+        (mc_low, mc_high) = numpy.percentile(mc, percentiles)
+
+    return (mc_low, mc_high, b_low, b_high)
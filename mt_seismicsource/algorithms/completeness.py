@@ -0,0 +1,297 @@
+# -*- coding: utf-8 -*-
+"""
+SHARE Seismic Source Toolkit
+
+Selection of complete events from completeness histories (mcdist) of
+source zones.
+
+Author: Fabian Euchner, fabian@sed.ethz.ch
+"""
+
+############################################################################
+#    This program is free software; you can redistribute it and/or modify  #
+#    it under the terms of the GNU General Public License as published by  #
+#    the Free Software Foundation; either version 2 of the License, or     #
+#    (at your option) any later version.                                   #
+#                                                                          #
+#    This program is distributed in the hope that it will be useful,       #
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of        #
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         #
+#    GNU General Public License for more details.                          #
+#                                                                          #
+#    You should have received a copy of the GNU General Public License     #
+#    along with this program; if not, write to the                         #
+#    Free Software Foundation, Inc.,                                       #
+#    59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.             #
+############################################################################
+
+import numpy
+
+# tolerance for comparison of event magnitudes with completeness magnitude
+MAGNITUDE_TOLERANCE = 1.0e-6
+
+# names of Mc methods (as in QuakePy)
+MC_METHOD_MAXC = 'maxCurvature'
+MC_METHOD_BEST = 'mcbest'
+MC_METHOD_GFT = 'GFT'
+MC_METHOD_NAMES = (MC_METHOD_MAXC, MC_METHOD_BEST, MC_METHOD_GFT)
+
+# goodness-of-fit levels (percent) of Mc methods GFT and mcbest, and range
+# of tested Mc values, relative to Mc from maximum curvature
+MC_GFT_LEVEL = 90.0
+MC_BEST_LEVELS = (95.0, 90.0)
+MC_GFT_RANGE = (-0.9, 1.5)
+
+def parseMcdist(mcdist_list):
+    """Parse mcdist strings of zones into arrays.
+
+    A mcdist string is a sequence of (magnitude, year) pairs,
+    e.g., "3.5 1980 4.0 1950 5.0 1800": events with magnitude Mc (or
+    larger) are complete since the given year.
+
+    Input:
+        mcdist_list     list of mcdist strings, one per zone. Zones with
+                        None, empty, or malformed mcdist have no
+                        completeness constraint.
+
+    Output:
+        (mc_mag, mc_year)
+        mc_mag          (zones x periods) array of completeness magnitudes,
+                        sorted per zone, padded with +inf
+        mc_year         (zones x periods) array of years since which
+                        events at magnitude mc_mag are complete (cumulative
+                        minimum over smaller completeness magnitudes)
+    """
+
+    zone_periods = []
+    for mcdist in mcdist_list:
+        try:
+            values = numpy.array(mcdist.strip().split(), dtype=float)
+        except (AttributeError, ValueError):
+            values = numpy.array([])
+
+        if values.size < 2:
+
+            # no constraint: all events complete
+            zone_periods.append(numpy.array([[-numpy.inf, -numpy.inf]]))
+        else:
+            periods = values[0:2*(values.size/2)].reshape((-1, 2))
+            zone_periods.append(periods[numpy.argsort(periods[:, 0],
+                kind='mergesort')])
+
+    period_cnt = max([1] + [x.shape[0] for x in zone_periods])
+
+    mc_mag = numpy.ones((len(zone_periods), period_cnt)) * numpy.inf
+    mc_year = numpy.ones((len(zone_periods), period_cnt)) * numpy.inf
+
+    for zone_idx, periods in enumerate(zone_periods):
+        mc_mag[zone_idx, 0:periods.shape[0]] = periods[:, 0]
+        mc_year[zone_idx, 0:periods.shape[0]] = \
+            numpy.minimum.accumulate(periods[:, 1])
+
+    return (mc_mag, mc_year)
+
+def completenessMask(zone_idx, magnitude, time, mc_mag, mc_year, 
+    binsize=None):
+    """Return boolean array, True for events that are complete according to
+    completeness history of their zone.
+
+    Input:
+        zone_idx        array of zone index for each event
+        magnitude       array of event magnitudes
+        time            array of event times (decimal years)
+        mc_mag, mc_year completeness arrays from parseMcdist()
+        binsize         if given, event magnitudes are replaced by the 
+                        centre of their magnitude bin (bins centred on 
+                        multiples of binsize, as in FMDBatch), so that 
+                        events are complete in the same bins as in 
+                        completenessDuration()
+    """
+
+    zone_idx = numpy.asarray(zone_idx, dtype=int)
+    magnitude = numpy.asarray(magnitude, dtype=float)
+    time = numpy.asarray(time, dtype=float)
+
+    if zone_idx.size == 0:
+        return numpy.zeros(0, dtype=bool)
+
+    if binsize is not None:
+        magnitude = numpy.round(magnitude / binsize) * binsize
+
+    # number of completeness periods with Mc at or below event magnitude
+    period_cnt = (mc_mag[zone_idx] <= \
+        (magnitude + MAGNITUDE_TOLERANCE)[:, numpy.newaxis]).sum(axis=1)
+
+    # events below smallest Mc are incomplete
+    start_year = numpy.ones(zone_idx.shape) * numpy.inf
+    covered = (period_cnt > 0)
+    start_year[covered] = mc_year[zone_idx[covered], period_cnt[covered] - 1]
+
+    return (time >= start_year)
+
+def completeZoneEvents(zone_events, mcdist_list, magnitude, time, 
+    binsize=None):
+    """Remove incomplete events from event sets of zones, in one pass
+    over all zones.
+
+    Input:
+        zone_events     list of event index arrays, one per zone
+        mcdist_list     list of mcdist strings, one per zone
+        magnitude       array of magnitudes of all catalog events
+        time            array of times of all catalog events
+        binsize         if given, completeness is tested for the centre
+                        of the magnitude bin of each event (see 
+                        completenessMask())
+
+    Output:
+        list of event index arrays with complete events, one per zone
+    """
+
+    (mc_mag, mc_year) = parseMcdist(mcdist_list)
+
+    event_cnt = [x.size for x in zone_events]
+    if sum(event_cnt) == 0:
+        return zone_events
+
+    events = numpy.concatenate(zone_events).astype(int)
+    zone_idx = numpy.repeat(numpy.arange(len(zone_events)), event_cnt)
+
+    complete = completenessMask(zone_idx, magnitude[events], time[events],
+        mc_mag, mc_year, binsize)
+
+    offsets = numpy.cumsum([0] + event_cnt)
+    return [events[offsets[idx]:offsets[idx+1]][
+        complete[offsets[idx]:offsets[idx+1]]] \
+            for idx in xrange(len(zone_events))]
+
+def completenessDuration(mag_bins, mc_mag, mc_year, start_year, end_year):
+    """Return observation time in years, during which events in magnitude
+    bins are complete, for each zone.
+
+    Input:
+        mag_bins        array of magnitude bin centres
+        mc_mag, mc_year completeness arrays from parseMcdist()
+        start_year      start of catalog (decimal year)
+        end_year        end of catalog (decimal year)
+
+    Output:
+        (zones x bins) array of complete observation times (zero for bins
+        below smallest Mc of zone)
+    """
+
+    mag_bins = numpy.asarray(mag_bins, dtype=float)
+
+    # number of completeness periods with Mc at or below bin magnitude
+    period_cnt = (mc_mag[:, numpy.newaxis, :] <= \
+        (mag_bins + MAGNITUDE_TOLERANCE)[numpy.newaxis, :, numpy.newaxis]
+        ).sum(axis=2)
+
+    zone_idx = numpy.repeat(numpy.arange(mc_mag.shape[0])[:, numpy.newaxis],
+        mag_bins.size, axis=1)
+
+    start = numpy.ones(period_cnt.shape) * numpy.inf
+    covered = (period_cnt > 0)
+    start[covered] = mc_year[zone_idx[covered], period_cnt[covered] - 1]
+
+    return numpy.clip(end_year - numpy.maximum(start, start_year), 0.0, 
+        numpy.inf)
+
+def completenessMagnitude(incremental, mag_sum, mag_bins, binsize, 
+    method=MC_METHOD_MAXC):
+    """Completeness magnitude of binned FMDs, with Mc method
+
+        maxCurvature    magnitude bin with largest incremental count
+        GFT             goodness-of-fit test (Wiemer and Wyss, 2000):
+                        smallest Mc for which the G-R law fits the FMD 
+                        above Mc at the MC_GFT_LEVEL level (NaN if no Mc
+                        reaches that level)
+        mcbest          smallest Mc for which the fit reaches the first of
+                        MC_BEST_LEVELS that is reached, maximum curvature 
+                        if none is reached
+
+    Mc values for the goodness-of-fit test are taken from MC_GFT_RANGE 
+    around maximum curvature. Raises ValueError for unknown Mc methods.
+
+    Input:
+        incremental     (rows x bins) array of incremental event counts
+        mag_sum         (rows x bins) array of sums of event magnitudes
+        mag_bins        array of magnitude bin centres
+        binsize         magnitude bin width
+        method          name of Mc method
+
+    Output:
+        array of Mc values, one per row
+    """
+
+    if method not in MC_METHOD_NAMES:
+        raise ValueError, "unknown Mc method: %s" % method
+
+    maxc_bin = numpy.argmax(incremental, axis=1)
+    mc = mag_bins[maxc_bin]
+
+    if method == MC_METHOD_GFT:
+        mc = _mcGoodnessOfFit(fitGoodness(incremental, mag_sum, mag_bins,
+            binsize), maxc_bin, mag_bins, binsize, MC_GFT_LEVEL)
+
+    elif method == MC_METHOD_BEST:
+        goodness = fitGoodness(incremental, mag_sum, mag_bins, binsize)
+        for level in MC_BEST_LEVELS[::-1]:
+            mc_level = _mcGoodnessOfFit(goodness, maxc_bin, mag_bins, 
+                binsize, level)
+            mc = numpy.where(numpy.isfinite(mc_level), mc_level, mc)
+
+    return mc
+
+def fitGoodness(incremental, mag_sum, mag_bins, binsize):
+    """Goodness of fit (in percent) of the G-R law to binned FMDs, with 
+    each magnitude bin as Mc (Wiemer and Wyss, 2000). The G-R law is the
+    maximum likelihood fit to the events at or above Mc, the residual is 
+    the sum of absolute differences of observed and modelled incremental
+    counts at or above Mc, relative to the number of events at or above Mc.
+
+    Output:
+        (rows x bins) array, NaN for bins without events at or above
+    """
+
+    (row_cnt, bin_cnt) = incremental.shape
+    cumulative = incremental[:, ::-1].cumsum(axis=1)[:, ::-1]
+    mag_sum = mag_sum[:, ::-1].cumsum(axis=1)[:, ::-1]
+
+    goodness = numpy.nan * numpy.ones((row_cnt, bin_cnt))
+    for bin_idx in xrange(bin_cnt):
+
+        event_cnt = cumulative[:, bin_idx].astype(float)
+        with numpy.errstate(invalid='ignore', divide='ignore', 
+            over='ignore'):
+            b = numpy.log10(numpy.e) / (mag_sum[:, bin_idx] / event_cnt - \
+                (mag_bins[bin_idx] - 0.5 * binsize))
+
+            # modelled cumulative and incremental counts at or above Mc
+            model_cumulative = event_cnt[:, numpy.newaxis] * numpy.power(
+                10.0, -b[:, numpy.newaxis] * (
+                    mag_bins[numpy.newaxis, bin_idx:] - mag_bins[bin_idx]))
+            model_incremental = model_cumulative.copy()
+            model_incremental[:, 0:-1] -= model_cumulative[:, 1:]
+
+            goodness[:, bin_idx] = 100.0 - 100.0 * numpy.abs(
+                incremental[:, bin_idx:] - model_incremental).sum(axis=1) / \
+                    event_cnt
+
+    return goodness
+
+def _mcGoodnessOfFit(goodness, maxc_bin, mag_bins, binsize, level):
+    """Smallest Mc in MC_GFT_RANGE around maximum curvature bin for which
+    goodness of fit reaches level, NaN if level is not reached."""
+
+    bins = numpy.arange(mag_bins.size)[numpy.newaxis, :]
+    (offset_low, offset_high) = [int(numpy.round(x / binsize)) \
+        for x in MC_GFT_RANGE]
+
+    with numpy.errstate(invalid='ignore'):
+        candidate = (goodness >= level) & \
+            (bins >= maxc_bin[:, numpy.newaxis] + offset_low) & \
+            (bins <= maxc_bin[:, numpy.newaxis] + offset_high)
+
+    mc = mag_bins[numpy.argmax(candidate, axis=1)]
+    mc[~candidate.any(axis=1)] = numpy.nan
+    return mc
@@ -0,0 +1,263 @@
+# -*- coding: utf-8 -*-
+"""
+SHARE Seismic Source Toolkit
+
+Window-based declustering of EQ catalogs, with space-time windows of
+Gardner and Knopoff.
+See: Gardner and Knopoff (1974) Bull. Seismol. Soc. Am., 64, 1363--1367
+
+Author: Fabian Euchner, fabian@sed.ethz.ch
+"""
+
+############################################################################
+#    This program is free software; you can redistribute it and/or modify  #
+#    it under the terms of the GNU General Public License as published by  #
+#    the Free Software Foundation; either version 2 of the License, or     #
+#    (at your option) any later version.                                   #
+#                                                                          #
+#    This program is distributed in the hope that it will be useful,       #
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of        #
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         #
+#    GNU General Public License for more details.                          #
+#                                                                          #
+#    You should have received a copy of the GNU General Public License     #
+#    along with this program; if not, write to the                         #
+#    Free Software Foundation, Inc.,                                       #
+#    59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.             #
+############################################################################
+
+import numpy
+
+from mt_seismicsource.algorithms import spatial
+
+EARTH_RADIUS_KM = 6371.0
+DAYS_PER_YEAR = 365.25
+
+# fraction of time window before a mainshock in which foreshocks are
+# assigned to its cluster
+FORESHOCK_TIME_FRACTION = 0.0
+
+# number of events for which window candidates are found at once, and max
+# number of candidate event pairs held in memory at once
+DECLUSTER_CHUNK_EVENTS = 10000
+DECLUSTER_CHUNK_SIZE = 2000000
+
+def windowGardnerKnopoff(magnitude):
+    """Return space (km) and time (days) window sizes for magnitudes,
+    according to Gardner and Knopoff (1974)."""
+
+    magnitude = numpy.asarray(magnitude, dtype=float)
+
+    distance_km = numpy.power(10.0, 0.1238 * magnitude + 0.983)
+    time_days = numpy.where(magnitude >= 6.5,
+        numpy.power(10.0, 0.032 * magnitude + 2.7389),
+        numpy.power(10.0, 0.5409 * magnitude - 0.547))
+
+    return (distance_km, time_days)
+
+def declusterWindow(lon, lat, time, magnitude,
+    foreshock_time_fraction=FORESHOCK_TIME_FRACTION,
+    window=windowGardnerKnopoff):
+    """Window-based declustering of an EQ catalog.
+
+    Events are processed in order of decreasing magnitude. All events that
+    are not yet assigned to a cluster and lie within the space-time window
+    of an event are assigned to the cluster of that event. 
+
+    Window candidates are found for chunks of events at once: epicentres 
+    are indexed in a grid and sorted by time within each grid cell, so 
+    that the candidates of an event in a grid cell are a contiguous slice,
+    found by binary search. Distances of all candidate pairs of a chunk are
+    computed in one vectorized step. Only the assignment of events to 
+    clusters, which depends on the processing order, is done event by 
+    event, and only for events whose window contains other unassigned 
+    events.
+
+    Input:
+        lon, lat                    arrays of epicentre coordinates
+        time                        array of event times (decimal years)
+        magnitude                   array of magnitudes
+        foreshock_time_fraction     fraction of time window before an event
+                                    in which foreshocks are assigned to its
+                                    cluster
+        window                      function that returns (distance in km,
+                                    time in days) windows for magnitudes
+
+    Output:
+        (mainshock, cluster)
+        mainshock   boolean array, True for mainshocks and single events
+        cluster     cluster index of each event (index of its mainshock)
+    """
+
+    lon = numpy.asarray(lon, dtype=float)
+    lat = numpy.asarray(lat, dtype=float)
+    time = numpy.asarray(time, dtype=float)
+    magnitude = numpy.asarray(magnitude, dtype=float)
+
+    event_cnt = lon.shape[0]
+    cluster = -numpy.ones(event_cnt, dtype=int)
+
+    (distance_km, time_days) = window(magnitude)
+    time_years = time_days / DAYS_PER_YEAR
+
+    # time window of each event, as range of positions in time-sorted 
+    # catalog
+    time_order = numpy.argsort(time, kind='mergesort')
+    time_sorted = time[time_order]
+    time_rank = numpy.zeros(event_cnt, dtype=numpy.int64)
+    time_rank[time_order] = numpy.arange(event_cnt)
+
+    time_start = numpy.searchsorted(time_sorted, 
+        time - foreshock_time_fraction * time_years, side='left')
+    time_end = numpy.searchsorted(time_sorted, time + time_years, 
+        side='right')
+
+    # epicentres sorted by grid cell, and by time within grid cell
+    grid_index = spatial.GridIndex(lon, lat)
+    grid_keys = grid_index.cells.astype(numpy.int64) * event_cnt + \
+        time_rank[grid_index.order]
+    key_order = numpy.argsort(grid_keys, kind='mergesort')
+    grid_keys = grid_keys[key_order]
+    grid_events = grid_index.order[key_order]
+
+    lon_rad = numpy.radians(lon)
+    lat_rad = numpy.radians(lat)
+
+    # space window of each event as bounding box in degrees (full 
+    # longitude range if window contains a pole)
+    delta_lat = numpy.degrees(distance_km / EARTH_RADIUS_KM)
+    with numpy.errstate(invalid='ignore', divide='ignore'):
+        delta_lon_sin = numpy.sin(distance_km / EARTH_RADIUS_KM) / \
+            numpy.cos(lat_rad)
+        delta_lon = numpy.where(numpy.abs(delta_lon_sin) < 1.0, 
+            numpy.degrees(numpy.arcsin(numpy.minimum(
+                numpy.abs(delta_lon_sin), 1.0))), 360.0)
+
+    # process events in order of decreasing magnitude (stable for equal
+    # magnitudes, earlier events first)
+    order = numpy.lexsort((time, -magnitude))
+
+    position = 0
+    while position < event_cnt:
+
+        # unassigned events of next chunk
+        chunk_positions = numpy.where(cluster[
+            order[position:position+DECLUSTER_CHUNK_EVENTS]] < 0)[0]
+        events = order[position + chunk_positions]
+
+        if events.size == 0:
+            position += DECLUSTER_CHUNK_EVENTS
+            continue
+
+        (pair_event, slice_start, slice_cnt) = _windowCellSlices(
+            grid_index, grid_keys, event_cnt, events, lon[events], 
+            lat[events], delta_lon[events], delta_lat[events], 
+            time_start[events], time_end[events])
+
+        # limit number of candidate pairs: take events up to the one at 
+        # which the limit is reached (at least one)
+        candidate_cnt = numpy.cumsum(numpy.bincount(pair_event, 
+            weights=slice_cnt, minlength=events.size))
+        take_cnt = max(1, numpy.searchsorted(candidate_cnt, 
+            DECLUSTER_CHUNK_SIZE, side='right'))
+
+        if take_cnt < events.size:
+            events = events[0:take_cnt]
+            keep = (pair_event < take_cnt)
+            (pair_event, slice_start, slice_cnt) = (pair_event[keep], 
+                slice_start[keep], slice_cnt[keep])
+            position += chunk_positions[take_cnt]
+        else:
+            position += DECLUSTER_CHUNK_EVENTS
+
+        # candidate pairs (index in events, candidate event)
+        first = numpy.repeat(pair_event, slice_cnt)
+        second = grid_events[numpy.repeat(slice_start - \
+            numpy.cumsum(slice_cnt) + slice_cnt, slice_cnt) + \
+            numpy.arange(slice_cnt.sum())]
+
+        keep = (cluster[second] < 0)
+        (first, second) = (first[keep], second[keep])
+
+        # great circle distance (haversine)
+        ref = events[first]
+        sin_dlat = numpy.sin(0.5 * (lat_rad[second] - lat_rad[ref]))
+        sin_dlon = numpy.sin(0.5 * (lon_rad[second] - lon_rad[ref]))
+        distance = 2.0 * EARTH_RADIUS_KM * numpy.arcsin(numpy.sqrt(
+            sin_dlat * sin_dlat + numpy.cos(lat_rad[ref]) * \
+            numpy.cos(lat_rad[second]) * sin_dlon * sin_dlon))
+
+        keep = (distance <= distance_km[ref])
+        (first, second) = (first[keep], second[keep])
+
+        # events whose window contains no other event, and that are in no
+        # other window of the chunk, are single events or mainshocks
+        # without cluster members
+        other = (events[first] != second)
+        sequential = numpy.zeros(events.size, dtype=bool)
+        sequential[first[other]] = True
+        sequential[numpy.in1d(events, second[other])] = True
+
+        single = events[~sequential]
+        cluster[single] = single
+
+        # remaining events in processing order
+        offsets = numpy.concatenate(([0], numpy.cumsum(numpy.bincount(
+            first, minlength=events.size))))
+        for event_idx in numpy.where(sequential)[0]:
+
+            ev_idx = events[event_idx]
+            if cluster[ev_idx] >= 0:
+                continue
+
+            members = second[offsets[event_idx]:offsets[event_idx+1]]
+            cluster[members[cluster[members] < 0]] = ev_idx
+            cluster[ev_idx] = ev_idx
+
+    mainshock = (cluster == numpy.arange(event_cnt))
+    return (mainshock, cluster)
+
+def _windowCellSlices(grid_index, grid_keys, event_cnt, events, lon, lat,
+    delta_lon, delta_lat, time_start, time_end):
+    """Return slices of grid-sorted events (see declusterWindow()) in the
+    grid cells that overlap the space window, and in the time window of 
+    events. Events without valid epicentre get no slices.
+
+    Output:
+        (pair_event, slice_start, slice_cnt)
+        pair_event  index of event (in events) of each slice
+        slice_start start of slice in grid_keys
+        slice_cnt   length of slice
+    """
+
+    valid = numpy.where(~(numpy.isnan(lon) | numpy.isnan(lat)))[0]
+    cell_size = grid_index.cell_size
+
+    col_min = numpy.maximum(numpy.floor((lon[valid] - delta_lon[valid] - \
+        grid_index.lon_min) / cell_size), 0).astype(numpy.int64)
+    col_max = numpy.minimum(numpy.floor((lon[valid] + delta_lon[valid] - \
+        grid_index.lon_min) / cell_size), grid_index.col_cnt - 1).astype(
+            numpy.int64)
+    row_min = numpy.maximum(numpy.floor((lat[valid] - delta_lat[valid] - \
+        grid_index.lat_min) / cell_size), 0).astype(numpy.int64)
+    row_max = numpy.minimum(numpy.floor((lat[valid] + delta_lat[valid] - \
+        grid_index.lat_min) / cell_size), grid_index.row_cnt - 1).astype(
+            numpy.int64)
+
+    # one entry per event and grid cell
+    col_range = numpy.maximum(col_max - col_min + 1, 0)
+    cell_cnt = col_range * numpy.maximum(row_max - row_min + 1, 0)
+
+    entry = numpy.repeat(numpy.arange(valid.size), cell_cnt)
+    local = numpy.arange(cell_cnt.sum()) - numpy.repeat(
+        numpy.cumsum(cell_cnt) - cell_cnt, cell_cnt)
+    cells = (row_min[entry] + local // col_range[entry]) * \
+        grid_index.col_cnt + col_min[entry] + local % col_range[entry]
+
+    pair_event = valid[entry]
+    slice_start = numpy.searchsorted(grid_keys, 
+        cells * event_cnt + time_start[pair_event], side='left')
+    slice_end = numpy.searchsorted(grid_keys, 
+        cells * event_cnt + time_end[pair_event], side='left')
+
+    return (pair_event, slice_start, slice_end - slice_start)
@@ -30,6 +30,7 @@ import shapely.geometry
 from PyQt4.QtCore import *
 from PyQt4.QtGui import *
 
+from mt_seismicsource.algorithms import spatial
 from mt_seismicsource.algorithms import strain
 
 # Kanamori equation
@@ -110,39 +111,83 @@ def momentrateFromStrainRateBarba(poly, strain_in, regime):
         momentrate      moment rate computed from strain rate summed 
                         over area zone
     """
+    return momentrateFromStrainRateGrid(poly, 
+        strainRateGridBarba(strain_in, regime))
 
-    momentrate = 0.0
+def momentrateFromStrainRateBird(poly, strain_in, regime):
+    """Compute seismic moment rate from Bird strain rate data set.
+
+    Input:
+        poly            Area zone geometry as Shapely polygon
+        strain_in       Strain rate dataset as list of lists
+                        [ [lat, lon,  exx, eyy, exy], ...]
+        regime          Dict of Shapely multipolygons for each deformation regime
+                        Currently only Continental (C) and Ridge-transform (R)
+                        implemented
+                        {'C': Multipolygon, 'R': Multipolygon}
+
+    Output:
+        momentrate      moment rate computed from strain rate summed 
+                        over area zone
+    """
+    return momentrateFromStrainRateGrid(poly, 
+        strainRateGridBird(strain_in, regime))
 
-    for (lon, lat, value) in strain_in:
+def momentrateFromStrainRateGrid(poly, grid):
+    """Sum up moment rate contributions of strain rate grid nodes that lie
+    in a zone.
 
-        # make Shapely point from lon, lat
-        point = shapely.geometry.Point((lon, lat))
+    Input:
+        poly            Zone geometry as Shapely polygon
+        grid            Array of [lon, lat, moment rate] rows, as returned
+                        from strainRateGridBarba() or strainRateGridBird()
 
-        # check if in area zone polygon
-        # if positive, sum up strain rate contribution
-        if poly.intersects(point) and value > 0.0:
-            
-            # get deformation regime
-            regime_key = strain.tectonicRegimeForPoint(point, regime)
-                    
-            # if point not in one of the tectonic regions, use value for
-            # crustal
-            if regime_key not in (strain.DEFORMATION_REGIME_KEY_C, 
-                strain.DEFORMATION_REGIME_KEY_R):
-                regime_key = strain.DEFORMATION_REGIME_KEY_C
-                
-            # select value for coupled thickness (cz):
-            # if crustal, use value of Continental Transform Fault
-            # if ridge-transform: use value of Oceanic Transform Fault
-            # unit: km
-            if regime_key == strain.DEFORMATION_REGIME_KEY_C:
-                cz = strain.BIRD_SEISMICITY_PARAMETERS[\
-                    strain.DEFORMATION_REGIME_KEY_CTF]['cz']
-            else:
-                cz = strain.BIRD_SEISMICITY_PARAMETERS[\
-                    strain.DEFORMATION_REGIME_KEY_OTF]['cz']
-                    
-            momentrate += (cz * value)
+    Output:
+        momentrate      moment rate computed from strain rate summed 
+                        over zone
+    """
+    if grid.shape[0] == 0:
+        return 0.0
+
+    # grid nodes on the zone boundary are included, as with Shapely
+    # intersects()
+    inside = spatial.pointsInPolygon(grid[:, 0], grid[:, 1], poly, 
+        boundary=True)
+    return float(grid[inside, 2].sum())
+
+def strainRateGridBarba(strain_in, regime):
+    """Compute moment rate contribution of each node of the Barba strain 
+    rate data set. This does not depend on the zone geometry and can be 
+    shared by all zones of a layer.
+
+    Input:
+        strain_in       Strain rate dataset as list of lists
+                        [ [lon, lat, value], ...]
+        regime          Dict of Shapely multipolygons for each deformation 
+                        regime
+
+    Output:
+        grid            Array of [lon, lat, moment rate] rows, only for nodes
+                        with positive strain rate
+    """
+
+    strain_arr = numpy.array(strain_in, dtype=float).reshape(-1, 3)
+    strain_arr = strain_arr[strain_arr[:, 2] > 0.0]
+    
+    lon = strain_arr[:, 0]
+    lat = strain_arr[:, 1]
+    regime_keys = strain.tectonicRegimeForPoints(lon, lat, regime)
+
+    # select value for coupled thickness (cz):
+    # if ridge-transform: use value of Oceanic Transform Fault
+    # otherwise (crustal, or point not in one of the tectonic regions), 
+    # use value of Continental Transform Fault
+    # unit: km
+    cz = numpy.where(regime_keys == strain.DEFORMATION_REGIME_KEY_R,
+        strain.BIRD_SEISMICITY_PARAMETERS[\
+            strain.DEFORMATION_REGIME_KEY_OTF]['cz'],
+        strain.BIRD_SEISMICITY_PARAMETERS[\
+            strain.DEFORMATION_REGIME_KEY_CTF]['cz'])
 
     # Bird & Liu eq. 7B
     # Note: unit of values in Barba dataset is s^-1
@@ -151,98 +196,79 @@ def momentrateFromStrainRateBarba(poly, strain_in, regime):
     # TODO(fab): double-check this !!
     # convert to strain rate per square kilometre: multiply with 10^-6
     # return 1000 * cz * SHEAR_MODULUS * strainrate * 1.0e-6
-    return 1000 * SHEAR_MODULUS * momentrate
+    momentrate = 1000 * SHEAR_MODULUS * cz * strain_arr[:, 2]
 
-def momentrateFromStrainRateBird(poly, strain_in, regime):
-    """Compute seismic moment rate from Bird strain rate data set.
+    return numpy.column_stack((lon, lat, momentrate))
+
+def strainRateGridBird(strain_in, regime):
+    """Compute moment rate contribution of each node of the Bird strain 
+    rate data set. This does not depend on the zone geometry and can be 
+    shared by all zones of a layer.
 
     Input:
-        poly            Area zone geometry as Shapely polygon
         strain_in       Strain rate dataset as list of lists
                         [ [lat, lon,  exx, eyy, exy], ...]
-        regime          Dict of Shapely multipolygons for each deformation regime
-                        Currently only Continental (C) and Ridge-transform (R)
-                        implemented
-                        {'C': Multipolygon, 'R': Multipolygon}
+        regime          Dict of Shapely multipolygons for each deformation 
+                        regime
 
     Output:
-        momentrate      moment rate computed from strain rate summed 
-                        over area zone
+        grid            Array of [lon, lat, moment rate] rows, only for nodes
+                        in the continental or ridge-transform regime
     """
 
-    momentrate = 0.0
-
-    for (lat, lon, exx, eyy, exy) in strain_in:
-
-        # make Shapely point from lon, lat
-        point = shapely.geometry.Point((lon, lat))
+    strain_arr = numpy.array(strain_in, dtype=float).reshape(-1, 5)
+    regime_keys = strain.tectonicRegimeForPoints(strain_arr[:, 1], 
+        strain_arr[:, 0], regime)
 
-        # check if in area zone polygon
-        # TODO(fab): small area zones that do not include a strain rate
-        # grid node
-        if poly.intersects(point):
-            
-            # get deformation regime
-            regime_key = strain.tectonicRegimeForPoint(point, regime)
-                    
-            # select values for cz and mc
-            if regime_key not in (strain.DEFORMATION_REGIME_KEY_C, 
-                strain.DEFORMATION_REGIME_KEY_R):
-                    
-                # point not in available regimes, don't evaluate contribution
-                # from this point
-                continue
-           
-            else:
-                
-                (e1, e2, e3, e1h, e2h, err) = \
-                    strain.strainRateComponentsFromDataset((exx, eyy, exy))
-                
-                if regime_key == strain.DEFORMATION_REGIME_KEY_C:
-                    
-                    # continental regime
-                    if (
-                err <= strain.BIRD_CONTINENTAL_REGIME_COMPARISON_FACTOR * e2h \
-            and err >= strain.BIRD_CONTINENTAL_REGIME_COMPARISON_FACTOR * e1h):
-                            
-                        # strike-slip faulting dominates
-                        parameter_key = strain.DEFORMATION_REGIME_KEY_CTF
-                        
-                    elif \
-                err > strain.BIRD_CONTINENTAL_REGIME_COMPARISON_FACTOR * e2h:
-                        # thrust faulting dominates
-                        parameter_key = strain.DEFORMATION_REGIME_KEY_CCB
-                        
-                    else:
-                        # normal faulting dominates
-                        parameter_key = strain.DEFORMATION_REGIME_KEY_CRB
-                        
-                elif regime_key == strain.DEFORMATION_REGIME_KEY_R:
-                    
-                    # ridge-transform regime
-                    if e1h >= 0.0:
-                        parameter_key = strain.DEFORMATION_REGIME_KEY_OSR
-                    elif e2h < 0.0:
-                        parameter_key = strain.DEFORMATION_REGIME_KEY_OCB
-                    elif (e1h * e2h < 0.0 and (e1h + e2h) >= 0.0):
-                        parameter_key = strain.DEFORMATION_REGIME_KEY_OTF
-                    elif (e1h * e2h < 0.0 and (e1h + e2h) < 0.0):
-                        parameter_key = strain.DEFORMATION_REGIME_KEY_OCB
-                    else:
-                        # never get here
-                        raise RuntimeError, \
-                            "Unexpected case in ridge-transform regime"
-                        
-                # TODO(fab): criterion for not adding contribution
-                cz = strain.BIRD_SEISMICITY_PARAMETERS[parameter_key]['cz']
-                if e2 < 0:
-                    momentrate += (2 * cz * e3)
-                else:
-                    momentrate += (2 * cz * -e1)
+    # point not in available regimes, don't evaluate contribution
+    # from this point
+    in_regime = (regime_keys == strain.DEFORMATION_REGIME_KEY_C) | \
+        (regime_keys == strain.DEFORMATION_REGIME_KEY_R)
+    strain_arr = strain_arr[in_regime]
+    regime_keys = regime_keys[in_regime]
+    
+    (e1, e2, e3, e1h, e2h, err) = strain.strainRateComponentsFromDataset(
+        (strain_arr[:, 2], strain_arr[:, 3], strain_arr[:, 4]))
+
+    # continental regime
+    continental = (regime_keys == strain.DEFORMATION_REGIME_KEY_C)
+    factor = strain.BIRD_CONTINENTAL_REGIME_COMPARISON_FACTOR
+
+    # strike-slip faulting dominates, thrust faulting dominates,
+    # otherwise normal faulting dominates
+    continental_ctf = continental & (err <= factor * e2h) & \
+        (err >= factor * e1h)
+    continental_ccb = continental & ~continental_ctf & (err > factor * e2h)
+    continental_crb = continental & ~continental_ctf & ~continental_ccb
+
+    # ridge-transform regime
+    ridge = ~continental
+    ridge_osr = ridge & (e1h >= 0.0)
+    ridge_ocb = ridge & ~ridge_osr & ((e2h < 0.0) | \
+        ((e1h * e2h < 0.0) & ((e1h + e2h) < 0.0)))
+    ridge_otf = ridge & ~ridge_osr & ~ridge_ocb & (e1h * e2h < 0.0) & \
+        ((e1h + e2h) >= 0.0)
+
+    # TODO(fab): criterion for not adding contribution
+    # nodes that fall in none of the cases above keep cz = 0
+    cz = numpy.zeros(strain_arr.shape[0], dtype=float)
+    for (parameter_mask, parameter_key) in (
+        (continental_ctf, strain.DEFORMATION_REGIME_KEY_CTF),
+        (continental_ccb, strain.DEFORMATION_REGIME_KEY_CCB),
+        (continental_crb, strain.DEFORMATION_REGIME_KEY_CRB),
+        (ridge_osr, strain.DEFORMATION_REGIME_KEY_OSR),
+        (ridge_ocb, strain.DEFORMATION_REGIME_KEY_OCB),
+        (ridge_otf, strain.DEFORMATION_REGIME_KEY_OTF)):
+        cz[parameter_mask] = \
+            strain.BIRD_SEISMICITY_PARAMETERS[parameter_key]['cz']
+
+    momentrate = numpy.where(e2 < 0, 2 * cz * e3, 2 * cz * -e1)
 
     # convert original unit of [10^-9 yr^-1] to [s^-1]
-    return 1000 * SHEAR_MODULUS * 1.0e-9 * momentrate * (
-        60 * 60 * 24 * 365.25)
+    momentrate *= 1000 * SHEAR_MODULUS * 1.0e-9 * (60 * 60 * 24 * 365.25)
+
+    return numpy.column_stack((strain_arr[:, 1], strain_arr[:, 0], 
+        momentrate))
                     
 def momentrateFromSlipRate(slipratemi, slipratema, area):
     """Compute min/max seismic moment rate from min/max slip rate.
@@ -34,8 +34,6 @@ from PyQt4.QtGui import *
 
 from qgis.core import *
 
-import QPCatalog
-
 from mt_seismicsource import attributes
 from mt_seismicsource import features
 from mt_seismicsource import utils
@@ -80,7 +78,7 @@ def assignRecurrence(layer_fault, layer_fault_background=None,
         layer_fault_background   QGis layer with fault background zone features
         layer_background         QGis layer with background zone features
                                  (provides Mmax and Mc distribution)
-        catalog                  Earthquake catalog as QuakePy object
+        catalog                  Earthquake catalog as ColumnarCatalog object
         b_value                  b value to be used for computation
     """
 
@@ -137,6 +135,23 @@ def computeRecurrence(layer_fault, layer_fault_background=None,
     provider_fault = layer_fault.dataProvider()
     fts = layer_fault.selectedFeatures()
 
+    # buffer zones of all selected faults, in one batch (cached)
+    fault_geometries = [utils.getFeatureGeometry(layer_fault, x) for x in fts]
+    utils.computeBufferZones([x.polygon for x in fault_geometries \
+        if x is not None], momentrate.BUFFER_AROUND_FAULT_ZONE_KM)
+
+    # Mmax of background zones that overlap each fault zone, for all 
+    # selected faults at once
+    mmax_faults = numpy.ones(len(fts)) * numpy.nan
+    if layer_background is not None:
+        valid_indices = [fault_idx for fault_idx, x in \
+            enumerate(fault_geometries) if x is not None]
+        (mcdist_faults, mmax_valid) = \
+            areasource.getMcdistMmaxFromBackgroundZones(
+                [fault_geometries[x].polygon for x in valid_indices], 
+                layer_background.dataProvider())
+        mmax_faults[valid_indices] = mmax_valid
+
     # loop over fault polygons
     for zone_idx, feature in enumerate(fts):
 
@@ -148,7 +163,7 @@ def computeRecurrence(layer_fault, layer_fault_background=None,
         # - (a, b, act_a, act_b) for FBZ, below magnitude threshold
         # - (a, b, act_a, act_b) for FBZ, above magnitude threshold
         # - (a, b, Mc) from maximum likelihood G-R
-        # - Mmax from background
+        # - Mmax from background (area-weighted over overlapping zones)
         # - a from slip rate (min/max)
         # - activity rate (min/max)
         # - moment rate (min/max)
@@ -188,9 +203,11 @@ def computeRecurrence(layer_fault, layer_fault_background=None,
             feature[attribute_map_fault[slipratema_name][0]].toDouble()[0]
 
         # get area of fault zone
-        polylist, vertices = utils.polygonsQGS2Shapely((feature,))
-        fault_poly = polylist[0]
-        fault_area = utils.polygonAreaFromWGS84(fault_poly)
+        fault_area = utils.getFeatureGeometry(layer_fault, 
+            feature).area() * 1.0e6
+
+        # Mmax of background zones that overlap the fault zone
+        mmax_fault = mmax_faults[zone_idx]
         
         # determine b value that is used in further computations
         # - use b value computed on fault background zone
@@ -261,7 +278,8 @@ def computeRecurrence(layer_fault, layer_fault_background=None,
             activity_back['fbz_below']['activity']))
         attribute_list.extend(checkAndCastActivityResult(
             activity_back['fbz_above']['activity']))
-        attribute_list.extend([numpy.nan] * 4) # ML, Mmax
+        attribute_list.extend([numpy.nan] * 3) # ML
+        attribute_list.append(float(mmax_fault))
         attribute_list.extend([float(a_value_min), float(a_value_max)])
         attribute_list.extend([numpy.nan] * 3) # three momentrate components
         attribute_list.extend([
@@ -372,13 +390,9 @@ def computeActivityFromBackground(feature, layer_fault_background,
     (bz_poly, bz_area) = utils.computeBufferZone(fault_poly,
         momentrate.BUFFER_AROUND_FAULT_ZONE_KM)
 
-    # find fault background zone in which centroid of fault zone lies
-    # NOTE: this can yield a wrong background zone if the fault zone
-    # is curved and at the edge of background zone.
-    # TODO(fab): use GIS "within" function instead, but note that fault
-    # zone can overlap several BG zones
-    (fbz, fbz_poly, fbz_area) = utils.findBackgroundZone(fault_poly.centroid, 
-        provider_fault_back, ui_mode=ui_mode)
+    # find fault background zone with largest overlap with fault zone
+    (fbz, fbz_poly, fbz_area) = utils.findOverlappingZone(fault_poly, 
+        provider_fault_back)
         
     if fbz is None:
         error_msg = "Recurrence: could not determine FBZ for zone %s" % (
@@ -387,7 +401,7 @@ def computeActivityFromBackground(feature, layer_fault_background,
             QMessageBox.warning(None, "Recurrence Warning", error_msg)
         else:
             print error_msg
-        fbz_id = None
+        return None
     else:
         attribute_map_fbz = utils.getAttributeIndex(provider_fault_back, 
             (features.FAULT_BACKGROUND_ATTR_ID,), create=False)
@@ -396,12 +410,11 @@ def computeActivityFromBackground(feature, layer_fault_background,
         id_name = features.FAULT_BACKGROUND_ATTR_ID['name']
         fbz_id = int(fbz[attribute_map_fbz[id_name][0]].toDouble()[0])
 
-    # get mmax and mcdist for FBZ from background zone
-    (mcdist_qv, mmax_qv) = areasource.getAttributesFromBackgroundZones(
-        fbz_poly.centroid, provider_back, areasource.MCDIST_MMAX_ATTRIBUTES, 
-        ui_mode=ui_mode)
+    # get mmax (area-weighted) and mcdist for FBZ from background zones
+    (mcdist_bg, mmax_bg) = areasource.getMcdistMmaxFromBackgroundZones(
+        (fbz_poly,), provider_back)
     
-    if mcdist_qv is None or mmax_qv is None:
+    if mcdist_bg[0] is None or numpy.isnan(mmax_bg[0]):
         error_msg = "Recurrence: could not determine mcdist or mmax for "\
             "zone %s" % (feature.id())
         if ui_mode is True:
@@ -410,32 +423,29 @@ def computeActivityFromBackground(feature, layer_fault_background,
             print error_msg
         return None
     else:
-        mmax = float(mmax_qv.toDouble()[0])
-        mcdist = str(mcdist_qv.toString())
+        mmax = float(mmax_bg[0])
+        mcdist = mcdist_bg[0]
 
     ## moment rate from activity (RM)
 
     # a and b value from FBZ
     
+    # get quakes in FBZ and buffer zone from event-to-zone tables, 
     # cut catalog with depth constraint
-    cat_cut = QPCatalog.QPCatalog()
-    cat_cut.merge(catalog)
-    cat_cut.cut(mindepth=mindepth, maxdepth=maxdepth)
+    catalog.zoneMembership(layer_fault_background)
+    fbz_cat = catalog.cutZone(fbz_poly).cutDepth(mindepth, maxdepth)
+    bz_cat = catalog.cutZone(bz_poly).cutDepth(mindepth, maxdepth)
     
     activity_fbz = atticivy.computeActivityAtticIvy((fbz_poly,), (mmax,), 
-        (mcdist,), cat_cut, mmin=mmin, ui_mode=ui_mode)
+        (mcdist,), fbz_cat, mmin=mmin, ui_mode=ui_mode)
     activity['fbz'] = {'ID': fbz_id, 'area': fbz_area, 
         'activity': activity_fbz[0]}
         
     # get separate catalogs below and above magnitude threshold
 
-    cat_below_threshold = QPCatalog.QPCatalog()
-    cat_below_threshold.merge(cat_cut)
-    cat_below_threshold.cut(maxmag=m_threshold, maxmag_excl=True)
-        
-    cat_above_threshold = QPCatalog.QPCatalog()
-    cat_above_threshold.merge(cat_cut)
-    cat_above_threshold.cut(minmag=m_threshold, maxmag_excl=False)
+    cat_below_threshold = fbz_cat.cutMagnitude(maxmag=m_threshold, 
+        maxmag_exclude=True)
+    cat_above_threshold = fbz_cat.cutMagnitude(minmag=m_threshold)
 
     activity_below_threshold = atticivy.computeActivityAtticIvy(
         (fbz_poly,), (mmax,), (mcdist,), cat_below_threshold, mmin=mmin,
@@ -451,7 +461,7 @@ def computeActivityFromBackground(feature, layer_fault_background,
         
     # a and b value on buffer zone
     activity_bz = atticivy.computeActivityAtticIvy((bz_poly,), (mmax,), 
-        (mcdist,), cat_cut, mmin, ui_mode=ui_mode)
+        (mcdist,), bz_cat, mmin, ui_mode=ui_mode)
     activity['bz'] = {'area': bz_area, 'activity': activity_bz[0]}
             
     activity['background'] = {'mmax': mmax, 'mcdist': mcdist}
@@ -0,0 +1,476 @@
+# -*- coding: utf-8 -*-
+"""
+SHARE Seismic Source Toolkit
+
+Detection of slivers between polygons of a zone layer, from close
+vertices and edges of neighbouring zones, and from gaps and overlaps.
+
+Author: Fabian Euchner, fabian@sed.ethz.ch
+"""
+
+############################################################################
+#    This program is free software; you can redistribute it and/or modify  #
+#    it under the terms of the GNU General Public License as published by  #
+#    the Free Software Foundation; either version 2 of the License, or     #
+#    (at your option) any later version.                                   #
+#                                                                          #
+#    This program is distributed in the hope that it will be useful,       #
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of        #
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         #
+#    GNU General Public License for more details.                          #
+#                                                                          #
+#    You should have received a copy of the GNU General Public License     #
+#    along with this program; if not, write to the                         #
+#    Free Software Foundation, Inc.,                                       #
+#    59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.             #
+############################################################################
+
+import numpy
+import shapely.geometry
+import shapely.ops
+import shapely.prepared
+import shapely.strtree
+
+from mt_seismicsource import utils
+from mt_seismicsource.algorithms import spatial
+
+# columns of neighbor array
+NEIGHBOR_DISTANCE_IDX = 0
+NEIGHBOR_REF_POINT_IDX = 1
+NEIGHBOR_REF_ZONE_IDX = 2
+NEIGHBOR_REF_LON_IDX = 3
+NEIGHBOR_REF_LAT_IDX = 4
+NEIGHBOR_TEST_POINT_IDX = 5
+NEIGHBOR_TEST_ZONE_IDX = 6
+NEIGHBOR_TEST_LON_IDX = 7
+NEIGHBOR_TEST_LAT_IDX = 8
+
+NEIGHBOR_COLUMN_COUNT = 9
+
+def zoneVertices(polygons, zone_ids):
+    """Return vertices of the outer rings of Shapely polygons as arrays.
+
+    Input:
+        polygons    list of Shapely polygons
+        zone_ids    list of zone IDs, one per polygon
+
+    Output:
+        (lon, lat, vertex_zone)
+        vertex_zone     zone ID of each vertex
+    """
+
+    rings = [numpy.array(x.exterior.coords)[0:-1, 0:2] for x in polygons]
+    vertex_cnt = [x.shape[0] for x in rings]
+
+    if sum(vertex_cnt) == 0:
+        return (numpy.array([]), numpy.array([]), numpy.array([], dtype=int))
+
+    vertices = numpy.vstack(rings)
+    vertex_zone = numpy.repeat(numpy.asarray(zone_ids, dtype=int),
+        vertex_cnt)
+
+    return (vertices[:, 0], vertices[:, 1], vertex_zone)
+
+def vertexNeighbors(lon, lat, vertex_zone, max_distance, reference=None):
+    """Find pairs of vertices of different zones that are closer than
+    max_distance (in degrees), but not identical.
+
+    Vertices are binned into grid cells of size max_distance. Candidate
+    pairs are the vertices in the same and the eight adjacent cells, which
+    are looked up for all reference vertices at once by binary search in
+    the sorted cell numbers.
+
+    Input:
+        lon, lat        arrays of vertex coordinates
+        vertex_zone     array of zone ID of each vertex
+        max_distance    maximum distance of vertex pairs
+        reference       boolean array, True for reference vertices (first
+                        point of pair). If None, all vertices are used,
+                        and each pair is reported once, with the vertex 
+                        of lower index as first point.
+
+    Output:
+        (pairs x 9) array, sorted by distance, with columns:
+         0: distance
+         1: first point id
+         2: polygon id
+         3: first point lon
+         4: first point lat
+         5: second point id
+         6: polygon id
+         7: second point lon
+         8: second point lat
+    """
+
+    lon = numpy.asarray(lon, dtype=float)
+    lat = numpy.asarray(lat, dtype=float)
+    vertex_zone = numpy.asarray(vertex_zone)
+
+    if reference is None:
+        ref_idx = numpy.arange(lon.shape[0])
+    else:
+        ref_idx = numpy.where(reference)[0]
+
+    if ref_idx.size == 0 or max_distance <= 0.0:
+        return numpy.zeros((0, NEIGHBOR_COLUMN_COUNT))
+
+    (first, second) = _candidatePairs(lon, lat, ref_idx, max_distance)
+
+    # different zones
+    keep = (vertex_zone[first] != vertex_zone[second])
+
+    # without reference subset, both orders of a pair are candidates
+    if reference is None:
+        keep &= (first < second)
+
+    (first, second) = (first[keep], second[keep])
+
+    distance = numpy.hypot(lon[second] - lon[first],
+        lat[second] - lat[first])
+
+    keep = (distance > 0.0) & (distance <= max_distance)
+    (first, second, distance) = (first[keep], second[keep], distance[keep])
+
+    neighbors = numpy.column_stack((distance, first, vertex_zone[first],
+        lon[first], lat[first], second, vertex_zone[second], lon[second],
+        lat[second])).astype(float).reshape((-1, NEIGHBOR_COLUMN_COUNT))
+
+    return neighbors[numpy.argsort(distance, kind='mergesort')]
+
+def _candidatePairs(lon, lat, ref_idx, cell_size):
+    """Return index arrays (first, second) of vertex pairs in the same or
+    adjacent grid cells, with first vertex in ref_idx."""
+
+    cols = numpy.floor((lon - lon.min()) / cell_size).astype(numpy.int64)
+    rows = numpy.floor((lat - lat.min()) / cell_size).astype(numpy.int64)
+
+    # one empty column at each side, so that adjacent cells do not wrap
+    # around into the next row
+    col_cnt = cols.max() + 3
+    cells = (rows + 1) * col_cnt + cols + 1
+
+    order = numpy.argsort(cells, kind='mergesort')
+    cells_sorted = cells[order]
+
+    first = []
+    second = []
+    for row_offset in (-1, 0, 1):
+        for col_offset in (-1, 0, 1):
+            target = cells[ref_idx] + row_offset * col_cnt + col_offset
+            start = numpy.searchsorted(cells_sorted, target, side='left')
+            end = numpy.searchsorted(cells_sorted, target, side='right')
+
+            cnt = end - start
+            total = cnt.sum()
+            if total == 0:
+                continue
+
+            # positions start[i], ..., end[i]-1 in sorted order, for all i
+            pos = numpy.repeat(start - numpy.cumsum(cnt) + cnt, cnt) + \
+                numpy.arange(total)
+
+            first.append(numpy.repeat(ref_idx, cnt))
+            second.append(order[pos])
+
+    if len(first) == 0:
+        return (numpy.array([], dtype=int), numpy.array([], dtype=int))
+    else:
+        return (numpy.concatenate(first), numpy.concatenate(second))
+
+class GeometryIndex(object):
+    """STR tree of Shapely geometries that returns list indices of
+    geometries instead of geometry objects."""
+
+    def __init__(self, geometries):
+        self.geometries = list(geometries)
+        self.tree = shapely.strtree.STRtree(self.geometries)
+        self.tree_indices = dict([(id(geometry), geometry_idx) for \
+            geometry_idx, geometry in enumerate(self.geometries)])
+
+    def query(self, geometry):
+        """Return sorted indices of geometries whose bounding box 
+        intersects the bounding box of Shapely geometry."""
+        return numpy.array(sorted([self.tree_indices[id(x)] for x in \
+            self.tree.query(geometry)]), dtype=int)
+
+def neighboringZones(polygons, zone_buffer, reference_indices):
+    """Find zones that intersect the buffer zone (buffer distance in 
+    degrees) around reference zones.
+
+    Candidates are the zones whose bounding box overlaps the bounding box
+    of the buffer zone (STR tree query), only candidates are tested for 
+    intersection with the (prepared) buffer zone.
+
+    Output:
+        list of (buffer zone, array of indices of neighboring zones), one 
+        element per reference zone
+    """
+
+    zone_index = GeometryIndex(polygons)
+
+    neighbors = []
+    for ref_idx in reference_indices:
+        buffered_zone = polygons[ref_idx].buffer(zone_buffer)
+
+        candidates = zone_index.query(buffered_zone)
+        candidates = candidates[candidates != ref_idx]
+
+        prepared = shapely.prepared.prep(buffered_zone)
+        neighbors.append((buffered_zone, numpy.array([x for x in candidates \
+            if prepared.intersects(polygons[x])], dtype=int)))
+
+    return neighbors
+
+def bufferNeighbors(polygons, zone_ids, max_distance, zone_buffer, 
+    reference_indices=None):
+    """Find pairs of vertices of different zones that are closer than
+    max_distance (in degrees), but not identical. For each reference zone,
+    distances are computed between its vertices and the vertices of 
+    neighboring zones (see neighboringZones()) that lie inside its buffer 
+    zone.
+
+    Input:
+        polygons            list of Shapely polygons
+        zone_ids            list of zone IDs, one per polygon
+        max_distance        maximum distance of vertex pairs
+        zone_buffer         buffer distance around reference zones
+        reference_indices   indices of reference zones in polygons. If 
+                            None, all zones are used.
+
+    Output:
+        (pairs x 9) array, sorted by distance, with columns as in 
+        vertexNeighbors()
+    """
+
+    if reference_indices is None:
+        reference_indices = range(len(polygons))
+
+    (lon, lat, vertex_zone) = zoneVertices(polygons, 
+        numpy.arange(len(polygons)))
+    vertex_offsets = numpy.searchsorted(vertex_zone, 
+        numpy.arange(len(polygons) + 1))
+    zone_ids = numpy.asarray(zone_ids, dtype=int)
+
+    pairs = []
+    for ref_idx, (buffered_zone, test_zones) in zip(reference_indices, 
+        neighboringZones(polygons, zone_buffer, reference_indices)):
+
+        if test_zones.size == 0:
+            continue
+
+        first = numpy.arange(vertex_offsets[ref_idx], 
+            vertex_offsets[ref_idx+1])
+
+        # vertices of neighboring zones inside buffer zone
+        second = numpy.concatenate([numpy.arange(vertex_offsets[x], 
+            vertex_offsets[x+1]) for x in test_zones])
+        second = second[spatial.pointsInPolygon(lon[second], lat[second], 
+            buffered_zone)]
+
+        if first.size == 0 or second.size == 0:
+            continue
+
+        distance = numpy.hypot(
+            lon[second][numpy.newaxis, :] - lon[first][:, numpy.newaxis],
+            lat[second][numpy.newaxis, :] - lat[first][:, numpy.newaxis])
+
+        (first_idx, second_idx) = numpy.where((distance > 0.0) & \
+            (distance <= max_distance))
+        pairs.append((distance[first_idx, second_idx], first[first_idx], 
+            second[second_idx]))
+
+    if len(pairs) == 0:
+        return numpy.zeros((0, NEIGHBOR_COLUMN_COUNT))
+
+    distance = numpy.concatenate([x[0] for x in pairs])
+    first = numpy.concatenate([x[1] for x in pairs])
+    second = numpy.concatenate([x[2] for x in pairs])
+
+    neighbors = numpy.column_stack((distance, first, 
+        zone_ids[vertex_zone[first]], lon[first], lat[first], second, 
+        zone_ids[vertex_zone[second]], lon[second], lat[second])).astype(
+            float).reshape((-1, NEIGHBOR_COLUMN_COUNT))
+
+    return neighbors[numpy.argsort(distance, kind='mergesort')]
+
+def zoneEdges(polygons, zone_ids):
+    """Return edges of the outer rings of Shapely polygons as arrays.
+
+    Output:
+        (x1, y1, x2, y2, edge_zone)
+        edge_zone       zone ID of each edge
+    """
+
+    rings = [numpy.array(x.exterior.coords)[:, 0:2] for x in polygons]
+    edge_cnt = [max(x.shape[0] - 1, 0) for x in rings]
+
+    if sum(edge_cnt) == 0:
+        empty = numpy.array([])
+        return (empty, empty, empty, empty, numpy.array([], dtype=int))
+
+    start = numpy.vstack([x[0:-1] for x in rings if x.shape[0] > 1])
+    end = numpy.vstack([x[1:] for x in rings if x.shape[0] > 1])
+    edge_zone = numpy.repeat(numpy.asarray(zone_ids, dtype=int), edge_cnt)
+
+    return (start[:, 0], start[:, 1], end[:, 0], end[:, 1], edge_zone)
+
+def segmentNeighbors(polygons, zone_ids, max_distance, 
+    reference_indices=None):
+    """Find vertices that are closer than max_distance (in degrees) to an 
+    edge of another zone, but do not lie on it. For each vertex and zone,
+    only the closest edge is reported.
+
+    All edges are indexed in an STR tree. Candidate edges of a vertex are 
+    the edges whose bounding box intersects the box of half-width 
+    max_distance around the vertex. Vertex-to-segment distances are 
+    computed for all candidate pairs in one vectorized step.
+
+    Input:
+        polygons            list of Shapely polygons
+        zone_ids            list of zone IDs, one per polygon
+        max_distance        maximum vertex-to-edge distance
+        reference_indices   indices of reference zones in polygons, whose
+                            vertices are tested. If None, all zones are 
+                            used.
+
+    Output:
+        (pairs x 9) array, sorted by distance, with columns:
+         0: distance
+         1: point id
+         2: polygon id of point
+         3: point lon
+         4: point lat
+         5: edge id
+         6: polygon id of edge
+         7: lon of closest point on edge
+         8: lat of closest point on edge
+    """
+
+    (lon, lat, vertex_zone) = zoneVertices(polygons, zone_ids)
+    (x1, y1, x2, y2, edge_zone) = zoneEdges(polygons, zone_ids)
+
+    if reference_indices is None:
+        ref_idx = numpy.arange(lon.shape[0])
+    else:
+        ref_zones = numpy.asarray(zone_ids, dtype=int)[
+            numpy.asarray(reference_indices, dtype=int)]
+        ref_idx = numpy.where(numpy.in1d(vertex_zone, ref_zones))[0]
+
+    if ref_idx.size == 0 or x1.size == 0 or max_distance <= 0.0:
+        return numpy.zeros((0, NEIGHBOR_COLUMN_COUNT))
+
+    edge_index = GeometryIndex([shapely.geometry.LineString(
+        ((x1[idx], y1[idx]), (x2[idx], y2[idx]))) for idx in xrange(
+            x1.shape[0])])
+
+    # candidate pairs: edges near reference vertex
+    candidates = [edge_index.query(shapely.geometry.box(
+        lon[idx] - max_distance, lat[idx] - max_distance, 
+        lon[idx] + max_distance, lat[idx] + max_distance)) \
+            for idx in ref_idx]
+
+    vertex = numpy.repeat(ref_idx, [x.size for x in candidates])
+    edge = numpy.concatenate(candidates).astype(int)
+
+    keep = (vertex_zone[vertex] != edge_zone[edge])
+    (vertex, edge) = (vertex[keep], edge[keep])
+
+    # closest point on edge
+    dx = x2[edge] - x1[edge]
+    dy = y2[edge] - y1[edge]
+    length_sq = dx * dx + dy * dy
+    with numpy.errstate(invalid='ignore', divide='ignore'):
+        t = numpy.where(length_sq > 0.0, ((lon[vertex] - x1[edge]) * dx + \
+            (lat[vertex] - y1[edge]) * dy) / length_sq, 0.0)
+    t = numpy.clip(t, 0.0, 1.0)
+    closest_lon = x1[edge] + t * dx
+    closest_lat = y1[edge] + t * dy
+
+    distance = numpy.hypot(lon[vertex] - closest_lon, 
+        lat[vertex] - closest_lat)
+
+    keep = (distance > 0.0) & (distance <= max_distance)
+    (vertex, edge, distance, closest_lon, closest_lat) = (vertex[keep], 
+        edge[keep], distance[keep], closest_lon[keep], closest_lat[keep])
+
+    # closest edge for each vertex and zone
+    order = numpy.lexsort((distance, edge_zone[edge], vertex))
+    first = numpy.ones(order.shape, dtype=bool)
+    first[1:] = (vertex[order][1:] != vertex[order][0:-1]) | \
+        (edge_zone[edge][order][1:] != edge_zone[edge][order][0:-1])
+    order = order[first]
+
+    neighbors = numpy.column_stack((distance[order], vertex[order], 
+        vertex_zone[vertex[order]], lon[vertex[order]], lat[vertex[order]],
+        edge[order], edge_zone[edge[order]], closest_lon[order], 
+        closest_lat[order])).astype(float).reshape(
+            (-1, NEIGHBOR_COLUMN_COUNT))
+
+    return neighbors[numpy.argsort(neighbors[:, NEIGHBOR_DISTANCE_IDX], 
+        kind='mergesort')]
+
+def sliverPolygons(polygons, zone_ids, max_width):
+    """Find sliver polygons: overlaps between zones, and gaps between
+    zones (holes in the union of all zones), whose mean width 
+    (2 * area / perimeter, in degrees) is at most max_width.
+
+    Overlaps are computed only for pairs of zones with overlapping 
+    bounding boxes (STR tree query).
+
+    Output:
+        list of dicts with keys
+        type        'overlap' or 'gap'
+        polygon     sliver as Shapely polygon
+        zones       list of IDs of zones that overlap, or that border 
+                    the gap
+        area        area in square kilometres
+        width       mean width in degrees
+    """
+
+    zone_ids = list(zone_ids)
+    zone_index = GeometryIndex(polygons)
+
+    slivers = []
+
+    # overlaps of zone pairs
+    for zone_idx, zone in enumerate(polygons):
+        candidates = zone_index.query(zone)
+        candidates = candidates[candidates > zone_idx]
+
+        prepared = shapely.prepared.prep(zone)
+        for test_idx in candidates:
+            if not prepared.intersects(polygons[test_idx]):
+                continue
+
+            overlap = zone.intersection(polygons[test_idx])
+            for part in _polygonParts(overlap):
+                slivers.append({'type': 'overlap', 'polygon': part, 
+                    'zones': [zone_ids[zone_idx], zone_ids[test_idx]]})
+
+    # gaps: holes in union of zones
+    if len(polygons) > 0:
+        union = shapely.ops.cascaded_union(polygons)
+        for part in _polygonParts(union):
+            for interior in part.interiors:
+                gap = shapely.geometry.Polygon(interior)
+                border = gap.buffer(max_width)
+                candidates = zone_index.query(border)
+                slivers.append({'type': 'gap', 'polygon': gap, 
+                    'zones': [zone_ids[x] for x in candidates if \
+                        border.intersects(polygons[x])]})
+
+    for curr_sliver in slivers:
+        curr_sliver['width'] = 2.0 * curr_sliver['polygon'].area / \
+            curr_sliver['polygon'].length
+    slivers = [x for x in slivers if x['width'] <= max_width]
+
+    areas = utils.polygonAreasFromWGS84([x['polygon'] for x in slivers])
+    for curr_sliver, area in zip(slivers, areas):
+        curr_sliver['area'] = area * 1.0e-6
+
+    return slivers
+
+def _polygonParts(geometry):
+    """Return list of polygons with non-zero area in Shapely geometry."""
+    parts = getattr(geometry, 'geoms', (geometry,))
+    return [x for x in parts if x.geom_type == 'Polygon' and x.area > 0.0]
@@ -0,0 +1,362 @@
+# -*- coding: utf-8 -*-
+"""
+SHARE Seismic Source Toolkit
+
+Vectorized geometry functions for point sets.
+
+Author: Fabian Euchner, fabian@sed.ethz.ch
+"""
+
+############################################################################
+#    This program is free software; you can redistribute it and/or modify  #
+#    it under the terms of the GNU General Public License as published by  #
+#    the Free Software Foundation; either version 2 of the License, or     #
+#    (at your option) any later version.                                   #
+#                                                                          #
+#    This program is distributed in the hope that it will be useful,       #
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of        #
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         #
+#    GNU General Public License for more details.                          #
+#                                                                          #
+#    You should have received a copy of the GNU General Public License     #
+#    along with this program; if not, write to the                         #
+#    Free Software Foundation, Inc.,                                       #
+#    59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.             #
+############################################################################
+
+import copy
+import numpy
+
+# cell size (in degrees) of grid index over point sets
+GRID_INDEX_CELL_SIZE = 0.25
+
+# distance (in degrees) below which a point counts as lying on a polygon
+# boundary, in boundary-inclusive point in polygon tests
+BOUNDARY_TOLERANCE = 1.0e-9
+
+# WGS84 ellipsoid: semi-major axis (m), flattening
+WGS84_SEMI_MAJOR_AXIS = 6378137.0
+WGS84_FLATTENING = 1.0 / 298.257223563
+
+class GridIndex(object):
+    """Regular lon/lat grid index over a point set. Point indices are 
+    stored sorted by grid cell, with the start offset of each cell, so that
+    the points of a range of cells in one grid row are a contiguous slice.
+    Points with NaN coordinates are not indexed.
+    """
+
+    def __init__(self, lon, lat, cell_size=GRID_INDEX_CELL_SIZE):
+
+        lon = numpy.asarray(lon, dtype=float)
+        lat = numpy.asarray(lat, dtype=float)
+
+        self.cell_size = cell_size
+        self.point_cnt = lon.shape[0]
+
+        valid = numpy.where(~(numpy.isnan(lon) | numpy.isnan(lat)))[0]
+
+        if valid.size == 0:
+            (self.lon_min, self.lat_min) = (0.0, 0.0)
+            (self.col_cnt, self.row_cnt) = (1, 1)
+        else:
+            self.lon_min = lon[valid].min()
+            self.lat_min = lat[valid].min()
+            self.col_cnt = int((lon[valid].max() - self.lon_min) / \
+                cell_size) + 1
+            self.row_cnt = int((lat[valid].max() - self.lat_min) / \
+                cell_size) + 1
+
+        cells = self._cells(lon[valid], lat[valid])
+        sort_idx = numpy.argsort(cells, kind='mergesort')
+
+        self.order = valid[sort_idx]
+        self.cells = cells[sort_idx]
+        self.offsets = self._offsets(self.cells)
+
+    def _cells(self, lon, lat):
+        cols = ((lon - self.lon_min) / self.cell_size).astype(int)
+        rows = ((lat - self.lat_min) / self.cell_size).astype(int)
+        return rows * self.col_cnt + cols
+
+    def _offsets(self, cells):
+        counts = numpy.bincount(cells, 
+            minlength=self.col_cnt * self.row_cnt)
+        return numpy.concatenate(([0], numpy.cumsum(counts)))
+
+    def query(self, bounds):
+        """Return indices of points in grid cells that overlap bounding box
+        (lon_min, lat_min, lon_max, lat_max). Result is a superset of the
+        points inside the bounding box."""
+
+        (lon_min, lat_min, lon_max, lat_max) = bounds
+
+        col_min = max(int(numpy.floor(
+            (lon_min - self.lon_min) / self.cell_size)), 0)
+        col_max = min(int(numpy.floor(
+            (lon_max - self.lon_min) / self.cell_size)), self.col_cnt - 1)
+        row_min = max(int(numpy.floor(
+            (lat_min - self.lat_min) / self.cell_size)), 0)
+        row_max = min(int(numpy.floor(
+            (lat_max - self.lat_min) / self.cell_size)), self.row_cnt - 1)
+
+        if col_min > col_max or row_min > row_max:
+            return numpy.array([], dtype=int)
+
+        slices = []
+        for row in xrange(row_min, row_max + 1):
+            start = self.offsets[row * self.col_cnt + col_min]
+            end = self.offsets[row * self.col_cnt + col_max + 1]
+            if end > start:
+                slices.append(self.order[start:end])
+
+        if len(slices) == 0:
+            return numpy.array([], dtype=int)
+        else:
+            return numpy.concatenate(slices)
+
+    def select(self, mask):
+        """Return index for subset of points given by boolean mask, without
+        re-sorting. Point indices are renumbered as in the subset."""
+
+        subset = copy.copy(self)
+
+        new_idx = numpy.cumsum(mask) - 1
+        keep = mask[self.order]
+
+        subset.point_cnt = int(mask.sum())
+        subset.order = new_idx[self.order[keep]]
+        subset.cells = self.cells[keep]
+        subset.offsets = self._offsets(subset.cells)
+
+        return subset
+
+def pointsInPolygon(lon, lat, polygon, index=None, boundary=False):
+    """Test which points lie inside a Shapely polygon or multipolygon.
+
+    Input:
+        lon         array of point longitudes
+        lat         array of point latitudes
+        polygon     Shapely polygon or multipolygon
+        index       optional GridIndex over points, used to find candidate
+                    points in bounding box of polygon
+        boundary    if True, points on the polygon boundary (within
+                    BOUNDARY_TOLERANCE) count as inside, as with Shapely
+                    intersects()
+
+    Output:
+        boolean array, True for points inside polygon
+    """
+
+    lon = numpy.asarray(lon, dtype=float)
+    lat = numpy.asarray(lat, dtype=float)
+
+    inside = numpy.zeros(lon.shape, dtype=bool)
+
+    if polygon is None or polygon.is_empty:
+        return inside
+
+    # multipolygons: union of all parts
+    if hasattr(polygon, 'geoms'):
+        for part in polygon.geoms:
+            inside |= pointsInPolygon(lon, lat, part, index, boundary)
+        return inside
+
+    # only test points in bounding box of polygon
+    (lon_min, lat_min, lon_max, lat_max) = polygon.bounds
+    if boundary is True:
+        lon_min -= BOUNDARY_TOLERANCE
+        lat_min -= BOUNDARY_TOLERANCE
+        lon_max += BOUNDARY_TOLERANCE
+        lat_max += BOUNDARY_TOLERANCE
+
+    if index is None:
+        candidates = numpy.where((lon >= lon_min) & (lon <= lon_max) & \
+            (lat >= lat_min) & (lat <= lat_max))[0]
+    else:
+        candidates = index.query((lon_min, lat_min, lon_max, lat_max))
+        candidates = candidates[(lon[candidates] >= lon_min) & \
+            (lon[candidates] <= lon_max) & (lat[candidates] >= lat_min) & \
+            (lat[candidates] <= lat_max)]
+
+    if candidates.size == 0:
+        return inside
+
+    cand_lon = lon[candidates]
+    cand_lat = lat[candidates]
+
+    cand_inside = _pointsInRing(cand_lon, cand_lat, polygon.exterior)
+    for interior in polygon.interiors:
+        cand_inside &= ~_pointsInRing(cand_lon, cand_lat, interior)
+
+    if boundary is True:
+        cand_inside |= _pointsOnRing(cand_lon, cand_lat, polygon.exterior)
+        for interior in polygon.interiors:
+            cand_inside |= _pointsOnRing(cand_lon, cand_lat, interior)
+
+    inside[candidates] = cand_inside
+    return inside
+
+def ringAreasWGS84(coord, ring_offsets):
+    """Compute ellipsoidal areas of closed lon/lat rings on the WGS84 
+    ellipsoid, for all rings at once.
+
+    The area enclosed by a ring is the line integral of F(lat) d(lon) along
+    the ring, where F(lat) is the area per radian of longitude between the 
+    equator and latitude lat. Ring edges are straight lines in lon/lat.
+    The integral along each edge is evaluated with Simpson's rule.
+
+    Input:
+        coord           (vertices x 2) array of (lon, lat) in degrees, 
+                        rings are closed (first vertex repeated at end)
+        ring_offsets    array of start offsets of rings in coord, with 
+                        number of vertices as last element
+
+    Output:
+        array of ring areas in square metres (positive for clockwise rings)
+    """
+
+    coord = numpy.asarray(coord, dtype=float).reshape((-1, 2))
+    ring_offsets = numpy.asarray(ring_offsets, dtype=int)
+    ring_cnt = ring_offsets.shape[0] - 1
+
+    if coord.shape[0] < 2 or ring_cnt < 1:
+        return numpy.zeros(max(ring_cnt, 0))
+
+    lon = numpy.radians(coord[:, 0])
+    lat = numpy.radians(coord[:, 1])
+
+    # edges: vertex pairs within rings
+    ring_idx = numpy.repeat(numpy.arange(ring_cnt), numpy.diff(ring_offsets))
+    edge_start = numpy.where(ring_idx[0:-1] == ring_idx[1:])[0]
+
+    # longitude difference, wrapped to (-pi, pi]
+    dlon = lon[edge_start+1] - lon[edge_start]
+    dlon = dlon - 2.0 * numpy.pi * numpy.round(dlon / (2.0 * numpy.pi))
+
+    lat_mid = 0.5 * (lat[edge_start] + lat[edge_start+1])
+    edge_integral = dlon * (_authalicAreaIntegral(lat[edge_start]) + \
+        4.0 * _authalicAreaIntegral(lat_mid) + \
+        _authalicAreaIntegral(lat[edge_start+1])) / 6.0
+
+    return numpy.bincount(ring_idx[edge_start], weights=edge_integral, 
+        minlength=ring_cnt)
+
+def gaussianRadius(lat):
+    """Gaussian mean radius of curvature of WGS84 ellipsoid at latitude 
+    lat (degrees), in metres."""
+
+    e_sq = WGS84_FLATTENING * (2.0 - WGS84_FLATTENING)
+    sin_lat = numpy.sin(numpy.radians(lat))
+
+    return WGS84_SEMI_MAJOR_AXIS * numpy.sqrt(1.0 - e_sq) / (
+        1.0 - e_sq * sin_lat * sin_lat)
+
+def projectAzimuthalEquidistant(lon, lat, lon0, lat0):
+    """Project lon/lat (degrees) to local azimuthal equidistant x/y 
+    (metres) centred at (lon0, lat0), on a sphere with the Gaussian radius 
+    at the centre. Distances from the centre are true, distortion in a 
+    region of a few hundred kilometres is negligible. Centres can be given
+    per point (arrays of same shape as lon, lat)."""
+
+    radius = gaussianRadius(lat0)
+
+    lat = numpy.radians(lat)
+    lat0 = numpy.radians(lat0)
+    dlon = numpy.radians(numpy.asarray(lon, dtype=float) - lon0)
+
+    cos_c = numpy.clip(numpy.sin(lat0) * numpy.sin(lat) + numpy.cos(lat0) * \
+        numpy.cos(lat) * numpy.cos(dlon), -1.0, 1.0)
+    c = numpy.arccos(cos_c)
+
+    # scale factor c/sin(c), 1 at centre
+    with numpy.errstate(invalid='ignore', divide='ignore'):
+        k = numpy.where(c > 1.0e-12, c / numpy.sin(c), 1.0)
+
+    x = radius * k * numpy.cos(lat) * numpy.sin(dlon)
+    y = radius * k * (numpy.cos(lat0) * numpy.sin(lat) - \
+        numpy.sin(lat0) * numpy.cos(lat) * numpy.cos(dlon))
+
+    return (x, y)
+
+def unprojectAzimuthalEquidistant(x, y, lon0, lat0):
+    """Inverse of projectAzimuthalEquidistant(). Returns (lon, lat) in 
+    degrees."""
+
+    radius = gaussianRadius(lat0)
+
+    x = numpy.asarray(x, dtype=float)
+    y = numpy.asarray(y, dtype=float)
+    lat0_rad = numpy.radians(lat0)
+
+    rho = numpy.hypot(x, y)
+    c = rho / radius
+
+    with numpy.errstate(invalid='ignore', divide='ignore'):
+        y_rho = numpy.where(rho > 0.0, y / rho, 0.0)
+
+    lat = numpy.arcsin(numpy.clip(numpy.cos(c) * numpy.sin(lat0_rad) + \
+        y_rho * numpy.sin(c) * numpy.cos(lat0_rad), -1.0, 1.0))
+    lon = numpy.arctan2(x * numpy.sin(c), rho * numpy.cos(lat0_rad) * \
+        numpy.cos(c) - y * numpy.sin(lat0_rad) * numpy.sin(c))
+
+    return (lon0 + numpy.degrees(lon), numpy.degrees(lat))
+
+def _authalicAreaIntegral(lat):
+    """Area of WGS84 ellipsoid per radian of longitude between equator and 
+    latitude lat (radians), in square metres."""
+
+    e_sq = WGS84_FLATTENING * (2.0 - WGS84_FLATTENING)
+    e = numpy.sqrt(e_sq)
+    sin_lat = numpy.sin(lat)
+
+    return 0.5 * WGS84_SEMI_MAJOR_AXIS**2 * (1.0 - e_sq) * (
+        sin_lat / (1.0 - e_sq * sin_lat * sin_lat) + \
+        numpy.log((1.0 + e * sin_lat) / (1.0 - e * sin_lat)) / (2.0 * e))
+
+def _pointsInRing(x, y, ring):
+    """Even-odd ray casting test of points against a closed Shapely ring.
+    Loops over ring edges, vectorized over points."""
+
+    coords = numpy.array(ring.coords, dtype=float)
+    inside = numpy.zeros(x.shape, dtype=bool)
+
+    for edge_idx in xrange(coords.shape[0] - 1):
+        (x1, y1) = coords[edge_idx, 0:2]
+        (x2, y2) = coords[edge_idx + 1, 0:2]
+
+        # edge crosses horizontal line through point
+        crossing = (y1 > y) != (y2 > y)
+        if not crossing.any():
+            continue
+
+        # longitude of intersection of edge with horizontal line,
+        # horizontal edges never have crossing set
+        x_cross = x1 + (x2 - x1) * (y[crossing] - y1) / (y2 - y1)
+        inside[crossing] ^= (x[crossing] < x_cross)
+
+    return inside
+
+def _pointsOnRing(x, y, ring, tolerance=BOUNDARY_TOLERANCE):
+    """Test which points lie on the edges of a closed Shapely ring, within
+    tolerance. Loops over ring edges, vectorized over points."""
+
+    coords = numpy.array(ring.coords, dtype=float)
+    on_ring = numpy.zeros(x.shape, dtype=bool)
+
+    for edge_idx in xrange(coords.shape[0] - 1):
+        (x1, y1) = coords[edge_idx, 0:2]
+        (x2, y2) = coords[edge_idx + 1, 0:2]
+
+        # parameter of closest point on edge, clipped to edge end points
+        (dx, dy) = (x2 - x1, y2 - y1)
+        length_sq = dx * dx + dy * dy
+        if length_sq > 0.0:
+            t = numpy.clip(((x - x1) * dx + (y - y1) * dy) / length_sq, 
+                0.0, 1.0)
+        else:
+            t = numpy.zeros(x.shape, dtype=float)
+
+        dist_sq = (x - x1 - t * dx) ** 2 + (y - y1 - t * dy) ** 2
+        on_ring |= (dist_sq <= tolerance * tolerance)
+
+    return on_ring
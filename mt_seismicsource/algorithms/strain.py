@@ -34,6 +34,7 @@ from PyQt4.QtCore import *
 from PyQt4.QtGui import *
 
 from mt_seismicsource import layers
+from mt_seismicsource.algorithms import spatial
 
 STRAIN_DATA_DIR = 'strain'
 
@@ -202,25 +203,30 @@ def strainRateComponentsFromDataset(rates_in):
     
     Input:
         triple of epp, ett, ept (in original dataset denoted 
-        exx, eyy, exy) strain rate tensor components
+        exx, eyy, exy) strain rate tensor components, either scalars
+        or arrays
         
     Output:
         6-tuple of e1, e2, e3, e1h, e2h, err strain rate components
     """
     
-    (epp, ett, ept) = rates_in
+    (epp, ett, ept) = [numpy.asarray(x, dtype=float) for x in rates_in]
     err = -(epp + ett)
     sum1 = 0.5 * (epp + ett)
     sum2 = numpy.sqrt(ept * ept + 0.25 * numpy.power((epp - ett), 2))
     e1h = sum1 - sum2
     e2h = sum1 + sum2
     
-    if err >= e2h:
-        (e1, e2, e3) = (e1h, e2h, err)
-    elif err <= e1h:
-        (e1, e2, e3) = (err, e1h, e2h)
-    else:
-        (e1, e2, e3) = (e1h, err, e2h)
+    # order principal components:
+    # err >= e2h: (e1h, e2h, err)
+    # err <= e1h: (err, e1h, e2h)
+    # otherwise:  (e1h, err, e2h)
+    err_largest = (err >= e2h)
+    err_smallest = ~err_largest & (err <= e1h)
+
+    e1 = numpy.where(err_smallest, err, e1h)
+    e2 = numpy.where(err_largest, e2h, numpy.where(err_smallest, e1h, err))
+    e3 = numpy.where(err_largest, err, e2h)
         
     return (e1, e2, e3, e1h, e2h, err)
 
@@ -247,4 +253,28 @@ def tectonicRegimeForPoint(point, regime):
             break
             
     return regime_key
-    
\ No newline at end of file
+    
+def tectonicRegimeForPoints(lon, lat, regime):
+    """Get deformation regime codes for arrays of points.
+    
+    Input:
+        lon         array of point longitudes
+        lat         array of point latitudes
+        regime      Python dict with tectonic regime data
+        
+    Output:
+        array of regime keys (currently, C or R). For points that do not 
+        lie in any tectonic regime polygon, the entry is None
+    """
+    
+    regime_keys = numpy.empty(numpy.shape(lon), dtype=object)
+    unassigned = numpy.ones(numpy.shape(lon), dtype=bool)
+    
+    for deformation_regime, regime_poly in regime.items():
+        
+        inside = unassigned & spatial.pointsInPolygon(lon, lat, 
+            regime_poly, boundary=True)
+        regime_keys[inside] = deformation_regime
+        unassigned &= ~inside
+            
+    return regime_keys
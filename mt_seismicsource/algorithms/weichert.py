@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+"""
+SHARE Seismic Source Toolkit
+
+Estimation of Gutenberg-Richter a and b values for magnitude-dependent
+completeness periods, for many zones at once.
+See: Weichert (1980) Bull. Seismol. Soc. Am., 70, 1337--1346
+
+Author: Fabian Euchner, fabian@sed.ethz.ch
+"""
+
+############################################################################
+#    This program is free software; you can redistribute it and/or modify  #
+#    it under the terms of the GNU General Public License as published by  #
+#    the Free Software Foundation; either version 2 of the License, or     #
+#    (at your option) any later version.                                   #
+#                                                                          #
+#    This program is distributed in the hope that it will be useful,       #
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of        #
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         #
+#    GNU General Public License for more details.                          #
+#                                                                          #
+#    You should have received a copy of the GNU General Public License     #
+#    along with this program; if not, write to the                         #
+#    Free Software Foundation, Inc.,                                       #
+#    59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.             #
+############################################################################
+
+import numpy
+
+# zones with less events in complete magnitude bins get NaN
+MIN_EVENTS_WEICHERT = 10
+
+# Newton iteration for beta = b * ln(10)
+WEICHERT_MAX_ITERATIONS = 50
+WEICHERT_TOLERANCE = 1.0e-8
+WEICHERT_BETA_START = numpy.log(10.0)
+
+def estimateWeichert(incremental, mag_bins, duration, binsize, mmin=None,
+    min_events=MIN_EVENTS_WEICHERT, max_iterations=WEICHERT_MAX_ITERATIONS,
+    tolerance=WEICHERT_TOLERANCE):
+    """Maximum likelihood a and b values of all zones, for magnitude bins
+    with different observation times. The likelihood equation for beta is
+    solved with Newton iteration, vectorized over zones.
+
+    Input:
+        incremental     (zones x bins) array of counts of complete events
+        mag_bins        array of magnitude bin centres
+        duration        (zones x bins) array of complete observation times
+                        in years (see completeness.completenessDuration())
+        binsize         width of magnitude bins
+        mmin            if given, only bins with centre at or above mmin 
+                        are used
+
+    Output:
+        (a, b, sigma_a, sigma_b, event_cnt)
+        a               annual a value (log10 of annual rate of events with
+                        magnitude of at least zero)
+        event_cnt       array of number of events in used bins per zone
+    """
+
+    mag_bins = numpy.asarray(mag_bins, dtype=float)
+    duration = numpy.asarray(duration, dtype=float)
+
+    used = (duration > 0.0)
+    if mmin is not None:
+        used &= (mag_bins >= mmin - 0.5 * binsize)[numpy.newaxis, :]
+
+    counts = numpy.where(used, incremental, 0)
+    event_cnt = counts.sum(axis=1)
+
+    with numpy.errstate(invalid='ignore', divide='ignore', over='ignore'):
+        mag_mean = (counts * mag_bins).sum(axis=1) / event_cnt
+
+        # magnitudes relative to smallest used bin of zone, for numerical
+        # stability of exponentials
+        mag_ref = numpy.where(used, mag_bins, numpy.inf).min(axis=1)
+        mag_rel = mag_bins[numpy.newaxis, :] - mag_ref[:, numpy.newaxis]
+        mag_rel[~used] = 0.0
+
+        beta = WEICHERT_BETA_START * numpy.ones(event_cnt.shape)
+        active = (event_cnt >= max(min_events, 2))
+
+        for iteration in xrange(max_iterations):
+            weight = numpy.where(used, duration * numpy.exp(
+                -beta[:, numpy.newaxis] * mag_rel), 0.0)
+
+            sum_0 = weight.sum(axis=1)
+            mean_model = (weight * mag_rel).sum(axis=1) / sum_0
+            var_model = (weight * mag_rel**2).sum(axis=1) / sum_0 - \
+                mean_model**2
+
+            step = (mean_model - (mag_mean - mag_ref)) / var_model
+            step[~active] = 0.0
+            beta += step
+
+            if numpy.all(numpy.abs(step[active]) < tolerance):
+                break
+
+        # final weights and variance for converged beta
+        weight = numpy.where(used, duration * numpy.exp(
+            -beta[:, numpy.newaxis] * mag_rel), 0.0)
+        sum_0 = weight.sum(axis=1)
+        mean_model = (weight * mag_rel).sum(axis=1) / sum_0
+        var_model = (weight * mag_rel**2).sum(axis=1) / sum_0 - mean_model**2
+
+        b = beta / numpy.log(10.0)
+        sigma_b = 1.0 / (numpy.log(10.0) * numpy.sqrt(event_cnt * var_model))
+
+        # annual rate of events above lower edge of smallest used bin
+        rate = event_cnt * numpy.where(used, numpy.exp(
+            -beta[:, numpy.newaxis] * mag_rel), 0.0).sum(axis=1) / sum_0
+        mag_lower = mag_ref - 0.5 * binsize
+
+        a = numpy.log10(rate) + b * mag_lower
+        sigma_a = numpy.sqrt(1.0 / (event_cnt * numpy.log(10.0)**2) + \
+            (mag_lower * sigma_b)**2)
+
+    invalid = ~active | ~numpy.isfinite(b) | (beta <= 0.0)
+    for values in (a, b, sigma_a, sigma_b):
+        values[invalid] = numpy.nan
+
+    return (a, b, sigma_a, sigma_b, event_cnt)
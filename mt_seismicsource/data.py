@@ -32,6 +32,7 @@ from PyQt4.QtCore import *
 from PyQt4.QtGui import *
 
 from mt_seismicsource import layers
+from mt_seismicsource.algorithms import momentrate
 from mt_seismicsource.algorithms import strain
 
 MMAX_FILE_DIR = 'mmax'
@@ -49,6 +50,13 @@ class Datasets(object):
         self.strain_rate_barba = strain.loadStrainRateDataBarba()
         self.strain_rate_bird = strain.loadStrainRateDataBird()
         self.deformation_regimes_bird = strain.loadDeformationRegimesBird()
+
+        # moment rate contributions of strain rate grid nodes, these are
+        # independent of zone geometry and shared by all zones
+        self.strain_grid_barba = momentrate.strainRateGridBarba(
+            self.strain_rate_barba, self.deformation_regimes_bird)
+        self.strain_grid_bird = momentrate.strainRateGridBird(
+            self.strain_rate_bird, self.deformation_regimes_bird)
         
         self.mmax = self.loadMmaxData(ui_mode=ui_mode)
         
@@ -24,6 +24,8 @@ Author: Fabian Euchner, fabian@sed.ethz.ch
 #    59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.             #
 ############################################################################
 
+import numpy
+
 from mt_seismicsource import features
 from mt_seismicsource import plots
 from mt_seismicsource import utils
@@ -58,10 +60,24 @@ def updateTextActivityArea(cls, parameters):
         central_b,
         atticivy.aValue2activity(central_A, central_b, 
             parameters['activity_mmin']), )
-    text += "<b>(ML)</b> a: %.3f, b: %.3f (Mc %.1f)<br/>" % (
-        parameters['ml_a'], 
-        parameters['ml_b'],
-        parameters['ml_mc'])
+
+    # bootstrap confidence intervals are only shown if computed
+    if numpy.all(numpy.isfinite(parameters['ml_b_ci'])):
+        text += "<b>(ML)</b> a: %.3f, b: %.3f [%.3f, %.3f] "\
+            "(Mc %.1f [%.1f, %.1f])<br/>" % (
+            parameters['ml_a'], 
+            parameters['ml_b'],
+            parameters['ml_b_ci'][0],
+            parameters['ml_b_ci'][1],
+            parameters['ml_mc'],
+            parameters['ml_mc_ci'][0],
+            parameters['ml_mc_ci'][1])
+    else:
+        text += "<b>(ML)</b> a: %.3f, b: %.3f (Mc %.1f)<br/>" % (
+            parameters['ml_a'], 
+            parameters['ml_b'],
+            parameters['ml_mc'])
+
     text += "Mmin: %s, Mmax: %s, %s EQ (%s above Mc) in %s km<sup>2</sup> " \
             "(area zone)" % (
         parameters['activity_mmin'],
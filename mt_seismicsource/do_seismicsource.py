@@ -95,6 +95,10 @@ class SeismicSource(QDialog, Ui_SeismicSource):
         QObject.connect(self.btnLoadData, SIGNAL("clicked()"), 
             self.loadDataLayers)
 
+        # Button: append events of EQ catalog file to loaded catalog
+        QObject.connect(self.btnAppendEQCatalog, SIGNAL("clicked()"), 
+            self.appendEQCatalog)
+
         # Button: compute parameters for area source zones
         QObject.connect(self.btnDataAreaCompute, SIGNAL("clicked()"), 
             self.computeASZ)
@@ -216,11 +220,7 @@ class SeismicSource(QDialog, Ui_SeismicSource):
         
         self.loadDefaultLayers()
 
-        # display catalog properties
-        cat_prop_txt = "Time Span: %s yr (%s-%s)" % (
-            int(self.catalog_time_span[0]), self.catalog_time_span[1].year,
-            self.catalog_time_span[2].year)
-        self.labelCatTimeSpan.setText(cat_prop_txt)
+        self.displayCatalogProperties()
         
         self.renderers = render.setRenderers(
             self.area_source_layer,
@@ -242,6 +242,12 @@ class SeismicSource(QDialog, Ui_SeismicSource):
 
     def loadDefaultLayers(self):
 
+        # FMDs, spatial indexes, and geometries computed for previous zone 
+        # layers or catalog are invalid
+        fmd.invalidateFMDCache()
+        utils.invalidateZoneIndex()
+        utils.invalidateFeatureGeometry()
+
         self.background_zone_layer = background.loadBackgroundZoneLayer(self)
         self.progressBarLoadData.setValue(30)
         self.area_source_layer = areasource.loadAreaSourceLayer(self)
@@ -256,6 +262,55 @@ class SeismicSource(QDialog, Ui_SeismicSource):
         self.tectonic_layer = tectonic.loadTectonicRegimeLayer(self)
         self.progressBarLoadData.setValue(80)
 
+        # cached zone geometries are invalidated by edits of zone layers
+        for layer in (self.background_zone_layer, self.area_source_layer,
+            self.fault_source_layer, self.fault_background_layer):
+            utils.watchLayerGeometries(layer)
+
+    def displayCatalogProperties(self):
+        """Display time span of EQ catalog."""
+        cat_prop_txt = "Time Span: %s yr (%s-%s)" % (
+            int(self.catalog_time_span[0]), self.catalog_time_span[1].year,
+            self.catalog_time_span[2].year)
+        self.labelCatTimeSpan.setText(cat_prop_txt)
+
+    def appendEQCatalog(self):
+        """Append events of EQ catalog file to loaded catalog, and 
+        recompute attributes of the ASZ, FBZ, and FSZ features whose zones
+        contain new events."""
+
+        if self.catalog is None:
+            QMessageBox.warning(None, "No EQ catalog", 
+                "Load data before appending EQ catalog events")
+            return
+
+        path = unicode(QFileDialog.getOpenFileName(self, 
+            "Append EQ catalog file", 
+            os.path.join(layers.DATA_DIR, eqcatalog.CATALOG_DIR), 
+            layers.EQ_CATALOG_FILTER))
+        if path == '':
+            return
+
+        (mindepth, maxdepth) = eqcatalog.getMinMaxDepth(self)
+        event_offset = self.catalog.size()
+
+        engine.appendCatalogEvents(self.catalog, path, self.data,
+            self.area_source_layer, self.fault_background_layer, 
+            self.fault_source_layer, self.background_zone_layer, mindepth, 
+            maxdepth, mc=fmd.getMcMethod(self), 
+            m_threshold=self.spinboxFBZMThres.value(), ui_mode=True)
+
+        # show new events, time span of extended catalog is used from now on
+        eqcatalog.addEQCatalogFeatures(self.catalog_layer, 
+            self.catalog.select(numpy.arange(event_offset, 
+                self.catalog.size())))
+        self.catalog_layer.updateExtents()
+
+        self.catalog_time_span = self.catalog.timeSpan()
+        self.displayCatalogProperties()
+
+        self.iface.mapCanvas().refresh()
+
     def showASZ(self):
         """Show parameter values from ASZ layer in panel."""
         
@@ -268,7 +323,7 @@ class SeismicSource(QDialog, Ui_SeismicSource):
         # ---------------------------------------------------------------------
 
         self.feature_data_area_source['parameters'] = asz.updateDataArea(
-            self, selected_feature)
+            self, selected_feature, self.checkBoxBootstrap.isChecked())
         
         display.updateDisplaysArea(self, 
             self.feature_data_area_source['parameters'], selected_feature)
@@ -282,8 +337,10 @@ class SeismicSource(QDialog, Ui_SeismicSource):
 
         (mindepth, maxdepth) = eqcatalog.getMinMaxDepth(self)
         
-        engine.computeASZ(self.area_source_layer, self.catalog, mindepth, 
-            maxdepth, ui_mode=True)
+        engine.computeASZ(self.area_source_layer, self.catalog, self.data, 
+            mindepth, maxdepth, 
+            bootstrap=self.checkBoxBootstrap.isChecked(),
+            mc=fmd.getMcMethod(self), ui_mode=True)
             
         self.showASZ()
             
@@ -341,8 +398,8 @@ class SeismicSource(QDialog, Ui_SeismicSource):
 
         (mindepth, maxdepth) = eqcatalog.getMinMaxDepth(self)
         
-        engine.computeFBZ(self.fault_background_layer, self.catalog, mindepth,
-            maxdepth, ui_mode=True)
+        engine.computeFBZ(self.fault_background_layer, self.catalog, 
+            self.background_zone_layer, mindepth, maxdepth, ui_mode=True)
             
         self.showFBZ()
 
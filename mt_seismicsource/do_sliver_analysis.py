@@ -36,15 +36,25 @@ from qgis.core import *
 import utils
 from ui_sliver_analysis import Ui_SliverAnalysis
 
+from mt_seismicsource.algorithms import sliver
+
 MIN_SLIVER_DISTANCE = 0.1
 ZONE_BUFFER_DISTANCE = 0.5
 
+# analysis methods, first one is default
+ANALYSIS_METHOD_BUFFER = 'Buffer'
+ANALYSIS_METHOD_SEGMENT = 'Segment'
+ANALYSIS_METHOD_VERTEX = 'Vertex'
+ANALYSIS_METHODS = (ANALYSIS_METHOD_BUFFER, ANALYSIS_METHOD_SEGMENT, 
+    ANALYSIS_METHOD_VERTEX)
+
 NEIGHBORING_ZONE_COUNT = 10
 NEIGHBOR_COUNT = 3
 
-ANALYSIS_TABLE_COLUMN_COUNT = 9
+ANALYSIS_TABLE_COLUMN_COUNT = sliver.NEIGHBOR_COLUMN_COUNT
 
 SLIVER_ANALYSIS_LAYER_ID = "Sliver Analysis"
+SLIVER_POLYGON_LAYER_ID = "Sliver Polygons"
 
 class SliverAnalysis(QDialog, Ui_SliverAnalysis):
     """This class represents the sliver analysis dialog."""
@@ -60,10 +70,12 @@ class SliverAnalysis(QDialog, Ui_SliverAnalysis):
         self.inputAnalyzeSlivers.setValue(MIN_SLIVER_DISTANCE)
         self.inputAnalyzeBuffer.setValue(ZONE_BUFFER_DISTANCE)
 
+        self.comboBoxAnalysisMethod.addItems(ANALYSIS_METHODS)
+
         self.zone_layer = self.iface.activeLayer()
 
         self.analysis_layer = None
-        self.distance_matrix = None
+        self.sliver_layer = None
 
         # Button: analyze zones
         QObject.connect(self.btnAnalyzeSlivers, SIGNAL("clicked()"), 
@@ -73,650 +85,136 @@ class SliverAnalysis(QDialog, Ui_SliverAnalysis):
         """Check if selected layer is a polygon layer."""
 
         # TODO(fab): check if it's a polygon layer
-        # TODO(fab): select analysis method from UI 
-        self._analyze_buffer_based()
+        method = unicode(self.comboBoxAnalysisMethod.currentText())
 
-    def _analyze_buffer_based(self):
-        """Almost brute-force nearest neighbor analysis, using
-        buffer around reference zones."""
+        if method == ANALYSIS_METHOD_SEGMENT:
+            self._analyze_segment_based()
+        elif method == ANALYSIS_METHOD_VERTEX:
+            self._analyze_vertex_based()
+        else:
+            self._analyze_buffer_based()
 
-        #if len(self.zone_layer.selectedFeatures()) == 0:
-            #QMessageBox.warning(None, "No source zone selected", 
-                #"Please select at least one source zone")
-            #return
+    def _analyze_buffer_based(self):
+        """Nearest neighbor analysis, using buffer around reference zones.
+        Reference zones are the selected zones, or all zones if no zone is
+        selected (see sliver.bufferNeighbors())."""
 
         self.min_distance = self.inputAnalyzeSlivers.value()
         self.zone_buffer = self.inputAnalyzeBuffer.value()
 
-        # convert _all_ QGis polygons of source zone layer to Shapely
-        provider_all = self.zone_layer.dataProvider()
-        provider_all.select()
+        (zones, zone_ids, selected) = self._getZones()
 
-        (all_zones, all_vertices) = utils.polygonsQGS2Shapely(provider_all,
-            getVertices=True)
-        feature_cnt = len(all_zones)
-
-        # get indices of reference zones: selected ones, or all
-        if len(self.zone_layer.selectedFeatures()) > 0:
-
-            # zones selected, use them as reference zones
-            reference_zones = self.zone_layer.selectedFeatures()
-            selected_ref_zone_indices = utils.getSelectedRefZoneIndices(
-                reference_zones)
+        if len(selected) > 0:
+            reference_indices = [zone_idx for zone_idx, zone_id in \
+                enumerate(zone_ids) if zone_id in selected]
         else:
+            reference_indices = None
 
-            # no zones selected, use all zones
-            provider_all.rewind()
-            reference_zones = provider_all
-            selected_ref_zone_indices = range(feature_cnt)
-       
-        self._replaceAnalysisLayer()
-        pra = self.analysis_layer.dataProvider()
-
-        # loop over reference zone indices
-        distances = []
-
-        tot_ref_vertex_indices = []
-        tot_ref_vertices = []
-
-        for curr_ref_zone_idx in selected_ref_zone_indices:
-
-            curr_ref_vertex_indices = []
-            curr_ref_vertices = []
-
-            # loop over vertices of reference zones
-            curr_ref_zone = source_zones_shapely[curr_ref_zone_idx]
-            vertices = curr_ref_zone.exterior.coords
-            for vertex in list(vertices)[0:-1]:
-
-                # TODO(fab): if vertex is not yet in list of reference vertices,
-                # find its index, add index to list
-                if vertex not in tot_ref_vertex_indices:
-                    curr_ref_vertex_indices.append(vertex)
-
-            # add reference vertices of current zone to overall list
-            tot_ref_vertex_indices.extend(curr_ref_vertex_indices)
-
-            # remove possible duplicates
-            tot_ref_vertex_indices = list(set(tot_ref_vertex_indices))
-
-            # get neighboring zones for current reference zone
-            # - add margin ("buffer") to zone outline
-            # - select zones that overlap with that larger zone
-            buffered_zone = curr_ref_zone.buffer(self.zone_buffer)
-
-            test_zone_indices = []
-
-            curr_test_vertex_indices = []
-            curr_test_vertices = []
-            for curr_test_zone_idx, test_zone in enumerate(all_zones):
-
-                # skip if same zone
-                if curr_ref_zone_idx == curr_test_zone_idx:
-                    continue
-
-                curr_test_zone = source_zones_shapely[curr_test_zone_idx]
-                if buffered_zone.intersects(curr_test_zone):
-                    test_zone_indices.append(curr_test_zone_idx)
-                
-                    # loop over vertices
-                    vertices = curr_test_zone.exterior.coords
-                    for vertex in list(vertices)[0:-1]:
-
-                        # if vertex in buffer, add to test vertices
-                        if buffered_zone.intersects(vertex):
-                    
-                            # TODO(fab): check if test vertex is identical to one of the
-                            # reference vertices
-                            if vertex not in curr_ref_vertex_indices:
-                                curr_test_vertex_indices.add(vertex)
-            
-            # compute distances for reference and test vertices
-            for curr_ref_vertex_idx in curr_ref_vertex_indices:
-
-                curr_ref_vertex = all_vertices[curr_ref_vertex_idx]
-
-                # add ref point to analysis layer
-                pra.addFeatures([self._new_point_feature_from_coord(
-                    curr_ref_vertex.coords[0], 
-                    curr_ref_vertex.coords[1])])
-
-                for curr_test_vertex_idx in curr_test_vertex_indices:
-
-                    # get distance, add to distance list
-                    # distance list holds (9 cols):
-                    #  0: distance
-                    #  1: first point id
-                    #  2: polygon id
-                    #  3: first point lon
-                    #  4: first point lat
-                    #  5: second point id
-                    #  6: polygon id
-                    #  7: second point lon
-                    #  8: second point lat
-                    
-                    curr_test_vertex = all_vertices[curr_test_vertex_idx]
-                    distance = curr_ref_vertex.distance(curr_test_vertex)
-
-                    # if points are the same, distance is zero, or distance is greater
-                    # than the margin, ignore
-                    if curr_ref_vertex == curr_test_vertex or \
-                        distance == 0.0 or \
-                        distance > self.min_distance:
-                        continue
-
-                    # TODO(fab): get test zone indices
-                    distance_list = [ 
-                        distance,
-                        float(curr_ref_vertex_idx),
-                        float(curr_ref_zone_idx),
-                        curr_ref_vertex.coords[0],
-                        curr_ref_vertex.coords[1],
-                        float(curr_test_vertex_idx),
-                        float(1),
-                        curr_test_vertex.coords[0],
-                        curr_test_vertex.coords[1]]
-
-                    distances.add(distance_list)
-
-                    # add test point to analysis layer
-                    pra.addFeatures([self._new_point_feature_from_coord(
-                        curr_test_vertex.coords[0], 
-                        curr_test_vertex.coords[1])])
-
-            distance_arr = numpy.array(distances, dtype=float)
-            del distances
-
-             # sort array (distance)
-            dist_indices = numpy.argsort(distance_arr[:, 0], axis=0)
-            distance_arr = distance_arr[dist_indices.T]
-
-            # write to table
-            self._display_table(distance_arr)
-
-            # ----------------------------------------------------------------
-
-            ## remove duplicates in test_zone_indices
-            #test_zone_indices = list(set(test_zone_indices))
-
-            ##QMessageBox.information(None, "Neighboring zones", "%s" % (test_zone_indices))
-
-            ## get vertices for reference zone and neighboring zones
-
-            ## point array
-            ## 0 - point ID
-            ## 1 - zone ID
-            ## 2 - lon
-            ## 3 - lat
-            #points = []
-            #reference_vertex_indices = []
-
-            ## extract vertices from reference and test source polygons
-            #point_cnt = 0
-            #involved_zones_indices = selected_zones_indices
-            #involved_zones_indices.extend(test_zone_indices)
-            #involved_zones_indices = list(set(involved_zones_indices))
-
-            ##QMessageBox.information(None, "Involved zones", "%s" % (involved_zones_indices))
-
-            #for curr_zone_idx, curr_zone in enumerate(source_zones_shapely):
-
-                #if curr_zone_idx in involved_zones_indices: 
-                    #coords = curr_zone.exterior.coords
-
-                    ##QMessageBox.information(None, "Coords", 
-                        ##"Zone: %s, coords: %s" % (curr_zone_idx, coords))
-
-                    #if curr_zone_idx in selected_zones_indices:
-                        #addRefZone = True
-                    #else:
-                        #addRefZone = False
-
-                    #if len(coords) > 3:
-                        #for (vertex_lon, vertex_lat) in list(coords)[0:-1]:
-                            #points.append([float(point_cnt), float(curr_zone_idx),
-                                #vertex_lon, vertex_lat])
-
-                            #if addRefZone:
-                                #reference_vertex_indices.append(point_cnt)
-
-                            #point_cnt += 1
-
-            #points_arr = numpy.array(points, dtype=float)
-            #del points
-            
-            ## get nearest neighbors
-            ## neighbors array holds (9 cols):
-            ##  0: distance
-            ##  1: first point id
-            ##  2: polygon id
-            ##  3: first point lon
-            ##  4: first point lat
-            ##  5: second point id
-            ##  6: polygon id
-            ##  7: second point lon
-            ##  8: second point lat
-
-            #maxNeighborCount = len(reference_vertex_indices) * point_cnt
-
-            #neighbor_cnt = 0
-            #neighbors = numpy.ones((maxNeighborCount, 
-                #ANALYSIS_TABLE_COLUMN_COUNT), dtype=float) * numpy.nan
-
-            #self._replaceAnalysisLayer()
-            #pra = self.analysis_layer.dataProvider()
-            #for reference_point_idx in reference_vertex_indices:
-
-                #reference_point = shapely.geometry.Point(
-                    #(points_arr[reference_point_idx, 2], 
-                    #points_arr[reference_point_idx, 3]))
-
-                #for test_point_idx in xrange(points_arr.shape[0]):
-
-                    ## skip, if same point or points are in same polygon
-                    #if reference_point_idx == test_point_idx or \
-                        #points_arr[reference_point_idx, 1] == \
-                            #points_arr[test_point_idx, 1]:
-                        #continue
-
-                    ## get distance
-                    #test_point = shapely.geometry.Point(
-                        #(points_arr[test_point_idx, 2], 
-                        #points_arr[test_point_idx, 3]))
-
-                    #distance = reference_point.distance(test_point)
-
-                    ## if points are the same, distance is zero, or distance is greater
-                    ## than the margin, ignore
-                    #if reference_point == test_point or \
-                        #distance == 0.0 or \
-                        #distance > self.min_distance:
-                        #continue
-
-                    #neighbors[neighbor_cnt, 0] = distance
-                    #neighbors[neighbor_cnt, 1] = reference_point_idx
-                    #neighbors[neighbor_cnt, 2] = points_arr[reference_point_idx, 1]
-                    #neighbors[neighbor_cnt, 3] = points_arr[reference_point_idx, 2]
-                    #neighbors[neighbor_cnt, 4] = points_arr[reference_point_idx, 3]
-                    #neighbors[neighbor_cnt, 5] = test_point_idx
-                    #neighbors[neighbor_cnt, 6] = points_arr[test_point_idx, 1]
-                    #neighbors[neighbor_cnt, 7] = points_arr[test_point_idx, 2]
-                    #neighbors[neighbor_cnt, 8] = points_arr[test_point_idx, 3]
-    
-                    ## add point pair to analysis layer
-                    #if test_point_idx == 0:
-                        #pra.addFeatures([self._new_point_feature_from_coord(
-                            #points_arr[reference_point_idx, 2], 
-                            #points_arr[reference_point_idx, 3])])
-
-                    #pra.addFeatures([self._new_point_feature_from_coord(
-                        #points_arr[test_point_idx, 2], 
-                        #points_arr[test_point_idx, 3])])
-
-                    #neighbor_cnt += 1
-
-            #del points_arr
-
-        ## reshape array
-        #neighbors_trunc = neighbors[0:neighbor_cnt, :]
-
-        ## sort array (distance)
-        #dist_indices = numpy.argsort(neighbors_trunc[:, 0], axis=0)
-
-        #neighbors_trunc = neighbors_trunc[dist_indices.T]
-
-        ## write to table
-        #self._display_table(neighbors_trunc)
-
-    def _analyze_distance_based(self):
-        """Almost brute-force nearest neighbor analysis, using distance matrix
-        computed for zones."""
-
-        if len(self.zone_layer.selectedFeatures()) == 0:
-            QMessageBox.warning(None, "No source zone selected", 
-                "Please select at least one source zone")
-            return
-
-        # get feature IDs for selected source zone polygons
-        selected_zones_ids = [feature.id() for feature in \
-            self.zone_layer.selectedFeatures()]
+        neighbors = sliver.bufferNeighbors(zones, zone_ids, 
+            self.min_distance, self.zone_buffer, reference_indices)
 
-        # convert all QGis polygons of source zone layer to Shapely
-        source_zones_shapely = []
-        selected_zones_indices = []
-
-        prz = self.zone_layer.dataProvider()
-        prz.select()
-
-        feature_cnt = 0
-        for feature in prz:
+        self._replaceAnalysisLayer()
+        self._addNeighborPoints(neighbors)
 
-            qgis_geometry_aspolygon = feature.geometry().asPolygon()
-            if len(qgis_geometry_aspolygon) == 0:
-                continue
-            else:
-                vertices = [(x.x(), x.y()) for x in qgis_geometry_aspolygon[0]]
-                if len(vertices) == 0:
-                    continue
+        # write to table
+        self._display_table(neighbors)
 
-            if feature.id() in selected_zones_ids:
-                selected_zones_indices.append(feature_cnt)
+    def _analyze_segment_based(self):
+        """Vertex-to-edge analysis of all zones (see 
+        sliver.segmentNeighbors()), and detection of gaps and overlaps 
+        between zones (see sliver.sliverPolygons()). Reference vertices are 
+        the vertices of the selected zones, or of all zones if no zone is 
+        selected. Sliver polygons are shown in a separate layer."""
 
-            shapely_polygon = shapely.geometry.Polygon(vertices)
-            source_zones_shapely.append(shapely_polygon)
+        self.min_distance = self.inputAnalyzeSlivers.value()
 
-            feature_cnt += 1
+        (zones, zone_ids, selected) = self._getZones()
 
-        # build distance matrix
-        # TODO(fab): we don't need full distance matrix!
-        self._compute_distance_matrix(source_zones_shapely)
+        if len(selected) > 0:
+            reference_indices = [zone_idx for zone_idx, zone_id in \
+                enumerate(zone_ids) if zone_id in selected]
+        else:
+            reference_indices = None
 
-        # get neighboring zones for each selected reference zone
-        # - select NEIGHBORING_ZONE_COUNT neighboring zones from distance matrix
-        test_zone_indices = []
-        for ref_zone_idx in selected_zones_indices:
-            test_zone_distances = self._get_distance_list(ref_zone_idx)
+        neighbors = sliver.segmentNeighbors(zones, zone_ids, 
+            self.min_distance, reference_indices)
 
-            # first index in closest zone list is reference zone itself
-            # start at index 1
-            test_zone_indices.extend(self._get_closest_zone_indices(
-                test_zone_distances)[1:NEIGHBORING_ZONE_COUNT+1].tolist())
-            
-        # remove duplicates in test_zone_indices
-        test_zone_indices = list(set(test_zone_indices))
+        self._replaceAnalysisLayer()
+        self._addNeighborPoints(neighbors)
 
-        #QMessageBox.information(None, "Neighboring zones", "%s" % (test_zone_indices))
+        slivers = sliver.sliverPolygons(zones, zone_ids, self.min_distance)
+        if len(selected) > 0:
+            slivers = [x for x in slivers if \
+                len(set(x['zones']).intersection(selected)) > 0]
 
-        # get vertices for reference zone and neighboring zones
+        self._replaceSliverLayer()
+        self._addSliverPolygons(slivers)
 
-        # point array
-        # 0 - point ID
-        # 1 - zone ID
-        # 2 - lon
-        # 3 - lat
-        points = []
-        reference_vertex_indices = []
+        # write to table
+        self._display_table(neighbors)
 
-        # extract vertices from reference and test source polygons
-        point_cnt = 0
-        involved_zones_indices = selected_zones_indices
-        involved_zones_indices.extend(test_zone_indices)
-        involved_zones_indices = list(set(involved_zones_indices))
+    def _analyze_vertex_based(self):
+        """Nearest neighbor analysis of the vertices of all zones, using a
+        grid index over the vertices (see sliver.vertexNeighbors()). 
+        Reference vertices are the vertices of the selected zones, or of
+        all zones if no zone is selected."""
 
-        #QMessageBox.information(None, "Involved zones", "%s" % (involved_zones_indices))
+        self.min_distance = self.inputAnalyzeSlivers.value()
 
-        for curr_zone_idx, curr_zone in enumerate(source_zones_shapely):
+        (zones, zone_ids, selected) = self._getZones()
+        (lon, lat, vertex_zone) = sliver.zoneVertices(zones, zone_ids)
 
-            if curr_zone_idx in involved_zones_indices: 
-                coords = curr_zone.exterior.coords
+        if len(selected) > 0:
+            reference = numpy.in1d(vertex_zone, selected)
+        else:
+            reference = None
 
-                #QMessageBox.information(None, "Coords", 
-                    #"Zone: %s, coords: %s" % (curr_zone_idx, coords))
+        neighbors = sliver.vertexNeighbors(lon, lat, vertex_zone, 
+            self.min_distance, reference)
 
-                if curr_zone_idx in selected_zones_indices:
-                    addRefZone = True
-                else:
-                    addRefZone = False
+        self._replaceAnalysisLayer()
+        self._addNeighborPoints(neighbors)
 
-                if len(coords) > 3:
-                    for (vertex_lon, vertex_lat) in list(coords)[0:-1]:
-                        points.append([float(point_cnt), float(curr_zone_idx),
-                            vertex_lon, vertex_lat])
+        # write to table
+        self._display_table(neighbors)
 
-                        if addRefZone:
-                            reference_vertex_indices.append(point_cnt)
+    def _getZones(self):
+        """Return Shapely polygons of all valid zones of zone layer, their
+        feature IDs, and feature IDs of selected zones."""
 
-                        point_cnt += 1
+        provider = self.zone_layer.dataProvider()
+        provider.select()
 
-        points_arr = numpy.array(points, dtype=float)
-        del points
-        
-        # get nearest neighbors
-        # neighbors array holds (9 cols):
-        #  0: distance
-        #  1: first point id
-        #  2: polygon id
-        #  3: first point lon
-        #  4: first point lat
-        #  5: second point id
-        #  6: polygon id
-        #  7: second point lon
-        #  8: second point lat
-
-        maxNeighborCount = len(reference_vertex_indices) * point_cnt
-
-        neighbor_cnt = 0
-        neighbors = numpy.ones((maxNeighborCount, 
-            ANALYSIS_TABLE_COLUMN_COUNT), dtype=float) * numpy.nan
+        zones = []
+        zone_ids = []
+        for zone_idx, feature in utils.walkValidPolygonFeatures(provider):
+            zones.append(shapely.geometry.Polygon(
+                utils.verticesOuterFromQGSPolygon(feature)))
+            zone_ids.append(feature.id())
 
-        self._replaceAnalysisLayer()
-        pra = self.analysis_layer.dataProvider()
-        for reference_point_idx in reference_vertex_indices:
-
-            reference_point = shapely.geometry.Point(
-                (points_arr[reference_point_idx, 2], 
-                 points_arr[reference_point_idx, 3]))
-
-            for test_point_idx in xrange(points_arr.shape[0]):
-
-                # skip, if same point or points are in same polygon
-                if reference_point_idx == test_point_idx or \
-                    points_arr[reference_point_idx, 1] == \
-                        points_arr[test_point_idx, 1]:
-                    continue
-
-                # get distance
-                test_point = shapely.geometry.Point(
-                    (points_arr[test_point_idx, 2], 
-                     points_arr[test_point_idx, 3]))
-
-                distance = reference_point.distance(test_point)
-
-                # if points are the same, distance is zero, or distance is greater
-                # than the margin, ignore
-                if reference_point == test_point or \
-                    distance == 0.0 or \
-                    distance > self.min_distance:
-                    continue
-
-                neighbors[neighbor_cnt, 0] = distance
-                neighbors[neighbor_cnt, 1] = reference_point_idx
-                neighbors[neighbor_cnt, 2] = points_arr[reference_point_idx, 1]
-                neighbors[neighbor_cnt, 3] = points_arr[reference_point_idx, 2]
-                neighbors[neighbor_cnt, 4] = points_arr[reference_point_idx, 3]
-                neighbors[neighbor_cnt, 5] = test_point_idx
-                neighbors[neighbor_cnt, 6] = points_arr[test_point_idx, 1]
-                neighbors[neighbor_cnt, 7] = points_arr[test_point_idx, 2]
-                neighbors[neighbor_cnt, 8] = points_arr[test_point_idx, 3]
- 
-                # add point pair to analysis layer
-                if test_point_idx == 0:
-                    pra.addFeatures([self._new_point_feature_from_coord(
-                        points_arr[reference_point_idx, 2], 
-                        points_arr[reference_point_idx, 3])])
-
-                pra.addFeatures([self._new_point_feature_from_coord(
-                    points_arr[test_point_idx, 2], 
-                    points_arr[test_point_idx, 3])])
-
-                neighbor_cnt += 1
-
-        del points_arr
-
-        # reshape array
-        neighbors_trunc = neighbors[0:neighbor_cnt, :]
-
-        # sort array (distance)
-        dist_indices = numpy.argsort(neighbors_trunc[:, 0], axis=0)
-
-        neighbors_trunc = neighbors_trunc[dist_indices.T]
+        selected = [feature.id() for feature in \
+            self.zone_layer.selectedFeatures()]
 
-        # write to table
-        self._display_table(neighbors_trunc)
+        return (zones, zone_ids, selected)
 
-    def _analyze_brute(self):
-        """Almost brute-force nearest neighbor analysis."""
+    def _addNeighborPoints(self, neighbors):
+        """Add the distinct points of neighbor pairs to analysis layer, in
+        one call to provider."""
 
-        # get feature IDs for selected source zone polygons
-        selected_zones_ids = [feature.id() for feature in \
-            self.zone_layer.selectedFeatures()]
+        points = numpy.vstack((
+            neighbors[:, (sliver.NEIGHBOR_REF_LON_IDX, 
+                sliver.NEIGHBOR_REF_LAT_IDX)],
+            neighbors[:, (sliver.NEIGHBOR_TEST_LON_IDX, 
+                sliver.NEIGHBOR_TEST_LAT_IDX)]))
 
-        if len(selected_zones_ids) == 0:
-            QMessageBox.warning(None, "No source zone selected", 
-                "Please select at least one source zone")
+        if points.shape[0] == 0:
             return
 
-        # get neighboring zones for each reference zone
-        # - add margin ("buffer") to zone outline
-        # - select zones that overlap with that larger zone
-        # get vertices for reference zone and neighboring zones
-        # - ref zone goes first
-        
-        # point array
-        # 0 - point ID
-        # 1 - zone ID
-        # 2 - lon
-        # 3 - lat
-        points = []
-        reference_vertex_indices = []
-
-        # extract vertices from source zone polygon layer
-        prz = self.zone_layer.dataProvider()
-        pra = self.analysis_layer.dataProvider()
-        prz.select()
-
-        feature_cnt = 0
-        point_cnt = 0
-        for feature in prz:
-
-            geom = feature.geometry().asPolygon()
-
-            if feature.id() in selected_zones_ids:
-                addToRefVertices = True
-            else:
-                addToRefVertices = False
-
-            if len(geom) > 0:
-                for vertex in geom[0]:
-                    points.append([float(point_cnt), float(feature.id()),
-                        vertex.x(), vertex.y()])
-                    if addToRefVertices:
-                        reference_vertex_indices.append(point_cnt)
-                    point_cnt += 1
-
-            feature_cnt += 1
-
-        points_arr = numpy.array(points, dtype=float)
-        del points
-        
-        # get nearest neighbors
-        # neighbors array holds (9 cols):
-        #  0: distance
-        #  1: first point id
-        #  2: polygon id
-        #  3: first point lon
-        #  4: first point lat
-        #  5: second point id
-        #  6: polygon id
-        #  7: second point lon
-        #  8: second point lat
-
-        #maxNeighborCount = point_cnt * (point_cnt-1) / 2 # all zones selected
-        maxNeighborCount = point_cnt * len(reference_vertex_indices)
-
-        neighbor_cnt = 0
-        neighbors = numpy.ones((maxNeighborCount, 
-            ANALYSIS_TABLE_COLUMN_COUNT), dtype=float) * numpy.nan
-
-        # all zones selected
-        # outer loop: xrange(points_arr.shape[0])
-        # inner loop: xrange(reference_point_idx+1, points_arr.shape[0])
-        for reference_point_idx in reference_vertex_indices:
-            for test_point_idx in xrange(points_arr.shape[0]):
-
-                # skip, if same point or points are in same polygon
-                if reference_point_idx == test_point_idx or \
-                    points_arr[reference_point_idx, 1] == points_arr[test_point_idx, 1]:
-                    continue
-
-                # get distance
-                distArea = QgsDistanceArea()
-
-                reference_point = QgsPoint(
-                    points_arr[reference_point_idx, 2], 
-                    points_arr[reference_point_idx, 3])
-                test_point = QgsPoint(points_arr[test_point_idx, 2], 
-                    points_arr[test_point_idx, 3])
-
-                distance = float(distArea.measureLine(reference_point, 
-                    test_point))
-
-                # if points are the same or distance is greater than the margin, ignore
-                if reference_point == test_point or \
-                    distance > self.min_distance:
-                    continue
-
-                neighbors[neighbor_cnt, 0] = distance
-                neighbors[neighbor_cnt, 1] = reference_point_idx
-                neighbors[neighbor_cnt, 2] = points_arr[reference_point_idx, 1]
-                neighbors[neighbor_cnt, 3] = points_arr[reference_point_idx, 2]
-                neighbors[neighbor_cnt, 4] = points_arr[reference_point_idx, 3]
-                neighbors[neighbor_cnt, 5] = test_point_idx
-                neighbors[neighbor_cnt, 6] = points_arr[test_point_idx, 1]
-                neighbors[neighbor_cnt, 7] = points_arr[test_point_idx, 2]
-                neighbors[neighbor_cnt, 8] = points_arr[test_point_idx, 3]
- 
-                # add point pair to analysis layer
-                if test_point_idx == 0:
-                    pra.addFeatures([self._new_point_feature(reference_point)])
-                pra.addFeatures([self._new_point_feature(test_point)])
-
-                neighbor_cnt += 1
-
-        del points_arr
-
-        # reshape array
-        neighbors_trunc = neighbors[0:neighbor_cnt, :]
-
-        # sort array (distance)
-        dist_indices = numpy.argsort(neighbors_trunc[:, 0], axis=0)
-
-        neighbors_trunc = neighbors_trunc[dist_indices.T]
-
-        # write to table
-        self._display_table(neighbors_trunc)
-
-    def _compute_distance_matrix(self, zones_shapely):
-        """Compute distance matrix for zone polygons, using Shapely
-        distance function."""
-        dim = len(zones_shapely)
-        self.distance_matrix = numpy.ones((dim, dim), dtype=float) * numpy.nan
-
-        for curr_ref_idx in xrange(dim):
-            ref_zone = zones_shapely[curr_ref_idx]
-
-            for curr_test_idx in xrange(curr_ref_idx+1, dim):
-                test_zone = zones_shapely[curr_test_idx]
-                self.distance_matrix[curr_ref_idx, curr_test_idx] = \
-                    ref_zone.distance(test_zone)
-
-    def _get_distance(self, ref_idx, test_idx):
-        if ref_idx == test_idx:
-            return 0.0
-        elif ref_idx < test_idx:
-            return self.distance_matrix[ref_idx, test_idx]
-        else:
-            return self.distance_matrix[test_idx, ref_idx]
-
-    def _get_distance_list(self, zone_idx):
-        distances = [self._get_distance(zone_idx, idx) for idx in xrange(
-            self.distance_matrix.shape[0])]
-        return distances
+        points = numpy.array(sorted(set([tuple(x) for x in points])))
+        self.analysis_layer.dataProvider().addFeatures(
+            [self._new_point_feature_from_coord(lon, lat) for \
+                (lon, lat) in points])
 
-    def _get_closest_zone_indices(self, distances):
-        """distances is a list."""
-        return numpy.argsort(numpy.array(distances, dtype=float))
-            
     def _display_table(self, neighbors_trunc):
         """Write computed values to table cells."""
         
@@ -752,6 +250,44 @@ class SliverAnalysis(QDialog, Ui_SliverAnalysis):
             "memory")
         QgsMapLayerRegistry.instance().addMapLayer(self.analysis_layer)
 
+    def _replaceSliverLayer(self):
+        """Create new polygon layer for sliver polygons."""
+
+        if self.sliver_layer is not None:
+            QgsMapLayerRegistry.instance().removeMapLayer(
+                self.sliver_layer.id())
+
+        self.sliver_layer = QgsVectorLayer("Polygon", 
+            SLIVER_POLYGON_LAYER_ID, "memory")
+        self.sliver_layer.dataProvider().addAttributes([
+            QgsField("type", QVariant.String),
+            QgsField("zones", QVariant.String),
+            QgsField("area", QVariant.Double),
+            QgsField("width", QVariant.Double)])
+        QgsMapLayerRegistry.instance().addMapLayer(self.sliver_layer)
+
+    def _addSliverPolygons(self, slivers):
+        """Add sliver polygons with type, zone IDs, area (square km), and
+        mean width (degrees) to sliver layer, in one call to provider."""
+
+        feature_list = []
+        for curr_sliver in slivers:
+            f = QgsFeature()
+
+            ring = [QgsPoint(x, y) for (x, y) in \
+                curr_sliver['polygon'].exterior.coords]
+            f.setGeometry(QgsGeometry.fromPolygon([ring]))
+
+            f[0] = QVariant(curr_sliver['type'])
+            f[1] = QVariant(' '.join([str(x) for x in curr_sliver['zones']]))
+            f[2] = QVariant(float(curr_sliver['area']))
+            f[3] = QVariant(float(curr_sliver['width']))
+
+            feature_list.append(f)
+
+        self.sliver_layer.dataProvider().addFeatures(feature_list)
+        self.sliver_layer.updateExtents()
+
     def _new_point_feature(self, point):
         f = QgsFeature()
         f.setGeometry(QgsGeometry.fromPoint(point))
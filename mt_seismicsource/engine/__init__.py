@@ -32,11 +32,17 @@ Author: Fabian Euchner, fabian@sed.ethz.ch
 from mt_seismicsource import utils
 
 from mt_seismicsource.algorithms import atticivy
+from mt_seismicsource.algorithms import momentrate
 from mt_seismicsource.algorithms import recurrence
+from mt_seismicsource.engine import asz
+from mt_seismicsource.engine import fbz
+from mt_seismicsource.engine import fmd
+from mt_seismicsource.engine import fsz
 from mt_seismicsource.layers import eqcatalog
 
-def computeASZ(layer, catalog, mindepth=eqcatalog.CUT_DEPTH_MIN,
-    maxdepth=eqcatalog.CUT_DEPTH_MAX, ui_mode=True):
+def computeASZ(layer, catalog, data, mindepth=eqcatalog.CUT_DEPTH_MIN,
+    maxdepth=eqcatalog.CUT_DEPTH_MAX, complete_only=False, bootstrap=False,
+    mc=fmd.MC_METHODS[0], ui_mode=True):
     """Compute attributes on selected features of ASZ layer."""
     
     # check that at least one feature is selected
@@ -44,8 +50,10 @@ def computeASZ(layer, catalog, mindepth=eqcatalog.CUT_DEPTH_MIN,
         return
 
     updateASZAtticIvy(layer, catalog, mindepth, maxdepth, ui_mode)
-    updateASZMaxLikelihoodAB()
-    updateASZMomentRate()
+    updateASZMaxLikelihoodAB(layer, catalog, mindepth, maxdepth, bootstrap,
+        mc, ui_mode)
+    updateASZMomentRate(layer, catalog, data, mindepth, maxdepth, 
+        complete_only, ui_mode)
 
 def updateASZAtticIvy(layer, catalog, mindepth=eqcatalog.CUT_DEPTH_MIN,
     maxdepth=eqcatalog.CUT_DEPTH_MAX, ui_mode=True):
@@ -54,13 +62,32 @@ def updateASZAtticIvy(layer, catalog, mindepth=eqcatalog.CUT_DEPTH_MIN,
     atticivy.assignActivityAtticIvy(layer, catalog, atticivy.ATTICIVY_MMIN,
         mindepth, maxdepth, ui_mode)
 
-def updateASZMaxLikelihoodAB(ui_mode=True):
-    """Update max likelihood a/b value attributes on ASZ layer."""
-    pass
+def updateASZMaxLikelihoodAB(layer, catalog, 
+    mindepth=eqcatalog.CUT_DEPTH_MIN, maxdepth=eqcatalog.CUT_DEPTH_MAX, 
+    bootstrap=False, mc=fmd.MC_METHODS[0], ui_mode=True):
+    """Update max likelihood a/b value attributes on ASZ layer. If 
+    bootstrap is True, also update confidence intervals of Mc and b. mc is
+    an Mc value, or the name of an Mc method (see fmd.FMDBatch.computeMc()).
+    """
+    
+    asz.assignMaxLikelihoodArea(layer, catalog, mindepth, maxdepth, mc,
+        bootstrap=bootstrap, ui_mode=ui_mode)
+
+def updateASZWeichertAB(layer, catalog, mmin=atticivy.ATTICIVY_MMIN,
+    mindepth=eqcatalog.CUT_DEPTH_MIN, maxdepth=eqcatalog.CUT_DEPTH_MAX, 
+    ui_mode=True):
+    """Update a/b value attributes from Weichert's method on ASZ layer."""
+    
+    asz.assignWeichertArea(layer, catalog, mmin, mindepth, maxdepth, 
+        ui_mode=ui_mode)
 
-def updateASZMomentRate(ui_mode=True):
+def updateASZMomentRate(layer, catalog, data, 
+    mindepth=eqcatalog.CUT_DEPTH_MIN, maxdepth=eqcatalog.CUT_DEPTH_MAX, 
+    complete_only=False, ui_mode=True):
     """Update seismic moment rate attributes on ASZ layer."""
-    pass
+    
+    asz.assignMomentRateArea(layer, catalog, data, mindepth, maxdepth, 
+        complete_only, ui_mode)
 
 def computeFSZ(layer_fault, layer_fault_background=None, 
     layer_background=None, catalog=None, catalog_time_span=None, b_value=None,
@@ -77,7 +104,8 @@ def computeFSZ(layer_fault, layer_fault_background=None,
     updateFSZRecurrence(layer_fault, layer_fault_background, layer_background,
         catalog, catalog_time_span, b_value, mmin, m_threshold, mindepth, 
         maxdepth, ui_mode)
-    updateFSZMaxLikelihoodAB()
+    updateFSZMaxLikelihoodAB(layer_fault, layer_fault_background, catalog, 
+        mindepth, maxdepth, ui_mode)
     updateFSZMomentRate()
 
 def updateFSZRecurrence(layer_fault, layer_fault_background=None, 
@@ -93,20 +121,153 @@ def updateFSZRecurrence(layer_fault, layer_fault_background=None,
         m_threshold=m_threshold, mindepth=mindepth, maxdepth=maxdepth, 
         ui_mode=ui_mode)
 
-def updateFSZMaxLikelihoodAB(ui_mode=True):
-    """Update max likelihood a/b value attributes on FSZ layer."""
-    pass
+def updateFSZMaxLikelihoodAB(layer_fault, layer_fault_background=None, 
+    catalog=None, mindepth=eqcatalog.CUT_DEPTH_MIN, 
+    maxdepth=eqcatalog.CUT_DEPTH_MAX, ui_mode=True):
+    """Update max likelihood a/b value attributes on FSZ layer, from
+    quakes in fault background zones."""
+
+    if layer_fault_background is None or catalog is None:
+        return
+
+    fsz.assignMaxLikelihoodFault(layer_fault, layer_fault_background, 
+        catalog, mindepth, maxdepth, ui_mode=ui_mode)
 
 def updateFSZMomentRate(ui_mode=True):
     """Update seismic moment rate attributes on FSZ layer."""
     pass
 
-def computeFBZ(layer, catalog, mindepth=eqcatalog.CUT_DEPTH_MIN,
-    maxdepth=eqcatalog.CUT_DEPTH_MAX, ui_mode=True):
-    """Compute attributes on selected features of FBZ layer."""
+def computeFBZ(layer, catalog, layer_background=None, 
+    mindepth=eqcatalog.CUT_DEPTH_MIN, maxdepth=eqcatalog.CUT_DEPTH_MAX, 
+    bootstrap=False, ui_mode=True):
+    """Compute attributes on selected features of FBZ layer. The same 
+    attributes as for ASZ are used. Mmax and mcdist are taken from the
+    background zones, and AtticIvy activity is computed only if the 
+    background zone layer is given."""
     
     # check that at least one feature is selected
     if not utils.check_at_least_one_feature_selected(layer):
         return
 
-    
\ No newline at end of file
+    if layer_background is not None:
+        updateFBZAtticIvy(layer, catalog, layer_background, mindepth, 
+            maxdepth, ui_mode)
+    updateFBZMaxLikelihoodAB(layer, catalog, mindepth, maxdepth, bootstrap,
+        ui_mode)
+
+def updateFBZAtticIvy(layer, catalog, layer_background, 
+    mindepth=eqcatalog.CUT_DEPTH_MIN, maxdepth=eqcatalog.CUT_DEPTH_MAX, 
+    ui_mode=True):
+    """Update Mmax and mcdist attributes from background zones, and 
+    AtticIvy attributes on FBZ layer."""
+
+    fbz.assignMcdistMmaxFaultBackgr(layer, layer_background)
+    atticivy.assignActivityAtticIvy(layer, catalog, atticivy.ATTICIVY_MMIN,
+        mindepth, maxdepth, ui_mode)
+
+def updateFBZMaxLikelihoodAB(layer, catalog, 
+    mindepth=eqcatalog.CUT_DEPTH_MIN, maxdepth=eqcatalog.CUT_DEPTH_MAX, 
+    bootstrap=False, ui_mode=True):
+    """Update max likelihood a/b value attributes on FBZ layer."""
+    
+    asz.assignMaxLikelihoodArea(layer, catalog, mindepth, maxdepth, 
+        bootstrap=bootstrap, ui_mode=ui_mode)
+
+def appendCatalogEvents(catalog, catalog_path, data=None, layer_asz=None, 
+    layer_fault_background=None, layer_fault=None, layer_background=None, 
+    mindepth=eqcatalog.CUT_DEPTH_MIN, maxdepth=eqcatalog.CUT_DEPTH_MAX, 
+    mc=fmd.MC_METHODS[0], 
+    m_threshold=recurrence.FAULT_BACKGROUND_MAG_THRESHOLD, ui_mode=True):
+    """Append events of ZMAP catalog file to loaded catalog, and recompute
+    attributes only on those features of ASZ, FBZ, and FSZ layers whose 
+    zones contain new events. FSZ features are recomputed if new events
+    are in their FBZ or in their buffer zone. FBZ attributes are computed
+    with computeFBZ(). The selection of each layer is set to the 
+    recomputed features.
+
+    If the catalog has been declustered, only new events that are 
+    mainshocks are appended (see eqcatalog.ColumnarCatalog.append()). 
+    Recomputed attributes use the time span of the extended catalog; 
+    callers that keep the catalog time span have to update it.
+    
+    Returns dict of recomputed feature IDs, with keys 'asz', 'fbz', 'fsz'.
+    """
+
+    # FMDs of old catalog contents are not used again
+    fmd.invalidateFMDCache(catalog)
+
+    new_events = catalog.append(eqcatalog.readZMAPCatalog(catalog_path), 
+        catalog_path)
+    
+    updated = {'asz': [], 'fbz': [], 'fsz': []}
+    if new_events.size == 0:
+        return updated
+
+    if layer_asz is not None:
+        updated['asz'] = eqcatalog.getZonesWithEvents(catalog, layer_asz, 
+            new_events)
+
+    if layer_fault_background is not None:
+        updated['fbz'] = eqcatalog.getZonesWithEvents(catalog, 
+            layer_fault_background, new_events)
+
+        if layer_fault is not None:
+            updated['fsz'] = _getFaultZonesWithEvents(catalog, layer_fault, 
+                layer_fault_background, updated['fbz'], new_events, ui_mode)
+
+    if len(updated['asz']) > 0:
+        layer_asz.setSelectedFeatures(updated['asz'])
+        computeASZ(layer_asz, catalog, data, mindepth, maxdepth, mc=mc,
+            ui_mode=ui_mode)
+
+    if len(updated['fbz']) > 0:
+        layer_fault_background.setSelectedFeatures(updated['fbz'])
+        computeFBZ(layer_fault_background, catalog, layer_background, 
+            mindepth, maxdepth, ui_mode=ui_mode)
+
+    if len(updated['fsz']) > 0:
+        layer_fault.setSelectedFeatures(updated['fsz'])
+        computeFSZ(layer_fault, layer_fault_background, layer_background, 
+            catalog, catalog.timeSpan()[0], m_threshold=m_threshold, 
+            mindepth=mindepth, maxdepth=maxdepth, ui_mode=ui_mode)
+
+    return updated
+
+def _getFaultZonesWithEvents(catalog, layer_fault, layer_fault_background,
+    fbz_ids, event_indices, ui_mode=True):
+    """Return feature IDs of fault zones that have one of the given events
+    in their buffer zone, or whose FBZ is in fbz_ids."""
+
+    new_catalog = catalog.select(event_indices)
+    provider_fault_back = layer_fault_background.dataProvider()
+
+    provider_fault = layer_fault.dataProvider()
+    provider_fault.select()
+
+    feature_ids = []
+    fault_polygons = []
+    for zone_idx, feature in utils.walkValidPolygonFeatures(provider_fault):
+        feature_ids.append(feature.id())
+        fault_polygons.append(
+            utils.getFeatureGeometry(layer_fault, feature).polygon)
+
+    # buffer zones and fault background zones of all faults
+    buffer_zones = utils.computeBufferZones(fault_polygons, 
+        momentrate.BUFFER_AROUND_FAULT_ZONE_KM)
+    weights = utils.getOverlapWeights(fault_polygons, provider_fault_back)
+    fbz_indices = weights.dominantZones()
+
+    fault_ids = []
+    for fault_idx, feature_id in enumerate(feature_ids):
+        (bz_poly, bz_area) = buffer_zones[fault_idx]
+
+        if new_catalog.insidePolygon(bz_poly).any():
+            fault_ids.append(feature_id)
+            continue
+
+        fbz_idx = fbz_indices[fault_idx]
+        if fbz_idx >= 0 and \
+            weights.zone_index.feature_ids[fbz_idx] in fbz_ids:
+            fault_ids.append(feature_id)
+
+    return fault_ids
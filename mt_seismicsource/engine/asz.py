@@ -31,91 +31,262 @@ from PyQt4.QtGui import *
 
 from qgis.core import *
 
-import QPCatalog
+import qpfmd
 
 from mt_seismicsource import attributes
 from mt_seismicsource import features
 from mt_seismicsource import utils
 
 from mt_seismicsource.algorithms import atticivy
+from mt_seismicsource.algorithms import completeness
 from mt_seismicsource.algorithms import momentrate
 from mt_seismicsource.algorithms import recurrence
+from mt_seismicsource.algorithms import weichert
 
 from mt_seismicsource.engine import fmd
 
 from mt_seismicsource.layers import areasource
 from mt_seismicsource.layers import eqcatalog
 
-def updateDataArea(cls, feature):
+def updateDataArea(cls, feature, bootstrap=False):
     """Update or compute moment rates for selected feature of area source
     zone layer.
 
     Input:
         feature         QGis polygon feature from area source layer
+        bootstrap       if True, bootstrap confidence intervals of Mc and
+                        b value are computed
 
     Output:
         parameters      dict of computed parameters
     """
 
-    provider = cls.area_source_layer.dataProvider()
-    parameters = {}
+    # cut catalog with min/max depth according to UI spinboxes
+    (mindepth, maxdepth) = eqcatalog.getMinMaxDepth(cls)
 
-    # get Shapely polygon from feature geometry
-    polylist, vertices = utils.polygonsQGS2Shapely((feature,))
-    poly = polylist[0]
-    
-    # get polygon area in square kilometres
-    parameters['area_sqkm'] = utils.polygonAreaFromWGS84(poly) * 1.0e-6
+    parameters = computeDataArea(cls.area_source_layer, (feature,), 
+        cls.catalog, cls.data, cls.catalog_time_span[0], mindepth, maxdepth,
+        mc=fmd.getMcMethod(cls), bootstrap=bootstrap)[0]
 
-    # zone ID and title
-    (feature_id, feature_title, feature_name) = utils.getFeatureAttributes(
-        cls.area_source_layer, feature, features.AREA_SOURCE_ATTRIBUTES_ID)
-        
-    if feature_title.toString() == '' and feature_name.toString() == '':
-        zone_name_str = ""
-    elif feature_title.toString() == '' and feature_name.toString() != '':
-        zone_name_str = feature_name.toString()
-    elif feature_title.toString() != '' and feature_name.toString() == '':
-        zone_name_str = feature_title.toString()
-    else:
-        zone_name_str = "%s, %s" % (
-            feature_title.toString(), feature_name.toString())
-    
-    parameters['plot_title_fmd'] = 'Zone %s, %s' % (
-        feature_id.toInt()[0], zone_name_str)
+    cls.feature_data_area_source['fmd'] = parameters.pop('fmd')
+    return parameters
 
-    ## moment rate from EQs
+def assignMomentRateArea(layer, catalog, data, 
+    mindepth=eqcatalog.CUT_DEPTH_MIN, maxdepth=eqcatalog.CUT_DEPTH_MAX, 
+    complete_only=False, ui_mode=True):
+    """Compute moment rates for all selected features of area source
+    zone layer and write them as moment rate attributes.
 
-    # get quakes from catalog (cut with polygon)
-    poly_cat = QPCatalog.QPCatalog()
-    poly_cat.merge(cls.catalog)
-    poly_cat.cut(geometry=poly)
-    
-    # cut catalog with min/max depth according to UI spinboxes
-    (mindepth, maxdepth) = eqcatalog.getMinMaxDepth(cls)
-    poly_cat.cut(mindepth=mindepth, maxdepth=maxdepth)
+    Input:
+        layer           QGis layer with area zone features
+        catalog         earthquake catalog as ColumnarCatalog object
+        data            Datasets object with strain rate data
+        complete_only   if True, use only events that are complete 
+                        according to mcdist of zone
+    """
 
-    parameters['eq_count'] = poly_cat.size()
-    
-    # sum up moment from quakes (converted from Mw with Kanamori eq.)
-    magnitudes = []
-    for ev in poly_cat.eventParameters.event:
-        mag = ev.getPreferredMagnitude()
-        magnitudes.append(mag.mag.value)
+    zone_data = computeDataArea(layer, layer.selectedFeatures(), catalog, 
+        data, catalog.timeSpan()[0], mindepth, maxdepth, 
+        complete_only=complete_only, compute_fmd=False, ui_mode=ui_mode)
+
+    momentrates = []
+    for parameters in zone_data:
+        if parameters is None:
+            momentrates.append(None)
+            continue
+
+        if len(parameters['mr_activity']) > 0:
+            mr_activity = utils.centralValueOfList(parameters['mr_activity'])
+        else:
+            mr_activity = numpy.nan
+
+        # same order as in features.AREA_SOURCE_ATTRIBUTES_MOMENTRATE
+        momentrates.append([parameters['mr_eq'], mr_activity, 
+            parameters['mr_strain_bird'], parameters['mr_strain_barba']])
+
+    attributes.writeLayerAttributes(layer, 
+        features.AREA_SOURCE_ATTRIBUTES_MOMENTRATE, momentrates)
+
+def assignMaxLikelihoodArea(layer, catalog, 
+    mindepth=eqcatalog.CUT_DEPTH_MIN, maxdepth=eqcatalog.CUT_DEPTH_MAX, 
+    mc=fmd.MC_METHODS[0], bootstrap=False, ui_mode=True):
+    """Compute maximum likelihood a and b values for all selected features
+    of area source zone layer at once, and write a, b, Mc, and the
+    standard deviations of a and b as attributes.
+
+    Input:
+        layer           QGis layer with area zone features
+        catalog         earthquake catalog as ColumnarCatalog object
+        mc              Mc value, or Mc method
+        bootstrap       if True, bootstrap confidence intervals of Mc and
+                        b are computed and written as attributes
+
+    Output:
+        list of (a, b, Mc, sigma_a, sigma_b) per selected feature (None 
+        for features with invalid geometry)
+    """
+
+    zones = layer.selectedFeatures()
+    (zone_polygons, zone_events) = getZoneEvents(layer, zones, catalog, 
+        mindepth, maxdepth)
+
+    (a, b, sigma_a, sigma_b, mc_zone, event_cnt) = fmd.computeFMDBatch(
+        zone_events, catalog.magnitude, mc, 
+        catalog.timeSpan()[0]).maxLikelihoodAB()
+
+    activity = []
+    for zone_idx, poly in enumerate(zone_polygons):
+        if poly is None:
+            activity.append(None)
+        else:
+            activity.append((a[zone_idx], b[zone_idx], mc_zone[zone_idx], 
+                sigma_a[zone_idx], sigma_b[zone_idx]))
+
+    # same order as in features.AREA_SOURCE_ATTRIBUTES_AB_ML
+    attributes.writeLayerAttributes(layer, 
+        features.AREA_SOURCE_ATTRIBUTES_AB_ML, activity)
+
+    if bootstrap is True:
+        confidence = numpy.vstack(fmd.computeBootstrapMcB(zone_events, 
+            catalog.magnitude, mc)).T
+
+        # same order as in features.AREA_SOURCE_ATTRIBUTES_AB_ML_CI
+        attributes.writeLayerAttributes(layer, 
+            features.AREA_SOURCE_ATTRIBUTES_AB_ML_CI, 
+            [None if poly is None else confidence[zone_idx].tolist() \
+                for zone_idx, poly in enumerate(zone_polygons)])
+
+    return activity
+
+def assignWeichertArea(layer, catalog, mmin=atticivy.ATTICIVY_MMIN,
+    mindepth=eqcatalog.CUT_DEPTH_MIN, maxdepth=eqcatalog.CUT_DEPTH_MAX, 
+    ui_mode=True):
+    """Compute a and b values with Weichert's method for all selected 
+    features of area source zone layer at once, using the completeness
+    periods from the mcdist attribute of each zone, and write them as
+    attributes. Quick-look alternative to AtticIvy.
+
+    Input:
+        layer           QGis layer with area zone features
+        catalog         earthquake catalog as ColumnarCatalog object
+        mmin            only magnitude bins at or above mmin are used
+
+    Output:
+        list of (a, b, sigma_a, sigma_b) per selected feature (None 
+        for features with invalid geometry)
+    """
+
+    provider = layer.dataProvider()
+    attribute_map = utils.getAttributeIndex(provider, 
+        (features.AREA_SOURCE_ATTR_MCDIST,), create=False)
+    mcdist_idx = attribute_map[features.AREA_SOURCE_ATTR_MCDIST['name']][0]
+
+    zones = layer.selectedFeatures()
+    (zone_polygons, zone_events) = getZoneEvents(layer, zones, catalog, 
+        mindepth, maxdepth)
 
-    moment = numpy.array(momentrate.magnitude2moment(magnitudes))
+    # only complete quakes, in complete magnitude bins
+    mcdist = [str(zone[mcdist_idx].toString()) for zone in zones]
+    zone_events = completeness.completeZoneEvents(zone_events, mcdist,
+        catalog.magnitude, catalog.time, qpfmd.DEFAULT_BINSIZE)
 
-    # scale moment: per year and area (in km^2)
-    parameters['mr_eq'] = moment.sum() / (
-        parameters['area_sqkm'] * cls.catalog_time_span[0])
+    fmd_batch = fmd.computeFMDBatch(zone_events, catalog.magnitude)
 
-    ## moment rate from activity (RM)
+    (mc_mag, mc_year) = completeness.parseMcdist(mcdist)
+    duration = completeness.completenessDuration(fmd_batch.mag_bins, 
+        mc_mag, mc_year, numpy.nanmin(catalog.time), 
+        numpy.nanmax(catalog.time))
+
+    (a, b, sigma_a, sigma_b, event_cnt) = weichert.estimateWeichert(
+        fmd_batch.incremental, fmd_batch.mag_bins, duration, 
+        fmd_batch.binsize, mmin)
+
+    activity = []
+    for zone_idx, poly in enumerate(zone_polygons):
+        if poly is None:
+            activity.append(None)
+        else:
+            activity.append((a[zone_idx], b[zone_idx], sigma_a[zone_idx], 
+                sigma_b[zone_idx]))
+
+    # same order as in features.AREA_SOURCE_ATTRIBUTES_AB_WEICHERT
+    attributes.writeLayerAttributes(layer, 
+        features.AREA_SOURCE_ATTRIBUTES_AB_WEICHERT, activity)
+
+    return activity
+
+def getZoneEvents(layer, zones, catalog, mindepth=eqcatalog.CUT_DEPTH_MIN,
+    maxdepth=eqcatalog.CUT_DEPTH_MAX):
+    """Get Shapely polygons of zones, and indices of catalog events in 
+    zones and depth range, from event-to-zone table of layer.
+
+    Output:
+        (zone_polygons, zone_events)
+        zone_polygons   list of Shapely polygons (None for features with 
+                        invalid geometry)
+        zone_events     list of arrays of catalog event indices
+    """
+
+    # event-to-zone table for all zones of layer
+    catalog.zoneMembership(layer)
+
+    # cut catalog with min/max depth (don't exclude events with 'NaN' depth)
+    depth_selected = catalog.depthMask(mindepth, maxdepth)
+
+    zone_polygons = []
+    zone_events = []
+    for zone in zones:
+        polylist, vertices = utils.polygonsQGS2Shapely((zone,), 
+            layer=layer)
+        if len(polylist) == 0:
+            zone_polygons.append(None)
+            zone_events.append(numpy.array([], dtype=int))
+        else:
+            events = catalog.zoneEvents(polylist[0])
+            zone_polygons.append(polylist[0])
+            zone_events.append(events[depth_selected[events]])
+
+    return (zone_polygons, zone_events)
+
+def computeDataArea(layer, zones, catalog, data, catalog_time_span, 
+    mindepth=eqcatalog.CUT_DEPTH_MIN, maxdepth=eqcatalog.CUT_DEPTH_MAX, 
+    mc=fmd.MC_METHODS[0], complete_only=False, compute_fmd=True, 
+    bootstrap=False, ui_mode=True):
+    """Compute moment rates, activity, and FMD for a list of features of
+    area source zone layer. Catalog and strain rate data are prepared 
+    once and shared by all zones.
+
+    Input:
+        layer               QGis layer with area zone features
+        zones               iterable of QGis polygon features from layer
+        catalog             earthquake catalog as ColumnarCatalog object
+        data                Datasets object with strain rate data
+        catalog_time_span   time span of catalog in years
+        mc                  Mc method or Mc value for FMD
+        complete_only       if True, EQ moment rate and FMD use only 
+                            events that are complete according to mcdist
+                            attribute of zone
+        compute_fmd         if False, no FMD object is created per zone, 
+                            and only binned FMDs for all zones are computed
+        bootstrap           if True, bootstrap confidence intervals of Mc
+                            and b value are computed for all zones
+
+    Output:
+        list of parameter dicts, one per zone (None for zones with invalid
+        geometry). The 'fmd' entry holds the FMD object (memoized, see
+        fmd.getZoneFMD()), the 'fmd_batch' entry the binned FMD of the zone.
+        Maximum likelihood a/b values are taken from the binned FMDs, with
+        or without FMD object.
+    """
+
+    provider = layer.dataProvider()
 
     # get attribute index of AtticIvy result
     attribute_map = utils.getAttributeIndex(provider, 
         (features.AREA_SOURCE_ATTR_ACT_RM_A, 
          features.AREA_SOURCE_ATTR_ACT_RM_B, 
-         features.AREA_SOURCE_ATTR_MMAX))
+         features.AREA_SOURCE_ATTR_MMAX,
+         features.AREA_SOURCE_ATTR_MCDIST))
 
     attribute_act_a_name = features.AREA_SOURCE_ATTR_ACT_RM_A['name']
     attribute_act_a_idx = attribute_map[attribute_act_a_name][0]
@@ -126,66 +297,155 @@ def updateDataArea(cls, feature):
     attribute_mmax_name = features.AREA_SOURCE_ATTR_MMAX['name']
     attribute_mmax_idx = attribute_map[attribute_mmax_name][0]
 
-    # get RM (a, b) values from feature attributes
-    try:
-        activity_a_str = str(feature[attribute_act_a_idx].toString())
-        activity_a_arr = activity_a_str.strip().split()
-    except KeyError:
-        activity_a_arr = 3 * [numpy.nan]
-        error_msg = "Moment balancing: no valid activity a parameter in %s" % (
-            parameters['plot_title_fmd'])
-        QMessageBox.warning(None, "Moment balancing warning", error_msg)
+    attribute_mcdist_name = features.AREA_SOURCE_ATTR_MCDIST['name']
+    attribute_mcdist_idx = attribute_map[attribute_mcdist_name][0]
 
-    try:
-        activity_b_str = str(feature[attribute_act_b_idx].toString())
-        activity_b_arr = activity_b_str.strip().split()
-    except KeyError:
-        activity_b_arr = 3 * [numpy.nan]
-        error_msg = "Moment balancing: no valid activity b parameter in %s" % (
-            parameters['plot_title_fmd'])
-        QMessageBox.warning(None, "Moment balancing warning", error_msg)
+    # moment from quakes (converted from Mw with Kanamori eq.)
+    moment = numpy.array(momentrate.magnitude2moment(catalog.magnitude))
+
+    (zone_polygons, zone_events) = getZoneEvents(layer, zones, catalog, 
+        mindepth, maxdepth)
+
+    # remove incomplete quakes, for all zones at once
+    if complete_only is True:
+        mcdist = [str(zone[attribute_mcdist_idx].toString()) \
+            for zone in zones]
+        zone_events = completeness.completeZoneEvents(zone_events, mcdist,
+            catalog.magnitude, catalog.time, qpfmd.DEFAULT_BINSIZE)
+
+    # binned FMDs and maximum likelihood a/b values of all zones
+    fmd_batch = fmd.computeFMDBatch(zone_events, catalog.magnitude, mc,
+        catalog_time_span)
+    (ml_a, ml_b, ml_sigma_a, ml_sigma_b, ml_mc, ml_magctr) = \
+        fmd_batch.maxLikelihoodAB()
+
+    if bootstrap is True:
+        (ml_mc_low, ml_mc_high, ml_b_low, ml_b_high) = \
+            fmd.computeBootstrapMcB(zone_events, catalog.magnitude, mc)
+    else:
+        (ml_mc_low, ml_mc_high, ml_b_low, ml_b_high) = 4 * [
+            numpy.nan * numpy.ones(len(zone_events))]
+
+    result = []
+    for zone_idx, (zone, poly, events) in enumerate(zip(zones, 
+        zone_polygons, zone_events)):
+
+        if poly is None:
+            result.append(None)
+            continue
+
+        parameters = {}
+
+        # get polygon area in square kilometres
+        parameters['area_sqkm'] = utils.getFeatureGeometry(layer, 
+            zone).area()
+
+        # zone ID and title
+        (feature_id, feature_title, feature_name) = utils.getFeatureAttributes(
+            layer, zone, features.AREA_SOURCE_ATTRIBUTES_ID)
+            
+        if feature_title.toString() == '' and feature_name.toString() == '':
+            zone_name_str = ""
+        elif feature_title.toString() == '' and feature_name.toString() != '':
+            zone_name_str = feature_name.toString()
+        elif feature_title.toString() != '' and feature_name.toString() == '':
+            zone_name_str = feature_title.toString()
+        else:
+            zone_name_str = "%s, %s" % (
+                feature_title.toString(), feature_name.toString())
         
-    # ignore weights
-    parameters['activity_mmin'] = atticivy.ATTICIVY_MMIN
-    activity_a = [float(x) for x in activity_a_arr]
-    activity_b = [float(x) for x in activity_b_arr]
-    mmax = float(feature[attribute_mmax_idx].toDouble()[0])
-    
-    parameters['activity_a'] = activity_a
-    parameters['activity_b'] = activity_b 
-    parameters['mmax'] = mmax 
+        parameters['plot_title_fmd'] = 'Zone %s, %s' % (
+            feature_id.toInt()[0], zone_name_str)
+
+        ## moment rate from EQs
 
-    ## Maximum likelihood a/b values
-    if poly_cat.size() == 0:
-        cls.feature_data_area_source['fmd'] = None
+        parameters['eq_count'] = int(events.size)
+        
+        # scale moment: per year and area (in km^2)
+        parameters['mr_eq'] = numpy.nansum(moment[events]) / (
+            parameters['area_sqkm'] * catalog_time_span)
+
+        ## moment rate from activity (RM)
+
+        # get RM (a, b) values from feature attributes
+        try:
+            activity_a_str = str(zone[attribute_act_a_idx].toString())
+            activity_a_arr = activity_a_str.strip().split()
+        except KeyError:
+            activity_a_arr = 3 * [numpy.nan]
+            error_msg = \
+                "Moment balancing: no valid activity a parameter in %s" % (
+                    parameters['plot_title_fmd'])
+            _warningMomentBalancing(error_msg, ui_mode)
+
+        try:
+            activity_b_str = str(zone[attribute_act_b_idx].toString())
+            activity_b_arr = activity_b_str.strip().split()
+        except KeyError:
+            activity_b_arr = 3 * [numpy.nan]
+            error_msg = \
+                "Moment balancing: no valid activity b parameter in %s" % (
+                    parameters['plot_title_fmd'])
+            _warningMomentBalancing(error_msg, ui_mode)
+            
+        # ignore weights
+        parameters['activity_mmin'] = atticivy.ATTICIVY_MMIN
+        activity_a = [float(x) for x in activity_a_arr]
+        activity_b = [float(x) for x in activity_b_arr]
+        mmax = float(zone[attribute_mmax_idx].toDouble()[0])
+        
+        parameters['activity_a'] = activity_a
+        parameters['activity_b'] = activity_b 
+        parameters['mmax'] = mmax 
+
+        ## FMD and maximum likelihood a/b values
+        parameters['fmd_batch'] = fmd_batch.zoneFMD(zone_idx)
+        parameters['ml_mc_ci'] = (ml_mc_low[zone_idx], ml_mc_high[zone_idx])
+        parameters['ml_b_ci'] = (ml_b_low[zone_idx], ml_b_high[zone_idx])
+
+        # a/b values from binned FMD in any case, FMD object for plots
         (parameters['ml_a'], parameters['ml_b'], parameters['ml_mc'], 
-            parameters['ml_magctr']) = 4 * [numpy.nan]
-        error_msg = "Moment balancing: no EQs in %s" % (
-            parameters['plot_title_fmd'])
+            parameters['ml_magctr']) = (ml_a[zone_idx], ml_b[zone_idx],
+                ml_mc[zone_idx], ml_magctr[zone_idx])
+
+        if compute_fmd is False:
+            parameters['fmd'] = None
+        elif parameters['eq_count'] == 0:
+            parameters['fmd'] = None
+            error_msg = "Moment balancing: no EQs in %s" % (
+                parameters['plot_title_fmd'])
+            _warningMomentBalancing(error_msg, ui_mode)
+        elif complete_only is True:
+            parameters['fmd'] = fmd.getZoneFMD(catalog, poly, mindepth, 
+                maxdepth, mc, catalog_time_span, catalog.select(events),
+                selection=mcdist[zone_idx])
+        else:
+            parameters['fmd'] = fmd.getZoneFMD(catalog, poly, mindepth, 
+                maxdepth, mc, catalog_time_span)
+
+        ## moment rate from activity
+        a_values = activity_a
+        momentrates_arr = numpy.array(momentrate.momentrateFromActivity(
+            a_values, activity_b, mmax)) / catalog_time_span
+        parameters['mr_activity'] = momentrates_arr.tolist()
+
+        ## moment rate from geodesy (strain)
+        momentrate_strain_barba = momentrate.momentrateFromStrainRateGrid(
+            poly, data.strain_grid_barba)
+        parameters['mr_strain_barba'] = momentrate_strain_barba / (
+            catalog_time_span)
+
+        momentrate_strain_bird = momentrate.momentrateFromStrainRateGrid(
+            poly, data.strain_grid_bird)
+        parameters['mr_strain_bird'] = momentrate_strain_bird / (
+            catalog_time_span)
+
+        result.append(parameters)
+
+    return result
+
+def _warningMomentBalancing(error_msg, ui_mode=True):
+    if ui_mode is True:
         QMessageBox.warning(None, "Moment balancing warning", error_msg)
     else:
-        cls.feature_data_area_source['fmd'] = fmd.computeZoneFMD(cls, feature, 
-            poly_cat)
-        (parameters['ml_a'], parameters['ml_b'], parameters['ml_mc'], 
-            parameters['ml_magctr']) = fmd.getFMDValues(
-                cls.feature_data_area_source['fmd'])
-
-    ## moment rate from activity
-    a_values = activity_a
-    momentrates_arr = numpy.array(momentrate.momentrateFromActivity(
-        a_values, activity_b, mmax)) / cls.catalog_time_span[0]
-    parameters['mr_activity'] = momentrates_arr.tolist()
-
-    ## moment rate from geodesy (strain)
-    momentrate_strain_barba = momentrate.momentrateFromStrainRateBarba(
-        poly, cls.data.strain_rate_barba, 
-        cls.data.deformation_regimes_bird)
-    parameters['mr_strain_barba'] = momentrate_strain_barba / (
-        cls.catalog_time_span[0])
-
-    momentrate_strain_bird = momentrate.momentrateFromStrainRateBird(poly, 
-        cls.data.strain_rate_bird, cls.data.deformation_regimes_bird)
-    parameters['mr_strain_bird'] = momentrate_strain_bird / (
-        cls.catalog_time_span[0])
-
-    return parameters
+        print error_msg
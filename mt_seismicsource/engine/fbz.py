@@ -31,8 +31,6 @@ from PyQt4.QtGui import *
 
 from qgis.core import *
 
-import QPCatalog
-
 from mt_seismicsource import attributes
 from mt_seismicsource import features
 from mt_seismicsource import utils
@@ -66,42 +64,37 @@ def updateDataFaultBackgr(cls, feature,
     parameters = {}
 
     # get Shapely polygon from feature geometry
-    polylist, vertices = utils.polygonsQGS2Shapely((feature,))
+    polylist, vertices = utils.polygonsQGS2Shapely((feature,), 
+        layer=cls.fault_background_layer)
     poly = polylist[0]
 
     # get polygon area in square kilometres
-    parameters['area_background_sqkm'] = \
-        utils.polygonAreaFromWGS84(poly) * 1.0e-6
+    parameters['area_background_sqkm'] = utils.getFeatureGeometry(
+        cls.fault_background_layer, feature).area()
 
-    # get mmax and mcdist for FBZ from background zone
-    (mcdist_qv, mmax_qv) = areasource.getAttributesFromBackgroundZones(
-        poly.centroid, provider_back, areasource.MCDIST_MMAX_ATTRIBUTES)
+    # get mmax (area-weighted) and mcdist for FBZ from background zones
+    (mcdist_bg, mmax_bg) = areasource.getMcdistMmaxFromBackgroundZones(
+        (poly,), provider_back)
         
-    mmax = float(mmax_qv.toDouble()[0])
-    mcdist = str(mcdist_qv.toString())
+    mmax = float(mmax_bg[0])
+    mcdist = mcdist_bg[0]
 
     parameters['mmax'] = mmax 
     
     ## moment rate from EQs
 
     # get quakes from catalog (cut with fault background zone polygon)
-    poly_cat = QPCatalog.QPCatalog()
-    poly_cat.merge(cls.catalog)
-    poly_cat.cut(geometry=poly)
+    cls.catalog.zoneMembership(cls.fault_background_layer)
+    poly_cat = cls.catalog.cutZone(poly)
     
     # cut catalog with min/max depth according to UI spinboxes
     (mindepth, maxdepth) = eqcatalog.getMinMaxDepth(cls)
-    poly_cat.cut(mindepth=mindepth, maxdepth=maxdepth)
+    poly_cat = poly_cat.cutDepth(mindepth, maxdepth)
     
     parameters['eq_count'] = poly_cat.size()
 
     # sum up moment from quakes (converted from Mw with Kanamori eq.)
-    magnitudes = []
-    for ev in poly_cat.eventParameters.event:
-        mag = ev.getPreferredMagnitude()
-        magnitudes.append(mag.mag.value)
-
-    moment = numpy.array(momentrate.magnitude2moment(magnitudes))
+    moment = numpy.array(momentrate.magnitude2moment(poly_cat.magnitude))
 
     # scale moment: per year and area (in km^2)
     parameters['mr_eq'] = moment.sum() / (
@@ -132,14 +125,11 @@ def updateDataFaultBackgr(cls, feature,
     parameters['mr_activity'] = momentrates_arr.tolist()
     
     # get separate catalogs below and above magnitude threshold
-    cat_below_threshold = QPCatalog.QPCatalog()
-    cat_below_threshold.merge(poly_cat)
-    cat_below_threshold.cut(maxmag=m_threshold, maxmag_excl=True)
+    cat_below_threshold = poly_cat.cutMagnitude(maxmag=m_threshold, 
+        maxmag_exclude=True)
     parameters['eq_count_below'] = cat_below_threshold.size()
         
-    cat_above_threshold = QPCatalog.QPCatalog()
-    cat_above_threshold.merge(poly_cat)
-    cat_above_threshold.cut(minmag=m_threshold, maxmag_excl=False)
+    cat_above_threshold = poly_cat.cutMagnitude(minmag=m_threshold)
     parameters['eq_count_above'] = cat_above_threshold.size()
 
     activity_below_threshold = atticivy.computeActivityAtticIvy(
@@ -189,7 +179,7 @@ def updateDataFaultBackgr(cls, feature,
     
     # FMD from quakes in FBZ
     cls.feature_data_fault_background['fmd'] = fmd.computeZoneFMD(cls, 
-        feature, poly_cat)
+        feature, poly_cat, poly)
     (parameters['ml_a'], parameters['ml_b'], parameters['ml_mc'], 
         parameters['ml_magctr']) = fmd.getFMDValues(
             cls.feature_data_fault_background['fmd'])
@@ -211,7 +201,8 @@ def updateDataFaultBackgr(cls, feature,
     provider_fault.rewind()
     for fault in provider_fault:
         
-        fault_poly, vertices = utils.polygonsQGS2Shapely((fault,))
+        fault_poly, vertices = utils.polygonsQGS2Shapely((fault,), 
+            layer=cls.fault_source_layer)
         if fault_poly[0].intersects(poly):
             
             parameters['fault_count'] += 1
@@ -220,7 +211,8 @@ def updateDataFaultBackgr(cls, feature,
                 fault[attribute_map[sliprate_min_name][0]].toDouble()[0]
             sliprate_max = \
                 fault[attribute_map[sliprate_max_name][0]].toDouble()[0]
-            area_fault = utils.polygonAreaFromWGS84(fault_poly[0])
+            area_fault = utils.getFeatureGeometry(cls.fault_source_layer,
+                fault).area() * 1.0e6
             
             # TODO(fab): correct scaling of moment rate from slip rate
             (rate_min, rate_max) = momentrate.momentrateFromSlipRate(
@@ -238,15 +230,56 @@ def updateDataFaultBackgr(cls, feature,
 
     ## moment rate from geodesy (strain)
     
-    momentrate_strain_barba = momentrate.momentrateFromStrainRateBarba(
-        poly, cls.data.strain_rate_barba, 
-        cls.data.deformation_regimes_bird)
+    momentrate_strain_barba = momentrate.momentrateFromStrainRateGrid(
+        poly, cls.data.strain_grid_barba)
     parameters['mr_strain_barba'] = momentrate_strain_barba / (
         cls.catalog_time_span[0])
 
-    momentrate_strain_bird = momentrate.momentrateFromStrainRateBird(poly, 
-        cls.data.strain_rate_bird, cls.data.deformation_regimes_bird)
+    momentrate_strain_bird = momentrate.momentrateFromStrainRateGrid(
+        poly, cls.data.strain_grid_bird)
     parameters['mr_strain_bird'] = momentrate_strain_bird / (
         cls.catalog_time_span[0])
         
     return parameters
+
+def assignMcdistMmaxFaultBackgr(layer, layer_background):
+    """Write Mmax (area-weighted) and mcdist from background zones as 
+    attributes of all selected features of fault background zone layer,
+    as used by updateDataFaultBackgr() and the AtticIvy computation.
+
+    Input:
+        layer               QGis layer with fault background zones
+        layer_background    QGis layer with background zones
+    """
+
+    zones = layer.selectedFeatures()
+
+    zone_polygons = []
+    for zone in zones:
+        polylist, vertices = utils.polygonsQGS2Shapely((zone,), layer=layer)
+        if len(polylist) == 0:
+            zone_polygons.append(None)
+        else:
+            zone_polygons.append(polylist[0])
+
+    valid_polygons = [poly for poly in zone_polygons if poly is not None]
+    (mcdist, mmax) = areasource.getMcdistMmaxFromBackgroundZones(
+        valid_polygons, layer_background.dataProvider())
+
+    # zones with invalid geometry or outside of background zones are 
+    # skipped
+    values = []
+    valid_idx = 0
+    for poly in zone_polygons:
+        if poly is None:
+            values.append(None)
+            continue
+
+        if mcdist[valid_idx] is None or numpy.isnan(mmax[valid_idx]):
+            values.append(None)
+        else:
+            values.append((float(mmax[valid_idx]), mcdist[valid_idx]))
+        valid_idx += 1
+
+    attributes.writeLayerAttributes(layer, (features.AREA_SOURCE_ATTR_MMAX,
+        features.AREA_SOURCE_ATTR_MCDIST), values)
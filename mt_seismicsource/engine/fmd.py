@@ -32,13 +32,14 @@ from PyQt4.QtGui import *
 from qgis.core import *
 
 import qpfmd
-import QPCatalog
 import qpplot
 
 from mt_seismicsource import features
 from mt_seismicsource import plots
 from mt_seismicsource import utils
 from mt_seismicsource.algorithms import atticivy
+from mt_seismicsource.algorithms import bootstrap
+from mt_seismicsource.algorithms import completeness
 from mt_seismicsource.layers import eqcatalog
 
 MIN_EVENTS_FOR_GR = 50
@@ -48,6 +49,10 @@ FMD_COMPUTE_ANNUAL_RATE = True
 MC_METHODS = (qpfmd.MC_METHODS[1], qpfmd.MC_METHODS[0], qpfmd.MC_METHODS[2])
 MC_DEFAULT = 4.5
 
+# memoized FMD objects, by (catalog revision, zone polygon key, min depth,
+# max depth, Mc, time span, event selection)
+FMD_CACHE = {}
+
 class FMDMulti(qpfmd.FrequencyMagnitudeDistribution):
     """Extended FMD class with multiple G-R fits."""
     
@@ -64,31 +69,85 @@ class FMDMulti(qpfmd.FrequencyMagnitudeDistribution):
         return qpplot.FMDPlotCombinedMulti().plot(imgfile, self.fmd, fits, 
             **kwargs)
             
-def computeZoneFMD(cls, feature, catalog=None):
-    """Compute FMD for selected feature."""
+def computeZoneFMD(cls, feature, catalog=None, polygon=None):
+    """Compute FMD for selected feature. If catalog is given, it has been
+    cut with polygon (default: polygon of feature) and min/max depth from
+    UI spinboxes. FMD objects are memoized (see getZoneFMD())."""
 
-    if catalog is None:
-        # cut catalog to feature
+    if polygon is None:
         polylist, vertices = utils.polygonsQGS2Shapely((feature,))
-        poly = polylist[0]
+        polygon = polylist[0]
     
-        # cut catalog with selected polygon
-        catalog = QPCatalog.QPCatalog()
-        catalog.merge(cls.catalog)
-        catalog.cut(geometry=poly)
-        
-        # cut catalog with min/max depth according to UI spinboxes
-        (mindepth, maxdepth) = eqcatalog.getMinMaxDepth(cls)
-        catalog.cut(mindepth=mindepth, maxdepth=maxdepth)
+    # min/max depth according to UI spinboxes
+    (mindepth, maxdepth) = eqcatalog.getMinMaxDepth(cls)
+
+    return getZoneFMD(cls.catalog, polygon, mindepth, maxdepth, 
+        getMcMethod(cls), cls.catalog_time_span[0], catalog)
+
+def getZoneFMD(catalog, polygon, mindepth=eqcatalog.CUT_DEPTH_MIN, 
+    maxdepth=eqcatalog.CUT_DEPTH_MAX, mc=MC_METHODS[0], time_span=None, 
+    zone_catalog=None, selection=None):
+    """Return FMD of events of catalog in polygon and depth range. The FMD
+    object is taken from the FMD cache, or computed and added to the cache.
+
+    Input:
+        catalog         columnar catalog
+        polygon         Shapely polygon of zone
+        mindepth        min depth of events
+        maxdepth        max depth of events
+        mc              Mc value, or Mc method
+        time_span       catalog time span in years
+        zone_catalog    catalog cut to zone and depth range, if already 
+                        available (otherwise, it is cut from catalog)
+        selection       hashable description of an additional event 
+                        selection applied to zone_catalog (e.g., mcdist of
+                        zone for complete events), part of the cache key
+    """
+
+    key = (catalog.revision, utils.polygonKey(polygon), mindepth, 
+        maxdepth, mc, time_span, selection)
+
+    try:
+        return FMD_CACHE[key]
+    except KeyError:
+        pass
+
+    if zone_catalog is None:
+        zone_catalog = catalog.cutZone(polygon).cutDepth(mindepth, maxdepth)
+
+    FMD_CACHE[key] = computeFMD(zone_catalog, mc, time_span)
+    return FMD_CACHE[key]
+
+def invalidateFMDCache(catalog=None, polygons=None):
+    """Remove FMDs of catalog and/or zone polygons from FMD cache. If
+    neither is given, the cache is cleared. Has to be called when catalog 
+    or zone layers are reloaded or changed."""
+
+    if catalog is None and polygons is None:
+        FMD_CACHE.clear()
+        return
+
+    zone_keys = None
+    if polygons is not None:
+        zone_keys = set([utils.polygonKey(x) for x in polygons])
+
+    for key in FMD_CACHE.keys():
+        if (catalog is None or key[0] == catalog.revision) and (
+            zone_keys is None or key[1] in zone_keys):
+            del FMD_CACHE[key]
 
-    # Mc method
+def computeFMD(catalog, mc=MC_METHODS[0], time_span=None):
+    """Compute FMD for (columnar) catalog, independent of QGis UI."""
+    return FMDMulti(catalog.toQPCatalog().eventParameters, Mc=mc, 
+        minEventsGR=MIN_EVENTS_FOR_GR, time_span=time_span)
+
+def getMcMethod(cls):
+    """Get Mc method, or user-defined Mc value, from UI."""
     if unicode(cls.comboBoxMcMethod.currentText()) == 'userDefined':
         mc = cls.spinboxFMDMcMethod.value()
     else:
         mc = unicode(cls.comboBoxMcMethod.currentText())
-        
-    return FMDMulti(catalog.eventParameters, Mc=mc, 
-        minEventsGR=MIN_EVENTS_FOR_GR, time_span=cls.catalog_time_span[0])
+    return mc
 
 def plotZoneFMD(cls, feature_data, normalize=FMD_COMPUTE_ANNUAL_RATE, 
     title=''):
@@ -144,6 +203,180 @@ def getFMDValues(fmd, normalize=FMD_COMPUTE_ANNUAL_RATE):
 
     return (aValue, fmd.GR['bValue'], fmd.GR['Mmin'], fmd.GR['magCtr'])
 
+class FMDBatch(object):
+    """Binned FMDs of many zones, computed at once from an event-to-zone
+    assignment.
+
+    Attributes:
+        mag_bins        array of magnitude bin centres
+        incremental     (zones x bins) array of incremental event counts
+        cumulative      (zones x bins) array of cumulative event counts
+        mag_sum         (zones x bins) array of sums of event magnitudes
+        mag_sq_sum      (zones x bins) array of sums of squared event 
+                        magnitudes
+        event_cnt       array of event counts per zone
+        mc              array of completeness magnitudes per zone
+        time_span       catalog time span in years
+    """
+
+    def __init__(self, zone_events, magnitude, binsize=qpfmd.DEFAULT_BINSIZE,
+        Mc=MC_METHODS[0], time_span=None):
+
+        self.binsize = binsize
+        self.time_span = time_span
+
+        # events without magnitude (NaN) are not binned
+        magnitude = numpy.asarray(magnitude, dtype=float)
+        zone_events = [numpy.asarray(x, dtype=int) for x in zone_events]
+        zone_events = [x[numpy.isfinite(magnitude[x])] for x in zone_events]
+
+        zone_cnt = len(zone_events)
+        self.event_cnt = numpy.array([x.size for x in zone_events], 
+            dtype=int)
+
+        if self.event_cnt.sum() > 0:
+            events = numpy.concatenate(zone_events).astype(int)
+        else:
+            events = numpy.array([], dtype=int)
+
+        zone_idx = numpy.repeat(numpy.arange(zone_cnt), self.event_cnt)
+        event_mag = magnitude[events]
+
+        # magnitude bins, centred on multiples of binsize
+        if event_mag.size > 0:
+            mag_min = numpy.round(event_mag.min() / binsize) * binsize
+            mag_max = numpy.round(event_mag.max() / binsize) * binsize
+        else:
+            (mag_min, mag_max) = (0.0, 0.0)
+
+        bin_cnt = int(numpy.round((mag_max - mag_min) / binsize)) + 1
+        self.mag_bins = mag_min + binsize * numpy.arange(bin_cnt)
+        
+        bin_idx = numpy.round((event_mag - mag_min) / binsize).astype(int)
+        cell_idx = zone_idx * bin_cnt + bin_idx
+
+        self.incremental = numpy.bincount(cell_idx, 
+            minlength=zone_cnt*bin_cnt).reshape((zone_cnt, bin_cnt))
+        self.cumulative = self.incremental[:, ::-1].cumsum(axis=1)[:, ::-1]
+        self.mag_sum = numpy.bincount(cell_idx, weights=event_mag,
+            minlength=zone_cnt*bin_cnt).reshape((zone_cnt, bin_cnt))
+        self.mag_sq_sum = numpy.bincount(cell_idx, weights=event_mag**2,
+            minlength=zone_cnt*bin_cnt).reshape((zone_cnt, bin_cnt))
+
+        self.mc = self.computeMc(Mc)
+
+    def zoneCount(self):
+        """Number of zones."""
+        return self.event_cnt.size
+
+    def computeMc(self, Mc=MC_METHODS[0]):
+        """Return completeness magnitude per zone. If Mc is a number, it is
+        used for all zones, otherwise Mc is determined with the Mc method 
+        of that name (see completeness.completenessMagnitude()). Zones 
+        without events get NaN. Raises ValueError for unknown Mc methods.
+        """
+
+        try:
+            mc = float(Mc) * numpy.ones(self.zoneCount())
+        except (TypeError, ValueError):
+            mc = completeness.completenessMagnitude(self.incremental, 
+                self.mag_sum, self.mag_bins, self.binsize, Mc)
+
+        mc[self.event_cnt == 0] = numpy.nan
+        return mc
+
+    def maxLikelihoodAB(self, min_events=MIN_EVENTS_FOR_GR,
+        normalize=FMD_COMPUTE_ANNUAL_RATE):
+        """Maximum likelihood a and b values of all zones, from events at
+        or above Mc of each zone (Aki, 1965; Utsu, 1965, with correction
+        for magnitude binning). Uncertainty of b is computed after Shi and
+        Bolt (1982), uncertainty of a by error propagation of the Poisson
+        error of the event count and the uncertainty of b. Zones with less
+        than min_events events at or above Mc get NaN.
+
+        If normalize is True and a time span is set, a values are annual.
+
+        Output:
+            (a, b, sigma_a, sigma_b, mc, event_cnt)
+            event_cnt   array of number of events at or above Mc per zone
+        """
+
+        with numpy.errstate(invalid='ignore', divide='ignore'):
+
+            # Mc rounded to magnitude bin centre
+            mc_bin = numpy.round((self.mc - self.mag_bins[0]) / self.binsize)
+            mc = self.mag_bins[0] + self.binsize * mc_bin
+            above = (numpy.arange(self.mag_bins.size)[numpy.newaxis, :] >= \
+                mc_bin[:, numpy.newaxis])
+
+            event_cnt = (self.incremental * above).sum(axis=1)
+            mag_mean = (self.mag_sum * above).sum(axis=1) / event_cnt
+            mag_sq_dev = numpy.maximum(
+                (self.mag_sq_sum * above).sum(axis=1) - \
+                event_cnt * mag_mean**2, 0.0)
+
+            b = numpy.log10(numpy.e) / (mag_mean - (mc - 0.5 * self.binsize))
+            sigma_b = 2.30 * b**2 * numpy.sqrt(
+                mag_sq_dev / (event_cnt * (event_cnt - 1)))
+
+            if normalize is True and self.time_span is not None:
+                a = numpy.log10(event_cnt / float(self.time_span)) + b * mc
+            else:
+                a = numpy.log10(event_cnt) + b * mc
+            sigma_a = numpy.sqrt(1.0 / (event_cnt * numpy.log(10.0)**2) + \
+                (mc * sigma_b)**2)
+
+        invalid = (event_cnt < max(min_events, 2))
+        for values in (a, b, sigma_a, sigma_b):
+            values[invalid] = numpy.nan
+
+        return (a, b, sigma_a, sigma_b, self.mc, event_cnt)
+
+    def zoneFMD(self, zone_idx):
+        """Return FMD array of zone: rows are magnitude bins, incremental
+        and cumulative counts (same layout as FMDMulti.fmd)."""
+        return numpy.vstack((self.mag_bins, self.incremental[zone_idx], 
+            self.cumulative[zone_idx]))
+
+def computeFMDBatch(zone_events, magnitude, mc=MC_METHODS[0], 
+    time_span=None):
+    """Compute binned FMDs for all zones at once.
+
+    Input:
+        zone_events     list of arrays of catalog event indices, one per zone
+        magnitude       array of magnitudes of all catalog events
+        mc              Mc value, or Mc method (see FMDBatch.computeMc())
+        time_span       catalog time span in years
+    """
+    return FMDBatch(zone_events, numpy.asarray(magnitude, dtype=float), 
+        Mc=mc, time_span=time_span)
+
+def computeBootstrapMcB(zone_events, magnitude, mc=MC_METHODS[0],
+    binsize=qpfmd.DEFAULT_BINSIZE, processes=bootstrap.BOOTSTRAP_PROCESSES):
+    """Compute bootstrap confidence intervals of Mc and maximum likelihood
+    b value for all zones. If mc is a number, Mc is fixed, otherwise it is
+    determined with the Mc method of that name in each sample (see 
+    completeness.completenessMagnitude()).
+
+    Input:
+        zone_events     list of arrays of catalog event indices, one per zone
+        magnitude       array of magnitudes of all catalog events
+        processes       number of worker processes
+
+    Output:
+        (mc_low, mc_high, b_low, b_high), arrays with one value per zone
+    """
+
+    try:
+        mc = float(mc)
+    except (TypeError, ValueError):
+        if mc not in completeness.MC_METHOD_NAMES:
+            raise ValueError, "unknown Mc method: %s" % mc
+
+    magnitude = numpy.asarray(magnitude, dtype=float)
+    return bootstrap.bootstrapMcB([magnitude[x] for x in zone_events], 
+        binsize, mc, processes=processes)
+
 def computeFMDArray(a_value, b_value, mag_arr, timespan=None, area=None):
     
     occurrence = numpy.power(10, (-(b_value * mag_arr) + a_value))
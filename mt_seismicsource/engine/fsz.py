@@ -31,8 +31,6 @@ from PyQt4.QtGui import *
 
 from qgis.core import *
 
-import QPCatalog
-
 from mt_seismicsource import attributes
 from mt_seismicsource import features
 from mt_seismicsource import utils
@@ -78,24 +76,23 @@ def updateDataFault(cls, feature,
         feature_id.toString(), zone_name_str)
         
     # get Shapely polygon from feature geometry
-    polylist, vertices = utils.polygonsQGS2Shapely((feature,))
+    polylist, vertices = utils.polygonsQGS2Shapely((feature,), 
+        layer=cls.fault_source_layer)
     fault_poly = polylist[0]
 
     # fault zone polygon area in square kilometres
-    parameters['area_fault_sqkm'] = utils.polygonAreaFromWGS84(
-        fault_poly) * 1.0e-6
+    parameters['area_fault_sqkm'] = utils.getFeatureGeometry(
+        cls.fault_source_layer, feature).area()
 
     # get buffer zone around fault zone (convert buffer distance to degrees)
     (bz_poly, parameters['area_bz_sqkm']) = utils.computeBufferZone(
         fault_poly, momentrate.BUFFER_AROUND_FAULT_ZONE_KM)
 
-    # find fault background zone in which centroid of fault zone lies
-    # NOTE: this can yield a wrong background zone if the fault zone
-    # is curved and at the edge of background zone.
-    # TODO(fab): use GIS "within" function instead, but note that fault
-    # zone can overlap several BG zones
-    (fbz, fbz_poly, parameters['area_fbz_sqkm']) = utils.findBackgroundZone(
-        fault_poly.centroid, provider_fault_back)
+    # find fault background zone with largest overlap with fault zone
+    (fbz, fbz_poly, parameters['area_fbz_sqkm']) = \
+        utils.findOverlappingZone(fault_poly, provider_fault_back)
+    if fbz is None:
+        return None
 
     recurrence_attributes = attributes.getAttributesFromRecurrence(provider, 
         feature)
@@ -105,12 +102,12 @@ def updateDataFault(cls, feature,
     else:
         return None
     
-    # get mmax and mcdist for FBZ from background zone
-    (mcdist_qv, mmax_qv) = areasource.getAttributesFromBackgroundZones(
-        fbz_poly.centroid, provider_back, areasource.MCDIST_MMAX_ATTRIBUTES)
+    # get mmax (area-weighted) and mcdist for FBZ from background zones
+    (mcdist_bg, mmax_bg) = areasource.getMcdistMmaxFromBackgroundZones(
+        (fbz_poly,), provider_back)
         
-    mmax = float(mmax_qv.toDouble()[0])
-    mcdist = str(mcdist_qv.toString())
+    mmax = float(mmax_bg[0])
+    mcdist = mcdist_bg[0]
     
     parameters['mmax'] = mmax
     
@@ -120,27 +117,16 @@ def updateDataFault(cls, feature,
     # cut catalog with min/max depth according to UI spinboxes
     (mindepth, maxdepth) = eqcatalog.getMinMaxDepth(cls)
     
-    fbz_cat = QPCatalog.QPCatalog()
-    fbz_cat.merge(cls.catalog)
-    fbz_cat.cut(geometry=fbz_poly)
-    fbz_cat.cut(mindepth=mindepth, maxdepth=maxdepth)
-    
-    bz_cat = QPCatalog.QPCatalog()
-    bz_cat.merge(cls.catalog)
-    bz_cat.cut(geometry=bz_poly)
-    bz_cat.cut(mindepth=mindepth, maxdepth=maxdepth)
+    cls.catalog.zoneMembership(cls.fault_background_layer)
+    fbz_cat = cls.catalog.cutZone(fbz_poly).cutDepth(mindepth, maxdepth)
+    bz_cat = cls.catalog.cutZone(bz_poly).cutDepth(mindepth, maxdepth)
     
     parameters['eq_count_fbz'] = fbz_cat.size()
     parameters['eq_count_bz'] = bz_cat.size()
     
     # sum up moment from quakes (converted from Mw with Kanamori eq.)
     # use quakes in buffer zone
-    magnitudes = []
-    for ev in bz_cat.eventParameters.event:
-        mag = ev.getPreferredMagnitude()
-        magnitudes.append(mag.mag.value)
-
-    moment = numpy.array(momentrate.magnitude2moment(magnitudes))
+    moment = numpy.array(momentrate.magnitude2moment(bz_cat.magnitude))
 
     # scale moment: per year and area (in km^2)
     parameters['mr_eq'] = moment.sum() / (
@@ -181,7 +167,7 @@ def updateDataFault(cls, feature,
 
     # FMD from quakes in FBZ
     cls.feature_data_fault_source['fmd'] = fmd.computeZoneFMD(cls, feature, 
-        fbz_cat)
+        fbz_cat, fbz_poly)
     (parameters['ml_a'], parameters['ml_b'], parameters['ml_mc'], 
         parameters['ml_magctr']) = fmd.getFMDValues(
             cls.feature_data_fault_source['fmd'])
@@ -197,3 +183,72 @@ def updateDataFault(cls, feature,
     parameters['mr_slip'] = [moment_rate_min, moment_rate_max]
     
     return parameters
+
+def assignMaxLikelihoodFault(layer_fault, layer_fault_background, catalog, 
+    mindepth=eqcatalog.CUT_DEPTH_MIN, maxdepth=eqcatalog.CUT_DEPTH_MAX, 
+    mc=fmd.MC_METHODS[0], ui_mode=True):
+    """Compute maximum likelihood a and b values for all selected features
+    of fault source layer at once, from the quakes in their fault 
+    background zones, and write a, b, Mc, and the standard deviations
+    of a and b as attributes.
+
+    Input:
+        layer_fault             QGis layer with fault zone features
+        layer_fault_background  QGis layer with fault background zone 
+                                features
+        catalog                 earthquake catalog as ColumnarCatalog object
+        mc                      Mc value, or Mc method
+
+    Output:
+        list of (a, b, Mc, sigma_a, sigma_b) per selected feature (None 
+        for features without fault background zone)
+    """
+
+    provider_fault_back = layer_fault_background.dataProvider()
+
+    # event-to-zone table for all fault background zones
+    catalog.zoneMembership(layer_fault_background)
+    depth_selected = catalog.depthMask(mindepth, maxdepth)
+
+    fts = layer_fault.selectedFeatures()
+
+    # fault background zone with largest overlap, for all faults at once
+    fault_polygons = []
+    fault_indices = []
+    for fault_idx, fault in enumerate(fts):
+        geometry = utils.getFeatureGeometry(layer_fault, fault)
+        if geometry is not None:
+            fault_polygons.append(geometry.polygon)
+            fault_indices.append(fault_idx)
+
+    weights = utils.getOverlapWeights(fault_polygons, provider_fault_back)
+
+    fbz_indices = -numpy.ones(len(fts), dtype=int)
+    fbz_indices[fault_indices] = weights.dominantZones()
+
+    zone_events = []
+    for fbz_idx in fbz_indices:
+        if fbz_idx < 0:
+            zone_events.append(None)
+            continue
+
+        events = catalog.zoneEvents(weights.zone_index.polygons[fbz_idx])
+        zone_events.append(events[depth_selected[events]])
+
+    (a, b, sigma_a, sigma_b, mc_zone, event_cnt) = fmd.computeFMDBatch(
+        [numpy.array([], dtype=int) if x is None else x for x in zone_events],
+        catalog.magnitude, mc, catalog.timeSpan()[0]).maxLikelihoodAB()
+
+    activity = []
+    for zone_idx, events in enumerate(zone_events):
+        if events is None:
+            activity.append(None)
+        else:
+            activity.append((a[zone_idx], b[zone_idx], mc_zone[zone_idx], 
+                sigma_a[zone_idx], sigma_b[zone_idx]))
+
+    # same order as in features.FAULT_SOURCE_ATTRIBUTES_AB_ML
+    attributes.writeLayerAttributes(layer_fault, 
+        features.FAULT_SOURCE_ATTRIBUTES_AB_ML, activity)
+
+    return activity
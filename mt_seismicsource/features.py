@@ -74,8 +74,30 @@ AREA_SOURCE_ATTRIBUTES_MC = (AREA_SOURCE_ATTR_MC, AREA_SOURCE_ATTR_MC_METHOD,
 # a/b maximum likelihood
 AREA_SOURCE_ATTR_A_ML = {'name': 'a_ml', 'type': QVariant.Double}
 AREA_SOURCE_ATTR_B_ML = {'name': 'b_ml', 'type': QVariant.Double}
+AREA_SOURCE_ATTR_MC_ML = {'name': 'mc_ml', 'type': QVariant.Double}
+AREA_SOURCE_ATTR_SIGMA_A_ML = {'name': 'sigma_a_ml', 'type': QVariant.Double}
+AREA_SOURCE_ATTR_SIGMA_B_ML = {'name': 'sigma_b_ml', 'type': QVariant.Double}
 
-AREA_SOURCE_ATTRIBUTES_AB_ML = (AREA_SOURCE_ATTR_A_ML, AREA_SOURCE_ATTR_B_ML)
+AREA_SOURCE_ATTRIBUTES_AB_ML = (AREA_SOURCE_ATTR_A_ML, AREA_SOURCE_ATTR_B_ML,
+    AREA_SOURCE_ATTR_MC_ML, AREA_SOURCE_ATTR_SIGMA_A_ML, 
+    AREA_SOURCE_ATTR_SIGMA_B_ML)
+
+# bootstrap confidence intervals of Mc and b (maximum likelihood)
+AREA_SOURCE_ATTR_MC_ML_LO = {'name': 'mc_ml_lo', 'type': QVariant.Double}
+AREA_SOURCE_ATTR_MC_ML_HI = {'name': 'mc_ml_hi', 'type': QVariant.Double}
+AREA_SOURCE_ATTR_B_ML_LO = {'name': 'b_ml_lo', 'type': QVariant.Double}
+AREA_SOURCE_ATTR_B_ML_HI = {'name': 'b_ml_hi', 'type': QVariant.Double}
+
+AREA_SOURCE_ATTRIBUTES_AB_ML_CI = (AREA_SOURCE_ATTR_MC_ML_LO, 
+    AREA_SOURCE_ATTR_MC_ML_HI, AREA_SOURCE_ATTR_B_ML_LO, 
+    AREA_SOURCE_ATTR_B_ML_HI)
+
+# a/b from Weichert's method, with completeness periods from mcdist
+AREA_SOURCE_ATTR_A_WEI = {'name': 'a_wei', 'type': QVariant.Double}
+AREA_SOURCE_ATTR_B_WEI = {'name': 'b_wei', 'type': QVariant.Double}
+
+AREA_SOURCE_ATTRIBUTES_AB_WEICHERT = (AREA_SOURCE_ATTR_A_WEI, 
+    AREA_SOURCE_ATTR_B_WEI)
 
 # a/b according to Roger Musson's AtticIvy
 AREA_SOURCE_ATTR_A_RM = {'name': 'a_rm', 'type': QVariant.Double}
@@ -106,6 +128,8 @@ AREA_SOURCE_ATTRIBUTES_ALL = (
     AREA_SOURCE_ATTRIBUTES_MINMAXMAG, 
     AREA_SOURCE_ATTRIBUTES_MC, 
     AREA_SOURCE_ATTRIBUTES_AB_ML,
+    AREA_SOURCE_ATTRIBUTES_AB_ML_CI,
+    AREA_SOURCE_ATTRIBUTES_AB_WEICHERT,
     AREA_SOURCE_ATTRIBUTES_AB_RM,
     AREA_SOURCE_ATTRIBUTES_MOMENTRATE)
 
@@ -187,6 +211,14 @@ FAULT_SOURCE_ATTR_ACT_FBZ_AT_B = {'name': 'afbz_at_b', 'type': QVariant.String,
 FAULT_SOURCE_ATTR_A_ML = {'name': 'a_ml', 'type': QVariant.Double}
 FAULT_SOURCE_ATTR_B_ML = {'name': 'b_ml', 'type': QVariant.Double}
 FAULT_SOURCE_ATTR_MC_ML = {'name': 'mc_ml', 'type': QVariant.Double}
+FAULT_SOURCE_ATTR_SIGMA_A_ML = {'name': 'sigma_a_ml', 
+    'type': QVariant.Double}
+FAULT_SOURCE_ATTR_SIGMA_B_ML = {'name': 'sigma_b_ml', 
+    'type': QVariant.Double}
+
+FAULT_SOURCE_ATTRIBUTES_AB_ML = (FAULT_SOURCE_ATTR_A_ML, 
+    FAULT_SOURCE_ATTR_B_ML, FAULT_SOURCE_ATTR_MC_ML, 
+    FAULT_SOURCE_ATTR_SIGMA_A_ML, FAULT_SOURCE_ATTR_SIGMA_B_ML)
 
 FAULT_SOURCE_ATTR_MMAX_BG = {'name': 'mmax_bg', 'type': QVariant.Double}
 
@@ -24,6 +24,7 @@ Author: Fabian Euchner, fabian@sed.ethz.ch
 #    59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.             #
 ############################################################################
 
+import numpy
 import os
 import shapely.geometry
 
@@ -148,7 +149,10 @@ def assignMmaxfromMelettiDataset(layer, mmax_data):
 
 def assignAttributesFromBackgroundZones(layer, background_layer, 
     attributes_in, ui_mode=True):
-    """Copy attributes from background zone layer."""
+    """Copy attributes from background zone layer. Each zone gets the 
+    attributes of the background zone with the largest overlap, found for
+    all zones at once (see utils.getOverlapWeights()), and all attribute 
+    values are written at once."""
     
     provider = layer.dataProvider()
     provider_back = background_layer.dataProvider()
@@ -157,41 +161,37 @@ def assignAttributesFromBackgroundZones(layer, background_layer,
     for attribute_list in features.AREA_SOURCE_ATTRIBUTES_ALL:
         utils.getAttributeIndex(provider, attribute_list, create=True)
 
-    values = {}
     attribute_map = utils.getAttributeIndex(provider, attributes_in)
+    attribute_map_back = utils.getAttributeIndex(provider_back, attributes_in)
 
+    zone_ids = []
+    polygons = []
     provider.select()
     provider.rewind()
     for zone_idx, zone in utils.walkValidPolygonFeatures(provider):
+        zone_ids.append(zone.id())
+        polygons.append(utils.getFeatureGeometry(layer, zone).polygon)
 
-        attributes = {}
-        skipZone = False
-
-        # get mmax and mcdist from background zones
-        polygon, vertices = utils.polygonsQGS2Shapely((zone,))
-        centroid = polygon[0].centroid
-        copy_attr = getAttributesFromBackgroundZones(centroid,
-            provider_back, attributes_in, ui_mode=ui_mode)
-
-        for attr_idx, attr_dict in enumerate(attributes_in):
-            (curr_idx, curr_type) = attribute_map[attr_dict['name']]
-
-            # if one of the attribute values is None, skip zone
-            if copy_attr[attr_idx] is None:
-                skipZone = True
-                break
-                
-            try:
-                # attributes are of type QVariant
-                attributes[curr_idx] = copy_attr[attr_idx]
-            except Exception, e:
-                error_str = \
-        "error in attribute: curr_idx: %s, zone_idx: %s, attr_idx: %s, %s" % (
-                    curr_idx, zone_idx, attr_idx, e)
-                raise RuntimeError, error_str
-        
-        if skipZone is False:
-            values[zone.id()] = attributes
+    # background zone with largest overlap of each zone
+    weights = utils.getOverlapWeights(polygons, provider_back)
+    background_idx = weights.dominantZones()
+
+    background_zones = {}
+    values = {}
+    for zone_id, bgz_idx in zip(zone_ids, background_idx):
+
+        # skip zones outside of background zones
+        if bgz_idx < 0:
+            continue
+
+        if bgz_idx not in background_zones:
+            background_zones[bgz_idx] = weights.zone_index.feature(bgz_idx)
+        background_zone = background_zones[bgz_idx]
+
+        # attributes are of type QVariant
+        values[zone_id] = dict([(attribute_map[x['name']][0], 
+            background_zone[attribute_map_back[x['name']][0]]) \
+                for x in attributes_in])
 
     try:
         provider.changeAttributeValues(values)
@@ -221,6 +221,47 @@ def getAttributesFromBackgroundZones(point, provider_back, attributes,
 
     return background_attrs
 
+def getMcdistMmaxFromBackgroundZones(polygons, provider_back):
+    """Get completeness history (mcdist) and Mmax for Shapely polygons from
+    the background zones they overlap. Mmax is the area-weighted mean of 
+    Mmax of all overlapping background zones, mcdist is taken from the 
+    background zone with the largest overlap.
+
+    Output:
+        (mcdist, mmax)
+        mcdist      list of mcdist strings, None for polygons that overlap
+                    no background zone
+        mmax        array of Mmax values, NaN for polygons that overlap
+                    no background zone
+    """
+
+    attribute_map = utils.getAttributeIndex(provider_back, 
+        MCDIST_MMAX_ATTRIBUTES, create=False)
+    mcdist_idx = attribute_map[features.AREA_SOURCE_ATTR_MCDIST['name']][0]
+    mmax_idx = attribute_map[features.AREA_SOURCE_ATTR_MMAX['name']][0]
+
+    weights = utils.getOverlapWeights(polygons, provider_back)
+
+    # current attributes of background zones overlapped by polygons
+    background_zones = dict([(zone_idx, weights.zone_index.feature(
+        zone_idx)) for zone_idx in numpy.unique(weights.zones)])
+
+    zone_mmax = numpy.ones(len(weights.zone_index.polygons)) * numpy.nan
+    for zone_idx, zone in background_zones.items():
+        (value, ok) = zone[mmax_idx].toDouble()
+        if ok:
+            zone_mmax[zone_idx] = value
+
+    mcdist = []
+    for zone_idx in weights.dominantZones():
+        if zone_idx < 0:
+            mcdist.append(None)
+        else:
+            mcdist.append(str(background_zones[zone_idx][
+                mcdist_idx].toString()))
+
+    return (mcdist, weights.weightedMean(zone_mmax))
+
 def _checkAreaSourceLayer(layer, ui_mode=True):
     """Check if features in area source layer are without errors.
 
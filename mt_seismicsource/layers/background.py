@@ -24,7 +24,8 @@ Author: Fabian Euchner, fabian@sed.ethz.ch
 #    59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.             #
 ############################################################################
 
-import csv
+import cPickle
+import numpy
 import os
 
 from PyQt4.QtCore import *
@@ -37,6 +38,7 @@ import QPCatalog
 from mt_seismicsource import layers
 from mt_seismicsource import utils
 
+from mt_seismicsource.layers import eqcatalog
 from mt_seismicsource.layers import render
 
 BACKGROUND_DIR = 'background_zones'
@@ -45,6 +47,11 @@ BACKGROUND_ZONES_COMPLETENESS_FILE = 'background-zones-completeness.dat'
 
 TEMP_FILENAME = 'background-zones.shp'
 
+# binary cache of parsed zone files, in subdirectory of zone file directory
+BACKGROUND_CACHE_DIR = 'cache'
+BACKGROUND_CACHE_VERSION = 1
+BACKGROUND_CACHE_SUFFIX = '.pickle'
+
 def loadBackgroundZoneLayer(cls):
     """Load layer of background zones with completeness history and
     Mmax from ASCII files. 
@@ -89,13 +96,16 @@ def loadBackgroundZoneFromFile(background_mmax_path,
     Mmax from ASCII files, independent of QGis UI. 
     """
     
-    # read data dicts from files (coordinates from mmax file)
-    background_mmax = readBackgroundMmax(background_mmax_path, ui_mode=ui_mode)
-    #QMessageBox.information(None, "Mmax", "%s" % background_mmax)
+    # read zone arrays from files (coordinates from mmax file)
+    background_mmax = readBackgroundMmax(background_mmax_path, 
+        ui_mode=ui_mode)
 
     background_completeness = readBackgroundCompleteness(
         background_completeness_path, ui_mode=ui_mode)
-    #QMessageBox.information(None, "Mc", "%s" % background_completeness)
+
+    # index of zone IDs in completeness file
+    completeness_idx = dict([(zone_id, zone_idx) for zone_idx, zone_id in \
+        enumerate(background_completeness['ID'])])
    
     # PostGIS SRID 4326 is allocated for WGS84
     crs = QgsCoordinateReferenceSystem(4326, 
@@ -112,19 +122,30 @@ def loadBackgroundZoneFromFile(background_mmax_path,
                       QgsField("mmax", QVariant.Double),
                       QgsField("mcdist", QVariant.String)])
 
-    # add zones as features
-    for zone_id, zone in background_mmax.items():
+    # add zones as features, in one call to provider
+    ring_offsets = background_mmax['ring_offsets']
+    feature_list = []
+    for zone_idx, zone_id in enumerate(background_mmax['ID']):
 
         f = QgsFeature()
 
-        poly = [QgsPoint(x, y) for (x, y) in zone['coord']]
+        poly = [QgsPoint(float(x), float(y)) for (x, y) in \
+            background_mmax['coord'][
+                ring_offsets[zone_idx]:ring_offsets[zone_idx+1]]]
+
+        # close ring with first coord pair
+        if len(poly) > 0:
+            poly.append(poly[0])
         f.setGeometry(QgsGeometry.fromPolygon([poly]))
         
         f[0] = QVariant(zone_id)
-        f[1] = QVariant(zone['mmax'])
-        f[2] = QVariant(background_completeness[zone_id]['mcdist'])
+        f[1] = QVariant(float(background_mmax['mmax'][zone_idx]))
+        f[2] = QVariant(background_completeness['mcdist'][
+            completeness_idx[zone_id]])
+
+        feature_list.append(f)
 
-        pr.addFeatures([f])
+    pr.addFeatures(feature_list)
 
     # write memory layer to disk (as a Shapefile)
     if layer2file is True:
@@ -132,174 +153,178 @@ def loadBackgroundZoneFromFile(background_mmax_path,
 
     return layer
 
-def readBackgroundMmax(path, ui_mode=True):
+def readBackgroundMmax(path, use_cache=True, ui_mode=True):
     """Load geometry and Mmax of background zones from ASCII file.
 
     Output:
-        ID
-        coord
-        mmax
+        dict with
+        ID              list of zone IDs
+        ring_offsets    array of start offsets of zone rings in coord
+        coord           (vertices x 2) array of (lon, lat)
+        mmax            array of Mmax values (NaN if missing)
     """
 
-    fileStartMode = True
-    zones = {}
+    zones = readZoneFile(path, use_cache, ui_mode=ui_mode)
 
-    # open file for reading
-    with open(path, 'r') as fh:
-
-        zoneStartMode = False
-        coordLineMode = False
-        dataLineStartMode = False
-        dataLineMode = False
+    # data lines have Mmax and weight, there is always one data line
+    # per zone, use only Mmax
+    has_data = (numpy.diff(zones['data_offsets']) > 0)
+    mmax = numpy.ones(len(zones['ID'])) * numpy.nan
+    mmax[has_data] = zones['data'][zones['data_offsets'][:-1][has_data], 0]
 
-        # loop over zones
-        for line in fh:
-        
-            # ignore blank lines
-            if len(line.strip()) == 0:
-                continue
-
-            elif fileStartMode is True:
-                zone_count = int(line.strip())
-                zone_idx = 0
-                fileStartMode = False
-                zoneStartMode = True
-
-            elif zoneStartMode is True:
-
-                zone_idx += 1
-                line_arr = line.strip().split(',')
-                zone_id = line_arr[0].strip()
-                coord_count = int(line_arr[1])
-
-                coord = []
-                coord_idx = 0
-                zoneStartMode = False
-                coordLineMode = True
-
-            elif coordLineMode is True:
-
-                coord_idx += 1
-                line_arr = line.strip().split(',')
-
-                # zone file has coords in lat, lon order
-                coord.append((float(line_arr[1].strip()), 
-                    float(line_arr[0].strip())))
-
-                if coord_idx == coord_count:
-                
-                    # copy first coord pair
-                    coord.append(coord[-1])
-                    coordLineMode = False
-                    dataLineStartMode = True
-
-            elif dataLineStartMode is True:
-
-                # line contains no. of Mmax values and weights
-                # it's always 1, so safe to ignore
-                dataLineStartMode = False
-                dataLineMode = True
-        
-            elif dataLineMode is True:
+    return {'ID': zones['ID'], 'ring_offsets': zones['ring_offsets'], 
+        'coord': zones['coord'], 'mmax': mmax}
 
-                line_arr = line.strip().split()
-
-                # line has Mmax and weight, use only Mmax
-                zones[zone_id] = {'coord': coord,
-                    'mmax': float(line_arr[0].strip())}
-
-                dataLineMode = False
-                zoneStartMode = True
-
-    if zone_idx != zone_count:
-        error_msg = \
-            "Zone count mismatch in zone file %s: found %s, expected %s" % (
-                path, zone_idx, zone_count)
-        if ui_mode is True:
-            QMessageBox.warning(None, "Zone count", error_msg)
-        else:
-            print error_msg
-            
-    return zones
-
-def readBackgroundCompleteness(path, ui_mode=True):
+def readBackgroundCompleteness(path, use_cache=True, ui_mode=True):
     """Load completeness history for background zones from CSV file.
 
     Output:
-        ID
-        mcdist
+        dict with
+        ID              list of zone IDs
+        period_offsets  array of start offsets of zone periods in periods
+        periods         (periods x 2) array of (Mc, year)
+        mcdist          list of mcdist strings
     """
 
-    fileStartMode = True
-    completeness = {}
+    zones = readZoneFile(path, use_cache, ui_mode=ui_mode)
 
-    # open file for reading
-    with open(path, 'r') as fh:
+    offsets = zones['data_offsets']
+    periods = zones['data']
 
-        zoneStartMode = False
-        coordLineMode = False
-        dataLineStartMode = False
-        dataLineMode = False
+    mcdist = []
+    for zone_idx in xrange(len(zones['ID'])):
+        mcdist.append(' '.join(["%s %s" % (float(mc), int(year)) for \
+            (mc, year) in periods[offsets[zone_idx]:offsets[zone_idx+1]]]))
 
-        # loop over zones
-        for line in fh:
-        
-            # ignore blank lines
-            if len(line.strip()) == 0:
-                continue
+    return {'ID': zones['ID'], 'period_offsets': offsets, 
+        'periods': periods, 'mcdist': mcdist}
 
-            elif fileStartMode is True:
-                zone_count = int(line.strip())
-                zone_idx = 0
-                fileStartMode = False
-                zoneStartMode = True
+def readZoneFile(path, use_cache=True, ui_mode=True):
+    """Read zone file, or its binary cache if it is valid for the contents
+    of the zone file (see parseZoneFile()). If use_cache is True, the cache
+    is (re-)written if it is not valid."""
 
-            elif zoneStartMode is True:
+    cache_path = os.path.join(os.path.dirname(path), BACKGROUND_CACHE_DIR,
+        os.path.basename(path) + BACKGROUND_CACHE_SUFFIX)
 
-                zone_idx += 1
-                line_arr = line.strip().split(',')
-                zone_id = line_arr[0].strip()
-                coord_count = int(line_arr[1])
+    if use_cache is True:
+        file_hash = eqcatalog.fileHash(path)
+        try:
+            with open(cache_path, 'rb') as fh:
+                cache = cPickle.load(fh)
 
-                coord_idx = 0
-                zoneStartMode = False
-                coordLineMode = True
+            if cache['version'] == BACKGROUND_CACHE_VERSION and \
+                cache['sha1'] == file_hash:
+                return cache['zones']
 
-            elif coordLineMode is True:
+        except (IOError, OSError, EOFError, KeyError, 
+            cPickle.UnpicklingError):
+            pass
 
-                coord_idx += 1
+    zones = parseZoneFile(path, ui_mode=ui_mode)
 
-                if coord_idx == coord_count:
-                    coordLineMode = False
-                    dataLineStartMode = True
+    if use_cache is True:
+        try:
+            cache_dir = os.path.dirname(cache_path)
+            if not os.path.isdir(cache_dir):
+                os.makedirs(cache_dir)
 
-            elif dataLineStartMode is True:
+            with open(cache_path, 'wb') as fh:
+                cPickle.dump({'version': BACKGROUND_CACHE_VERSION, 
+                    'sha1': file_hash, 'zones': zones}, fh, 
+                    cPickle.HIGHEST_PROTOCOL)
 
-                mc_count = int(line.strip())
-                mc_idx = 0
-                zone_mchist = ""
-                dataLineStartMode = False
-                dataLineMode = True
-        
-            elif dataLineMode is True:
+        except (IOError, OSError), e:
+            print "Could not write zone file cache %s: %s" % (cache_path, e)
 
-                line_arr = line.strip().split()
-                mc_idx += 1
-                zone_mchist = "%s %s %s" % (zone_mchist, 
-                    float(line_arr[0].strip()), int(line_arr[1].strip()))
+    return zones
+
+def parseZoneFile(path, ui_mode=True):
+    """Parse zone file in one pass. A zone file starts with the number of
+    zones. For each zone, there is a line with zone ID and number of 
+    vertices, the vertex lines (lat, lon), a line with the number of data
+    lines, and the data lines (two values each). Only the header lines are 
+    visited per zone, vertices and data values of all zones are converted
+    to arrays at once.
 
-                if mc_idx == mc_count:
-                    completeness[zone_id] = {'mcdist': zone_mchist.lstrip()}
-                    dataLineMode = False
-                    zoneStartMode = True
+    Output:
+        dict with
+        ID              list of zone IDs
+        ring_offsets    array of start offsets of zone rings in coord
+        coord           (vertices x 2) array of (lon, lat)
+        data_offsets    array of start offsets of zone data in data
+        data            (data lines x 2) array
+    """
 
-    if mc_idx != mc_count:
+    with open(path, 'r') as fh:
+        lines = [x for x in (y.strip() for y in fh) if len(x) > 0]
+
+    zone_ids = []
+    coord_lines = []
+    data_lines = []
+    coord_counts = []
+    data_counts = []
+
+    try:
+        zone_count = int(lines[0])
+    except (IndexError, ValueError):
+        zone_count = 0
+
+    line_idx = 1
+    while len(zone_ids) < zone_count:
+        try:
+            line_arr = lines[line_idx].split(',')
+            coord_count = int(line_arr[1])
+            data_count = int(lines[line_idx + coord_count + 1])
+        except (IndexError, ValueError):
+            break
+
+        coord_start = line_idx + 1
+        data_start = coord_start + coord_count + 1
+        line_idx = data_start + data_count
+
+        if line_idx > len(lines):
+            break
+
+        zone_ids.append(line_arr[0].strip())
+        coord_lines.extend(lines[coord_start:coord_start + coord_count])
+        data_lines.extend(lines[data_start:line_idx])
+        coord_counts.append(coord_count)
+        data_counts.append(data_count)
+
+    if len(zone_ids) != zone_count:
         error_msg = \
             "Zone count mismatch in zone file %s: found %s, expected %s" % (
-                path, mc_idx, mc_count)
+                path, len(zone_ids), zone_count)
         if ui_mode is True:
             QMessageBox.warning(None, "Zone count", error_msg)
         else:
             print error_msg
-        
-    return completeness
+
+    # zone file has coords in lat, lon order
+    coord = _parseValuePairs(coord_lines, ',')[:, ::-1].copy()
+    data = _parseValuePairs(data_lines)
+
+    return {'ID': zone_ids, 
+        'ring_offsets': numpy.cumsum([0] + coord_counts), 'coord': coord, 
+        'data_offsets': numpy.cumsum([0] + data_counts), 'data': data}
+
+def _parseValuePairs(lines, separator=None):
+    """Convert lines with two numbers each to (lines x 2) array. All lines
+    are converted at once, lines are only split separately if some line
+    does not have exactly two numbers. Then, further numbers are ignored,
+    and a missing second number is NaN."""
+
+    text = ' '.join(lines)
+    if separator is not None:
+        text = text.replace(separator, ' ')
+
+    values = numpy.fromstring(text, dtype=float, sep=' ')
+    if values.size != 2 * len(lines):
+        values = numpy.nan * numpy.ones((len(lines), 2))
+        for line_idx, line in enumerate(lines):
+            line_arr = line.split(separator)
+            for value_idx in xrange(min(len(line_arr), 2)):
+                values[line_idx, value_idx] = float(line_arr[value_idx])
+
+    return values.reshape((-1, 2))
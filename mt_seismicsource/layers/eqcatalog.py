@@ -24,6 +24,13 @@ Author: Fabian Euchner, fabian@sed.ethz.ch
 #    59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.             #
 ############################################################################
 
+import collections
+import copy
+import cPickle
+import datetime
+import gzip
+import hashlib
+import itertools
 import numpy
 import os
 
@@ -38,6 +45,8 @@ from mt_seismicsource import layers
 from mt_seismicsource import features
 from mt_seismicsource import utils
 
+from mt_seismicsource.algorithms import decluster
+from mt_seismicsource.algorithms import spatial
 from mt_seismicsource.layers import render
 
 CATALOG_DIR = 'eq_catalog'
@@ -47,11 +56,36 @@ CATALOG_FILES = ('SHEEC-declustered-2011-05-30.zmap.dat.gz',)
 CUT_DEPTH_MIN = 0.0
 CUT_DEPTH_MAX = 999.0
 
+# events below this magnitude are removed on catalog load
+CATALOG_MINMAG = 2.0
+
+# revision numbers of catalog contents, used as key of results computed
+# from catalogs
+CATALOG_REVISION = itertools.count()
+
+# binary cache of loaded catalogs, in subdirectory of catalog file directory
+CATALOG_CACHE_DIR = 'cache'
+CATALOG_CACHE_VERSION = 1
+CATALOG_CACHE_ARRAY_SUFFIX = '.npy'
+CATALOG_CACHE_METADATA_SUFFIX = '.meta'
+
+# number of features added to EQ catalog layer in one provider call
+LAYER_INSERT_CHUNK_SIZE = 10000
+
+# maximum number of event-to-zone tables kept per catalog, least recently
+# used tables are dropped first
+MAX_ZONE_MEMBERSHIP_CNT = 8
+
+# number of lines parsed at once when reading ZMAP files
+ZMAP_READ_CHUNK_SIZE = 100000
+
+# ZMAP columns: lon, lat, decimal year, month, day, magnitude, depth, hour, 
+# minute, and (optional) second
+ZMAP_COLUMN_CNT = 10
+
 def loadEQCatalogLayer(cls):
     """Load EQ catalog layer from ASCII catalog file. 
     Add required feature attributes if they are missing.
-
-    TODO(fab): load catalog from Python pickle of compact catalog format.
     """
     catalog_path = os.path.join(layers.DATA_DIR, CATALOG_DIR, 
         unicode(cls.comboBoxEQCatalogInput.currentText()))
@@ -60,7 +94,12 @@ def loadEQCatalogLayer(cls):
         utils.warning_missing_layer_file(catalog_path)
         return
 
-    (layer, cls.catalog) = loadEQCatalogFromFile(catalog_path)
+    (layer, cls.catalog) = loadEQCatalogFromFile(catalog_path, 
+        progress_callback=lambda inserted_cnt, event_cnt: \
+            cls.iface.mainWindow().statusBar().showMessage(
+                "Loading EQ catalog: %s of %s events" % (
+                    inserted_cnt, event_cnt)))
+    cls.iface.mainWindow().statusBar().clearMessage()
 
     # set time span of catalog
     cls.catalog_time_span = cls.catalog.timeSpan()
@@ -76,25 +115,48 @@ def loadEQCatalogLayer(cls):
         
     return layer
 
-def loadEQCatalogFromFile(catalog_path):
+def loadEQCatalogFromFile(catalog_path, use_cache=True, create_layer=True,
+    chunk_size=LAYER_INSERT_CHUNK_SIZE, progress_callback=None, 
+    decluster_catalog=False):
     """Load EQ catalog layer from ASCII catalog file, independent of 
-    QGis UI.
+    QGis UI. Returns layer and catalog in columnar representation.
+
+    If use_cache is True, the catalog is read from the binary cache if it
+    is valid for the catalog file, otherwise the cache is (re-)written.
+    If create_layer is False (headless mode), no layer is built and None
+    is returned instead. chunk_size and progress_callback are passed on to
+    createEQCatalogLayer(). If decluster_catalog is True, aftershocks are
+    removed (see ColumnarCatalog.decluster()). Foreshocks are kept, since
+    decluster.FORESHOCK_TIME_FRACTION is zero.
     """
     
-    catalog = QPCatalog.QPCatalog()
+    catalog = None
+    if use_cache is True:
+        catalog = loadCatalogCache(catalog_path)
 
-    if catalog_path.endswith('.gz'):
-        catalog.importZMAP(catalog_path, minimumDataset=True,
-            compression='gz')
+    if catalog is None:
+        catalog = readZMAPCatalog(catalog_path)
+        if use_cache is True:
+            writeCatalogCache(catalog, catalog_path)
+
+    if decluster_catalog is True:
+        catalog = catalog.decluster()
+
+    catalog.buildSpatialIndex()
+
+    if create_layer is True:
+        layer = createEQCatalogLayer(catalog, chunk_size, progress_callback)
     else:
-        catalog.importZMAP(catalog_path, minimumDataset=True)
+        layer = None
 
-    # cut catalog to years > 1900 (because of datetime)
-    # TODO(fab): change the datetime lib to mx.DateTime
-    # catalog.cut(mintime='1900-01-01', mintime_exclude=True)
-    
-    # cut catalog below M=2.0 and remove potential NaN magnitudes
-    catalog.cut(minmag=2.0, minmag_exclude=False, removeNaN=True)
+    return (layer, catalog)
+
+def createEQCatalogLayer(catalog, chunk_size=LAYER_INSERT_CHUNK_SIZE, 
+    progress_callback=None):
+    """Create memory point layer from columnar catalog. Features are added
+    to the provider in chunks of chunk_size. After each chunk, 
+    progress_callback (if given) is called with the number of events 
+    processed so far and the total number of events."""
 
     # PostGIS SRID 4326 is allocated for WGS84
     crs = QgsCoordinateReferenceSystem(4326, 
@@ -109,32 +171,286 @@ def loadEQCatalogFromFile(catalog_path):
     pr.addAttributes([QgsField("magnitude", QVariant.Double),
                       QgsField("depth",  QVariant.Double)])
 
-    # add EQs as features
-    for curr_event in catalog.eventParameters.event:
-        curr_ori = curr_event.getPreferredOrigin()
-
-        # skip events without magnitude
-        try:
-            curr_mag = curr_event.getPreferredMagnitude()
-        except IndexError:
-            continue
-
-        curr_lon = curr_ori.longitude.value
-        curr_lat = curr_ori.latitude.value
-        magnitude = curr_mag.mag.value
-
-        try:
-            depth = curr_ori.depth.value
-        except AttributeError:
-            depth = numpy.nan
-
-        f = QgsFeature()
-        f.setGeometry(QgsGeometry.fromPoint(QgsPoint(curr_lon, curr_lat)))
-        f[0] = QVariant(magnitude)
-        f[1] = QVariant(depth)
-        pr.addFeatures([f])
-        
-    return (layer, catalog)
+    addEQCatalogFeatures(layer, catalog, chunk_size, progress_callback)
+
+    return layer
+
+def addEQCatalogFeatures(layer, catalog, chunk_size=LAYER_INSERT_CHUNK_SIZE,
+    progress_callback=None):
+    """Add events of columnar catalog as point features to EQ catalog 
+    layer, in chunks of chunk_size (see createEQCatalogLayer()). Events 
+    without magnitude are skipped."""
+
+    pr = layer.dataProvider()
+
+    event_cnt = catalog.size()
+    for chunk_start in xrange(0, event_cnt, chunk_size):
+        chunk_end = min(chunk_start + chunk_size, event_cnt)
+
+        lon = catalog.lon[chunk_start:chunk_end].tolist()
+        lat = catalog.lat[chunk_start:chunk_end].tolist()
+        magnitude = catalog.magnitude[chunk_start:chunk_end].tolist()
+        depth = catalog.depth[chunk_start:chunk_end].tolist()
+
+        feature_list = []
+        for (ev_lon, ev_lat, ev_mag, ev_depth) in zip(lon, lat, magnitude, 
+            depth):
+
+            if numpy.isnan(ev_mag):
+                continue
+
+            f = QgsFeature()
+            f.setGeometry(QgsGeometry.fromPoint(QgsPoint(ev_lon, ev_lat)))
+            f[0] = QVariant(ev_mag)
+            f[1] = QVariant(ev_depth)
+            feature_list.append(f)
+
+        pr.addFeatures(feature_list)
+
+        if progress_callback is not None:
+            progress_callback(chunk_end, event_cnt)
+
+def importQPCatalog(catalog_path):
+    """Read ZMAP catalog file (plain or gzipped) into QuakePy catalog, and
+    remove events below CATALOG_MINMAG or without magnitude."""
+
+    qpcatalog = QPCatalog.QPCatalog()
+
+    if catalog_path.endswith('.gz'):
+        qpcatalog.importZMAP(catalog_path, minimumDataset=True,
+            compression='gz')
+    else:
+        qpcatalog.importZMAP(catalog_path, minimumDataset=True)
+
+    # cut catalog to years > 1900 (because of datetime)
+    # TODO(fab): change the datetime lib to mx.DateTime
+    # catalog.cut(mintime='1900-01-01', mintime_exclude=True)
+    
+    # cut catalog below M=2.0 and remove potential NaN magnitudes
+    qpcatalog.cut(minmag=CATALOG_MINMAG, minmag_exclude=False, 
+        removeNaN=True)
+
+    return qpcatalog
+
+def readZMAPCatalog(catalog_path, minmag=CATALOG_MINMAG, mindepth=None, 
+    maxdepth=None, bounds=None, chunk_size=ZMAP_READ_CHUNK_SIZE):
+    """Read ZMAP catalog file (plain or gzipped) into columnar catalog, 
+    without creating a QuakePy catalog.
+
+    The file is parsed in chunks of chunk_size lines. Events below minmag
+    or without magnitude, outside of the depth range (events without depth
+    are kept), and outside of bounding box (lon_min, lat_min, lon_max, 
+    lat_max) are removed from each chunk before it is appended to the 
+    result, so that memory use is determined by the filtered catalog.
+
+    event_idx of the result refers to the QuakePy catalog created with
+    importQPCatalog() for the same file, which is read on demand (at full
+    memory cost, see QPCatalogSource.get()).
+    """
+
+    if catalog_path.endswith('.gz'):
+        fh = gzip.open(catalog_path, 'rb')
+    else:
+        fh = open(catalog_path, 'r')
+
+    # rows: lon, lat, depth, magnitude, time, event_idx
+    event_arr = ColumnBuffer(6)
+
+    # number of events that passed magnitude filter
+    mag_event_cnt = 0
+
+    try:
+        while True:
+            lines = list(itertools.islice(fh, chunk_size))
+            if len(lines) == 0:
+                break
+
+            chunk = _parseZMAPLines(lines)
+            magnitude = chunk[:, 5]
+
+            with numpy.errstate(invalid='ignore'):
+                selected = (magnitude >= minmag)
+
+            event_idx = mag_event_cnt + numpy.cumsum(selected) - 1
+            mag_event_cnt += int(selected.sum())
+
+            with numpy.errstate(invalid='ignore'):
+                if mindepth is not None:
+                    selected &= ~(chunk[:, 6] < mindepth)
+                if maxdepth is not None:
+                    selected &= ~(chunk[:, 6] > maxdepth)
+
+                if bounds is not None:
+                    (lon_min, lat_min, lon_max, lat_max) = bounds
+                    selected &= (chunk[:, 0] >= lon_min) & \
+                        (chunk[:, 0] <= lon_max) & \
+                        (chunk[:, 1] >= lat_min) & (chunk[:, 1] <= lat_max)
+
+            chunk = chunk[selected]
+            time = zmapDecimalYear(chunk[:, 2], chunk[:, 3], chunk[:, 4], 
+                chunk[:, 7], chunk[:, 8], chunk[:, 9])
+
+            event_arr.append(numpy.vstack((chunk[:, 0], chunk[:, 1], 
+                chunk[:, 6], chunk[:, 5], time, event_idx[selected])))
+    finally:
+        fh.close()
+
+    event_arr = event_arr.values()
+
+    return ColumnarCatalog(event_arr[0], event_arr[1], event_arr[2], 
+        event_arr[3], event_arr[4], event_arr[5].astype(int),
+        qpcatalog=QPCatalogSource(catalog_path=catalog_path, 
+            event_cnt=mag_event_cnt))
+
+def _parseZMAPLines(lines):
+    """Parse ZMAP lines into array with ZMAP_COLUMN_CNT columns. 
+    Missing seconds are set to zero. Lines with less than 9 columns 
+    or with values that cannot be parsed as numbers are skipped."""
+
+    lines = [line for line in lines if line.strip() != '']
+    if len(lines) == 0:
+        return numpy.zeros((0, ZMAP_COLUMN_CNT))
+
+    # fast path: all lines have the same number of columns
+    column_cnt = len(lines[0].split())
+    values = numpy.fromstring(''.join(lines), sep=' ')
+    
+    if column_cnt in (ZMAP_COLUMN_CNT - 1, ZMAP_COLUMN_CNT) and \
+        values.size == len(lines) * column_cnt:
+        values = values.reshape((len(lines), column_cnt))
+    else:
+        rows = []
+        for line in lines:
+            row = line.split()[0:ZMAP_COLUMN_CNT]
+            if len(row) < ZMAP_COLUMN_CNT - 1:
+                continue
+
+            try:
+                rows.append([float(x) for x in row] + \
+                    (ZMAP_COLUMN_CNT - len(row)) * [0.0])
+            except ValueError:
+                continue
+        values = numpy.array(rows, dtype=float).reshape((-1, 
+            ZMAP_COLUMN_CNT))
+
+    if values.shape[1] < ZMAP_COLUMN_CNT:
+        values = numpy.hstack((values, numpy.zeros((values.shape[0], 1))))
+
+    return values
+
+def zmapDecimalYear(year, month, day, hour, minute, second):
+    """Compute decimal years from ZMAP date and time columns."""
+
+    year = numpy.floor(year).astype(int)
+    
+    year_start = (year - 1970).astype('M8[Y]')
+    next_year_start = (year - 1969).astype('M8[Y]')
+    date = (year_start.astype('M8[M]') + \
+        (month.astype(int) - 1).astype('m8[M]')).astype('M8[D]') + \
+        (day.astype(int) - 1).astype('m8[D]')
+
+    seconds = (date - year_start.astype('M8[D]')).astype(float) * 86400.0 + \
+        hour * 3600.0 + minute * 60.0 + second
+    year_seconds = (next_year_start.astype('M8[D]') - \
+        year_start.astype('M8[D]')).astype(float) * 86400.0
+
+    return year + seconds / year_seconds
+
+class ColumnBuffer(object):
+    """Array of fixed number of rows, to which columns can be appended. 
+    Capacity is doubled when it is exceeded."""
+
+    def __init__(self, row_cnt, capacity=ZMAP_READ_CHUNK_SIZE):
+        self.data = numpy.empty((row_cnt, capacity), dtype=float)
+        self.size = 0
+
+    def append(self, columns):
+        column_cnt = columns.shape[1]
+
+        if self.size + column_cnt > self.data.shape[1]:
+            capacity = max(2 * self.data.shape[1], self.size + column_cnt)
+            data = numpy.empty((self.data.shape[0], capacity), dtype=float)
+            data[:, 0:self.size] = self.data[:, 0:self.size]
+            self.data = data
+
+        self.data[:, self.size:self.size+column_cnt] = columns
+        self.size += column_cnt
+
+    def values(self):
+        """Return copy of array, trimmed to used size."""
+        return self.data[:, 0:self.size].copy()
+
+def getCatalogCachePaths(catalog_path):
+    """Return paths of array file and metadata file of catalog cache."""
+    cache_base = os.path.join(os.path.dirname(catalog_path), 
+        CATALOG_CACHE_DIR, os.path.basename(catalog_path))
+    return (cache_base + CATALOG_CACHE_ARRAY_SUFFIX, 
+        cache_base + CATALOG_CACHE_METADATA_SUFFIX)
+
+def loadCatalogCache(catalog_path):
+    """Load columnar catalog from binary cache of catalog file. 
+    Event arrays are memory-mapped. Returns None if there is no cache, or
+    if it has been written for another version of the catalog file."""
+
+    (array_path, metadata_path) = getCatalogCachePaths(catalog_path)
+
+    try:
+        with open(metadata_path, 'rb') as fh:
+            metadata = cPickle.load(fh)
+
+        if metadata['version'] != CATALOG_CACHE_VERSION or \
+            metadata['minmag'] != CATALOG_MINMAG or \
+            metadata['sha1'] != fileHash(catalog_path):
+            return None
+
+        event_arr = numpy.load(array_path, mmap_mode='r')
+
+    except (IOError, OSError, EOFError, KeyError, ValueError, 
+        cPickle.UnpicklingError):
+        return None
+
+    if event_arr.shape != (5, metadata['event_cnt']):
+        return None
+
+    return ColumnarCatalog(event_arr[0], event_arr[1], event_arr[2], 
+        event_arr[3], event_arr[4], 
+        qpcatalog=QPCatalogSource(catalog_path=catalog_path, 
+            event_cnt=metadata['event_cnt']))
+
+def writeCatalogCache(catalog, catalog_path):
+    """Write binary cache for catalog read from catalog file. The metadata
+    file, which validates the cache, is written last."""
+
+    (array_path, metadata_path) = getCatalogCachePaths(catalog_path)
+
+    metadata = {'version': CATALOG_CACHE_VERSION, 
+        'minmag': CATALOG_MINMAG, 'sha1': fileHash(catalog_path), 
+        'event_cnt': catalog.size()}
+
+    try:
+        if os.path.isfile(metadata_path):
+            os.remove(metadata_path)
+
+        cache_dir = os.path.dirname(array_path)
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+
+        numpy.save(array_path, numpy.vstack((catalog.lon, catalog.lat, 
+            catalog.depth, catalog.magnitude, catalog.time)))
+
+        with open(metadata_path, 'wb') as fh:
+            cPickle.dump(metadata, fh, cPickle.HIGHEST_PROTOCOL)
+
+    except (IOError, OSError), e:
+        print "Could not write catalog cache %s: %s" % (array_path, e)
+
+def fileHash(path, blocksize=2**20):
+    """Return SHA-1 hex digest of file contents."""
+    sha1 = hashlib.sha1()
+    with open(path, 'rb') as fh:
+        for block in iter(lambda: fh.read(blocksize), ''):
+            sha1.update(block)
+    return sha1.hexdigest()
 
 def getMinMaxDepth(cls):
     """Get min and max constraint for depth filtering of EQ catalog."""
@@ -146,3 +462,448 @@ def getMinMaxDepth(cls):
         
     return (mindepth, maxdepth)
 
+class ColumnarCatalog(object):
+    """EQ catalog as NumPy arrays of event longitude, latitude, depth,
+    magnitude, and time (decimal year). Cuts are done with boolean masks 
+    and return new ColumnarCatalog objects that share the QuakePy catalog
+    of the original one. A QuakePy catalog is only created where QuakePy 
+    functionality is needed.
+
+    Missing depths and magnitudes are NaN. event_idx holds the index of 
+    each event in the underlying QuakePy catalog. The QuakePy catalog can
+    be given as QPCatalogSource, which reads it from the catalog file when
+    it is first needed (for catalogs loaded from the binary cache).
+
+    Polygon cuts use a grid index over the epicentres, which is built on 
+    first use (or with buildSpatialIndex()) and is passed on to catalogs
+    created with boolean masks.
+
+    Events of zones of a polygon layer can be looked up in an event-to-zone
+    table (see ZoneMembership), which is computed once per set of zone 
+    geometries and kept with the catalog.
+
+    Each catalog has a revision number that is unique among all catalogs,
+    and changes when events are appended.
+    """
+
+    def __init__(self, lon, lat, depth, magnitude, time, event_idx=None,
+        qpcatalog=None):
+
+        self.lon = numpy.asarray(lon, dtype=float)
+        self.lat = numpy.asarray(lat, dtype=float)
+        self.depth = numpy.asarray(depth, dtype=float)
+        self.magnitude = numpy.asarray(magnitude, dtype=float)
+        self.time = numpy.asarray(time, dtype=float)
+
+        if event_idx is None:
+            event_idx = numpy.arange(self.lon.shape[0])
+        self.event_idx = numpy.asarray(event_idx, dtype=int)
+
+        if isinstance(qpcatalog, QPCatalogSource):
+            self.qpcatalog = qpcatalog
+        else:
+            self.qpcatalog = QPCatalogSource(qpcatalog)
+        self.spatial_index = None
+
+        # event-to-zone tables, by tuple of zone keys, in order of last
+        # use, and (table, zone index) by zone key
+        self.zone_memberships = collections.OrderedDict()
+        self.zone_lookup = {}
+
+        self.revision = next(CATALOG_REVISION)
+
+        # foreshock time fraction of window declustering (see decluster()),
+        # None if catalog has not been declustered
+        self.decluster_foreshock_fraction = None
+
+    @classmethod
+    def fromQPCatalog(cls, qpcatalog):
+        """Create columnar catalog from QuakePy catalog, in one pass over
+        the events."""
+
+        event_cnt = len(qpcatalog.eventParameters.event)
+        (lon, lat, depth, magnitude, time) = [
+            numpy.ones(event_cnt) * numpy.nan for x in xrange(5)]
+
+        for ev_idx, curr_event in enumerate(qpcatalog.eventParameters.event):
+            curr_ori = curr_event.getPreferredOrigin()
+
+            lon[ev_idx] = curr_ori.longitude.value
+            lat[ev_idx] = curr_ori.latitude.value
+            time[ev_idx] = dateTime2DecimalYear(curr_ori.time.value)
+
+            try:
+                depth[ev_idx] = curr_ori.depth.value
+            except AttributeError:
+                pass
+
+            try:
+                magnitude[ev_idx] = \
+                    curr_event.getPreferredMagnitude().mag.value
+            except IndexError:
+                pass
+
+        return cls(lon, lat, depth, magnitude, time, qpcatalog=qpcatalog)
+
+    def __len__(self):
+        return self.lon.shape[0]
+
+    def size(self):
+        """Number of events."""
+        return self.lon.shape[0]
+
+    def select(self, selection):
+        """Return new catalog with events selected by boolean mask or 
+        index array."""
+        selected = ColumnarCatalog(self.lon[selection], self.lat[selection],
+            self.depth[selection], self.magnitude[selection], 
+            self.time[selection], self.event_idx[selection], self.qpcatalog)
+
+        selection = numpy.asarray(selection)
+        if self.spatial_index is not None and selection.dtype == bool:
+            selected.spatial_index = self.spatial_index.select(selection)
+
+        return selected
+
+    def decluster(self, 
+        foreshock_time_fraction=decluster.FORESHOCK_TIME_FRACTION):
+        """Return new catalog without aftershocks, from window-based 
+        declustering with Gardner-Knopoff windows. Foreshocks are only 
+        removed if foreshock_time_fraction is greater than zero."""
+        (mainshock, cluster) = decluster.declusterWindow(self.lon, self.lat,
+            self.time, self.magnitude, foreshock_time_fraction)
+
+        declustered = self.select(mainshock)
+        declustered.decluster_foreshock_fraction = foreshock_time_fraction
+        return declustered
+
+    def buildSpatialIndex(self):
+        """Build grid index over epicentres."""
+        self.spatial_index = spatial.GridIndex(self.lon, self.lat)
+
+    def insidePolygon(self, polygon):
+        """Return boolean array, True for events inside Shapely polygon."""
+        if self.spatial_index is None:
+            self.buildSpatialIndex()
+        return spatial.pointsInPolygon(self.lon, self.lat, polygon, 
+            self.spatial_index)
+
+    def cutGeometry(self, polygon):
+        """Return new catalog with events inside Shapely polygon."""
+        return self.select(self.insidePolygon(polygon))
+
+    def append(self, new_catalog, catalog_path=None):
+        """Append events of another columnar catalog in place, e.g., read
+        with readZMAPCatalog() from catalog_path. The QuakePy catalog
+        gets the events of catalog_path appended. 
+
+        If this catalog has been declustered, the catalog is declustered
+        again together with the new events, with the same foreshock time
+        fraction, and only new events that are mainshocks are appended. 
+        Events of this catalog are kept in any case.
+        
+        The spatial index is rebuilt, and existing event-to-zone tables are
+        updated by testing only the new events against the zone polygons.
+        Returns indices of the new events.
+        """
+
+        event_offset = self.size()
+
+        if self.decluster_foreshock_fraction is not None:
+            (mainshock, cluster) = decluster.declusterWindow(
+                numpy.concatenate((self.lon, new_catalog.lon)),
+                numpy.concatenate((self.lat, new_catalog.lat)),
+                numpy.concatenate((self.time, new_catalog.time)),
+                numpy.concatenate((self.magnitude, new_catalog.magnitude)),
+                self.decluster_foreshock_fraction)
+            new_catalog = new_catalog.select(mainshock[event_offset:])
+
+        # new events are appended to QuakePy catalog
+        qp_offset = self.qpcatalog.event_cnt
+        if qp_offset is None:
+            qp_offset = event_offset
+        if catalog_path is not None:
+            self.qpcatalog.addFile(catalog_path, 
+                new_catalog.qpcatalog.event_cnt)
+
+        self.lon = numpy.concatenate((self.lon, new_catalog.lon))
+        self.lat = numpy.concatenate((self.lat, new_catalog.lat))
+        self.depth = numpy.concatenate((self.depth, new_catalog.depth))
+        self.magnitude = numpy.concatenate((self.magnitude, 
+            new_catalog.magnitude))
+        self.time = numpy.concatenate((self.time, new_catalog.time))
+        self.event_idx = numpy.concatenate((self.event_idx, 
+            qp_offset + new_catalog.event_idx))
+
+        if self.spatial_index is not None:
+            self.buildSpatialIndex()
+
+        for membership in self.zone_memberships.values():
+            membership.append(new_catalog, event_offset)
+
+        self.revision = next(CATALOG_REVISION)
+
+        return numpy.arange(event_offset, self.size())
+
+    def zoneMembership(self, layer):
+        """Return event-to-zone table for all valid polygons of layer.
+        The table is computed only once for the given zone geometries."""
+        provider = layer.dataProvider()
+        provider.select()
+        (polygons, vertices) = utils.polygonsQGS2Shapely(provider, 
+            layer=layer)
+        return self.zoneMembershipForPolygons(polygons)
+
+    def zoneMembershipForPolygons(self, polygons):
+        """Return event-to-zone table for list of Shapely polygons.
+        The table is computed only once for the given zone geometries.
+        At most MAX_ZONE_MEMBERSHIP_CNT tables are kept."""
+        zone_keys = tuple([utils.polygonKey(polygon) for polygon in polygons])
+
+        if zone_keys in self.zone_memberships:
+            membership = self.zone_memberships.pop(zone_keys)
+        else:
+            membership = ZoneMembership(self, polygons, zone_keys)
+            for zone_idx, zone_key in enumerate(zone_keys):
+                self.zone_lookup[zone_key] = (membership, zone_idx)
+
+        self.zone_memberships[zone_keys] = membership
+
+        while len(self.zone_memberships) > MAX_ZONE_MEMBERSHIP_CNT:
+            (evicted_keys, evicted) = self.zone_memberships.popitem(
+                last=False)
+            self._dropZoneLookup(evicted)
+
+        return membership
+
+    def _dropZoneLookup(self, membership):
+        """Remove zone lookup entries that point to an event-to-zone table.
+        Zones that are also contained in another table are looked up in 
+        that table."""
+        for zone_key in membership.zone_keys:
+            if self.zone_lookup.get(zone_key, (None, None))[0] is \
+                membership:
+                del self.zone_lookup[zone_key]
+
+        for other in self.zone_memberships.values():
+            for zone_idx, zone_key in enumerate(other.zone_keys):
+                if zone_key not in self.zone_lookup:
+                    self.zone_lookup[zone_key] = (other, zone_idx)
+
+    def zoneEvents(self, polygon):
+        """Return sorted indices of events inside Shapely polygon. Uses 
+        existing event-to-zone table that contains the polygon. Polygons 
+        not contained in any table are tested directly, without creating 
+        a table."""
+        zone_key = utils.polygonKey(polygon)
+        if zone_key not in self.zone_lookup:
+            return numpy.where(self.insidePolygon(polygon))[0]
+
+        (membership, zone_idx) = self.zone_lookup[zone_key]
+        return membership.zoneEvents(zone_idx)
+
+    def cutZone(self, polygon):
+        """Return new catalog with events inside Shapely polygon, using 
+        event-to-zone table."""
+        return self.select(self.zoneEvents(polygon))
+
+    def depthMask(self, mindepth=CUT_DEPTH_MIN, maxdepth=CUT_DEPTH_MAX):
+        """Return boolean array, True for events in depth range (limits
+        included) and events with NaN depth."""
+        with numpy.errstate(invalid='ignore'):
+            return ~((self.depth < mindepth) | (self.depth > maxdepth))
+
+    def cutDepth(self, mindepth=CUT_DEPTH_MIN, maxdepth=CUT_DEPTH_MAX):
+        """Return new catalog with events in depth range (limits 
+        included). Events with NaN depth are not excluded."""
+        return self.select(self.depthMask(mindepth, maxdepth))
+
+    def cutMagnitude(self, minmag=None, maxmag=None, minmag_exclude=False,
+        maxmag_exclude=False):
+        """Return new catalog with events in magnitude range. Events with
+        NaN magnitude are excluded."""
+
+        mask = ~numpy.isnan(self.magnitude)
+
+        with numpy.errstate(invalid='ignore'):
+            if minmag is not None:
+                if minmag_exclude is True:
+                    mask &= (self.magnitude > minmag)
+                else:
+                    mask &= (self.magnitude >= minmag)
+
+            if maxmag is not None:
+                if maxmag_exclude is True:
+                    mask &= (self.magnitude < maxmag)
+                else:
+                    mask &= (self.magnitude <= maxmag)
+
+        return self.select(mask)
+
+    def timeSpan(self):
+        """Return (time span in years, start time, end time). Start and
+        end time are datetime objects."""
+        
+        if self.size() == 0:
+            return (0.0, None, None)
+
+        start_time = numpy.nanmin(self.time)
+        end_time = numpy.nanmax(self.time)
+
+        return (end_time - start_time, decimalYear2DateTime(start_time),
+            decimalYear2DateTime(end_time))
+
+    def toQPCatalog(self):
+        """Return QuakePy catalog with the events of this catalog. Events 
+        are shared with the underlying QuakePy catalog, not copied."""
+        return selectEvents(self.qpcatalog.get(), self.event_idx)
+
+class ZoneMembership(object):
+    """Sparse event-to-zone table of a catalog for a list of zone polygons,
+    in CSR layout: the (sorted) indices of the events in zone i are
+    event_indices[offsets[i]:offsets[i+1]].
+    """
+
+    def __init__(self, catalog, polygons, zone_keys=None):
+
+        self.polygons = polygons
+        self.zone_keys = zone_keys
+        self._setZoneEvents([numpy.where(catalog.insidePolygon(polygon))[0] \
+            for polygon in polygons])
+
+    def _setZoneEvents(self, zone_events):
+        self.offsets = numpy.concatenate(([0], 
+            numpy.cumsum([x.size for x in zone_events]))).astype(int)
+
+        if len(zone_events) > 0:
+            self.event_indices = numpy.concatenate(zone_events).astype(int)
+        else:
+            self.event_indices = numpy.array([], dtype=int)
+
+    def append(self, new_catalog, event_offset):
+        """Add events of catalog that has been appended at event_offset."""
+
+        zone_events = []
+        for zone_idx, polygon in enumerate(self.polygons):
+            new_events = numpy.where(spatial.pointsInPolygon(
+                new_catalog.lon, new_catalog.lat, polygon))[0]
+            zone_events.append(numpy.concatenate((self.zoneEvents(zone_idx),
+                event_offset + new_events)))
+
+        self._setZoneEvents(zone_events)
+
+    def zonesWithEvents(self, event_indices):
+        """Return indices of zones that contain at least one of the given
+        events."""
+        entry_zones = numpy.repeat(numpy.arange(self.zoneCount()), 
+            numpy.diff(self.offsets))
+        return numpy.unique(entry_zones[numpy.in1d(self.event_indices, 
+            event_indices)])
+
+    def zoneCount(self):
+        """Number of zones."""
+        return self.offsets.size - 1
+
+    def zoneEvents(self, zone_idx):
+        """Return indices of events in zone."""
+        return self.event_indices[
+            self.offsets[zone_idx]:self.offsets[zone_idx+1]]
+
+def getZonesWithEvents(catalog, layer, event_indices):
+    """Return feature IDs of polygon layer features that contain at least
+    one of the given catalog events."""
+    zones = catalog.zoneMembership(layer).zonesWithEvents(event_indices)
+
+    provider = layer.dataProvider()
+    provider.select()
+    return [feature.id() for (zone_idx, feature) in \
+        utils.walkValidPolygonFeatures(provider) if zone_idx in zones]
+
+class QPCatalogSource(object):
+    """QuakePy catalog shared by columnar catalogs derived from each other.
+    If no QuakePy catalog is given, it is read from the catalog file(s) on
+    first access. event_cnt is the number of events in the QuakePy 
+    catalog."""
+
+    def __init__(self, qpcatalog=None, catalog_path=None, event_cnt=None):
+        self.qpcatalog = qpcatalog
+
+        if catalog_path is None:
+            self.catalog_paths = []
+        else:
+            self.catalog_paths = [catalog_path]
+
+        if event_cnt is None and qpcatalog is not None:
+            event_cnt = len(qpcatalog.eventParameters.event)
+        self.event_cnt = event_cnt
+
+    def addFile(self, catalog_path, event_cnt):
+        """Append events of catalog file."""
+        if self.qpcatalog is not None:
+            self.qpcatalog.merge(importQPCatalog(catalog_path))
+        else:
+            self.catalog_paths.append(catalog_path)
+
+        if self.event_cnt is not None:
+            self.event_cnt += event_cnt
+
+    def get(self):
+        """Return QuakePy catalog. On first access, the catalog files are
+        parsed by QuakePy (see importQPCatalog()). This is not covered by
+        the chunked reading of readZMAPCatalog(): the full QuakePy catalog
+        of all files is held in memory, as before columnar catalogs were 
+        introduced.
+
+        Raises RuntimeError if the number of events of the QuakePy catalog
+        differs from event_cnt, since event indices of columnar catalogs 
+        would refer to the wrong events.
+        """
+
+        if self.qpcatalog is None:
+            self.qpcatalog = importQPCatalog(self.catalog_paths[0])
+            for catalog_path in self.catalog_paths[1:]:
+                self.qpcatalog.merge(importQPCatalog(catalog_path))
+
+        qpevent_cnt = len(self.qpcatalog.eventParameters.event)
+        if self.event_cnt is not None and qpevent_cnt != self.event_cnt:
+            error_str = "QuakePy catalog of %s has %s events, expected %s" % (
+                ', '.join(self.catalog_paths), qpevent_cnt, self.event_cnt)
+            raise RuntimeError, error_str
+
+        return self.qpcatalog
+
+def selectEvents(catalog, indices):
+    """Get QuakePy catalog with the events at given indices of an existing
+    catalog. Events are shared with the original catalog, not copied.
+    """
+    events = catalog.eventParameters.event
+
+    selected_catalog = copy.copy(catalog)
+    selected_catalog.eventParameters = copy.copy(catalog.eventParameters)
+    selected_catalog.eventParameters.event = [events[idx] for idx in indices]
+
+    return selected_catalog
+
+def dateTime2DecimalYear(time_in):
+    """Convert datetime object to decimal year."""
+    
+    time_in = datetime.datetime(time_in.year, time_in.month, time_in.day, 
+        time_in.hour, time_in.minute, int(time_in.second))
+    year_start = datetime.datetime(time_in.year, 1, 1)
+    year_end = datetime.datetime(time_in.year + 1, 1, 1)
+
+    return time_in.year + _totalSeconds(time_in - year_start) / \
+        _totalSeconds(year_end - year_start)
+
+def decimalYear2DateTime(decimal_year):
+    """Convert decimal year to datetime object."""
+
+    year = int(numpy.floor(decimal_year))
+    year_start = datetime.datetime(year, 1, 1)
+    year_end = datetime.datetime(year + 1, 1, 1)
+
+    return year_start + datetime.timedelta(seconds=round(
+        (decimal_year - year) * _totalSeconds(year_end - year_start)))
+
+def _totalSeconds(delta):
+    return delta.days * 86400.0 + delta.seconds + delta.microseconds * 1.0e-6
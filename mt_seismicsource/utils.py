@@ -24,9 +24,12 @@ Author: Fabian Euchner, fabian@sed.ethz.ch
 #    59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.             #
 ############################################################################
 
+import hashlib
 import numpy
 import os
 import shapely.geometry
+import shapely.prepared
+import shapely.strtree
 import shutil
 import stat
 import subprocess
@@ -39,28 +42,28 @@ from PyQt4.QtGui import *
 from qgis.core import *
 
 from mt_seismicsource import features
+from mt_seismicsource.algorithms import spatial
 
 SHAPEFILE_ENCODING = "UTF-8"
 SHAPEFILE_DEFAULT_CRS = 4326
 
 EARTH_CIRCUMFERENCE_EQUATORIAL_KM = 40075.017
 
-# maximum likelihood a- and b-values, as implemented in ZMAP
+# spatial indexes of polygon layers, by id of data provider
+ZONE_INDEX_CACHE = {}
 
-def assignActivityMaxLikelihood():
-    pass
+# geometry of polygon features, by (layer ID, feature ID)
+GEOMETRY_CACHE = {}
 
-def computeActivityMaxLikelihood(zones, catalog):
-    """Computes a-and b values using the maximum likelihood method for
-    a set of source zone polygons.
-    
-    Input: 
-        zones       iterable of polygon features in QGis format
-        catalog     earthquake catalog as QuakePy object
+# polygon areas in square metres, by polygon key
+AREA_CACHE = {}
 
-    Output: list of (a, b) pairs
-    """
-    pass
+# buffer zones around polygons, by (polygon key, buffer distance in km)
+BUFFER_ZONE_CACHE = {}
+
+# overlap weights of polygons with zones of a polygon layer, by (id of data 
+# provider, polygon keys)
+OVERLAP_WEIGHTS_CACHE = {}
 
 # Misc. QGis/Shapely featutes
 
@@ -116,20 +119,31 @@ def verticesOuterFromQGSPolygon(feature):
             return None
     return vertices
 
-def polygonsQGS2Shapely(polygons, getVertices=False):
+def polygonsQGS2Shapely(polygons, getVertices=False, layer=None):
     """Convert feature geometry of QGis polygon iterable to list of Shapely
-    polygons. Polygons can be a list of QGis features, or a data provider."""
+    polygons. Polygons can be a list of QGis features, or a data provider.
+    If the layer of the features is given, polygons are taken from the 
+    geometry cache (see getFeatureGeometry())."""
 
     polygons_shapely = []
     vertices_shapely = []
 
     for feature in polygons:
 
-        vertices = verticesOuterFromQGSPolygon(feature)
-        if vertices is None:
-            continue
+        if layer is not None:
+            geometry = getFeatureGeometry(layer, feature)
+            if geometry is None:
+                continue
+
+            shapely_polygon = geometry.polygon
+            vertices = list(shapely_polygon.exterior.coords)[0:-1]
+        else:
+            vertices = verticesOuterFromQGSPolygon(feature)
+            if vertices is None:
+                continue
+
+            shapely_polygon = shapely.geometry.Polygon(vertices)
 
-        shapely_polygon = shapely.geometry.Polygon(vertices)
         polygons_shapely.append(shapely_polygon)
 
         if getVertices is True:
@@ -138,62 +152,444 @@ def polygonsQGS2Shapely(polygons, getVertices=False):
 
     return (polygons_shapely, vertices_shapely)
 
+class FeatureGeometry(object):
+    """Shapely polygon of a QGis polygon feature, with bounding box. 
+    Prepared geometry, centroid, and area are computed on first use."""
+
+    def __init__(self, polygon):
+        self.polygon = polygon
+        self.bounds = polygon.bounds
+
+        self._prepared = None
+        self._centroid = None
+        self._area = None
+
+    def prepared(self):
+        """Prepared geometry, for repeated predicate tests."""
+        if self._prepared is None:
+            self._prepared = shapely.prepared.prep(self.polygon)
+        return self._prepared
+
+    def centroid(self):
+        """Centroid as Shapely point."""
+        if self._centroid is None:
+            self._centroid = self.polygon.centroid
+        return self._centroid
+
+    def area(self):
+        """Polygon area in square kilometres."""
+        if self._area is None:
+            self._area = polygonAreaFromWGS84(self.polygon) * 1.0e-6
+        return self._area
+
+def getFeatureGeometry(layer, feature):
+    """Return FeatureGeometry of QGis polygon feature of layer, or None if 
+    the feature has no valid polygon geometry. Geometries are cached by
+    layer ID and feature ID, and removed from the cache when the layer is
+    edited (see watchLayerGeometries())."""
+
+    key = (str(layer.id()), feature.id())
+
+    if key not in GEOMETRY_CACHE:
+        vertices = verticesOuterFromQGSPolygon(feature)
+        if vertices is None:
+            GEOMETRY_CACHE[key] = None
+        else:
+            GEOMETRY_CACHE[key] = FeatureGeometry(
+                shapely.geometry.Polygon(vertices))
+
+    return GEOMETRY_CACHE[key]
+
+def invalidateFeatureGeometry(layer=None, feature_id=None):
+    """Remove cached geometries of a feature of layer, or of all features 
+    of layer (if feature_id is None). If layer is None, the geometry cache
+    is cleared."""
+
+    if layer is None:
+        GEOMETRY_CACHE.clear()
+        AREA_CACHE.clear()
+        BUFFER_ZONE_CACHE.clear()
+        return
+
+    layer_id = str(layer.id())
+    if feature_id is not None:
+        GEOMETRY_CACHE.pop((layer_id, feature_id), None)
+    else:
+        for key in GEOMETRY_CACHE.keys():
+            if key[0] == layer_id:
+                del GEOMETRY_CACHE[key]
+
+def watchLayerGeometries(layer):
+    """Connect edit signals of QGis vector layer to invalidation of the
+    cached geometries and the spatial index of the layer."""
+
+    def invalidateFeature(feature_id, *args):
+        invalidateFeatureGeometry(layer, feature_id)
+        invalidateZoneIndex(layer.dataProvider())
+
+    def invalidateLayer(*args):
+        invalidateFeatureGeometry(layer)
+        invalidateZoneIndex(layer.dataProvider())
+
+    QObject.connect(layer, SIGNAL("geometryChanged(int, QgsGeometry&)"),
+        invalidateFeature)
+    QObject.connect(layer, SIGNAL("featureDeleted(int)"), invalidateFeature)
+    QObject.connect(layer, SIGNAL("featureAdded(int)"), invalidateFeature)
+
+    # feature IDs of added features change on commit
+    QObject.connect(layer, SIGNAL("editingStopped()"), invalidateLayer)
+
 def findBackgroundZone(point, provider_back, ui_mode=True):
     """Find background zone in which a given Shapely point lies.
     Returns (i) zone as QGis feature, (ii) zone as Shapely polygon,
-    (iii) zone area in square kilometres
+    (iii) zone area in square kilometres. If no zone contains the point,
+    (None, None, None) is returned.
+
+    Uses the spatial index of the background zone provider (see 
+    getZoneIndex()).
     """
     
-    bg_zone = None
-    bg_poly = None 
-    bg_area = None
+    zone_index = getZoneIndex(provider_back)
+    bgz_idx = zone_index.find(point)
 
-    # TODO(fab): this can probably be made more efficient
-    
-    # loop over background zones
-    provider_back.select()
-    provider_back.rewind()
-    for bgz_idx, bgz in walkValidPolygonFeatures(provider_back):
+    if bgz_idx is None:
+        return (None, None, None)
+    else:
+        return (zone_index.feature(bgz_idx), zone_index.polygons[bgz_idx],
+            zone_index.area(bgz_idx))
+
+class ZoneIndex(object):
+    """Spatial index over the valid polygon features of a data provider.
+    Shapely polygons, prepared geometries, and an STR tree over the 
+    polygons are built once. Lookups test only zones whose 
+    bounding box intersects the query geometry. Only geometry is held by 
+    the index, feature attributes are read from the provider on access 
+    (see feature()), so that they are never stale.
+    """
 
-        # convert background zone polygon to Shapely
-        bg_polylist, vertices = polygonsQGS2Shapely((bgz,))
-        
-        if len(bg_polylist) == 0:
-            error_msg = "Cannot convert background zone (ID %s) to Shapely" % (
-                bgz.id())
-            if ui_mode is True:
-                QMessageBox.warning(None, "Broken zone", error_msg)
+    def __init__(self, provider):
+
+        self.provider = provider
+        self.feature_count = provider.featureCount()
+
+        feature_ids = []
+        self.polygons = []
+
+        provider.select()
+        provider.rewind()
+        for zone_idx, zone in walkValidPolygonFeatures(provider):
+            polylist, vertices = polygonsQGS2Shapely((zone,))
+            feature_ids.append(zone.id())
+            self.polygons.append(polylist[0])
+
+        self.prepared = [shapely.prepared.prep(x) for x in self.polygons]
+        self.feature_ids = numpy.array(feature_ids, dtype=int)
+        self.areas = numpy.ones(len(self.polygons)) * numpy.nan
+
+        # STR tree returns polygons, which are mapped back to zone indices
+        self.tree = shapely.strtree.STRtree(self.polygons)
+        self.tree_indices = dict([(id(polygon), zone_idx) for \
+            zone_idx, polygon in enumerate(self.polygons)])
+
+    def query(self, geometry):
+        """Return sorted indices of zones whose bounding box intersects
+        the bounding box of Shapely geometry."""
+        return numpy.array(sorted([self.tree_indices[id(polygon)] for \
+            polygon in self.tree.query(geometry)]), dtype=int)
+
+    def find(self, point):
+        """Return index of zone that contains Shapely point, or None. If 
+        zones overlap, the first zone in provider order is used."""
+
+        for zone_idx in self.query(point):
+            if self.prepared[zone_idx].contains(point):
+                return zone_idx
+
+        return None
+
+    def feature(self, zone_idx):
+        """Return QGis feature of zone, with current attribute values from
+        provider."""
+        feature = QgsFeature()
+        self.provider.featureAtId(int(self.feature_ids[zone_idx]), feature,
+            True, self.provider.attributeIndexes())
+        return feature
+
+    def area(self, zone_idx):
+        """Return area of zone in square kilometres. Areas of all zones
+        are computed on first use."""
+        if numpy.isnan(self.areas[zone_idx]):
+            self.areas = polygonAreasFromWGS84(self.polygons) * 1.0e-6
+        return self.areas[zone_idx]
+
+    def isValid(self, provider):
+        """Check if index has been built for provider and its features."""
+        return (provider is self.provider and \
+            provider.featureCount() == self.feature_count)
+
+def getZoneIndex(provider):
+    """Return spatial index for polygon features of provider. The index is 
+    built on first use, and rebuilt if the number of features changed."""
+
+    key = id(provider)
+    if key not in ZONE_INDEX_CACHE or \
+        not ZONE_INDEX_CACHE[key].isValid(provider):
+        ZONE_INDEX_CACHE[key] = ZoneIndex(provider)
+
+    return ZONE_INDEX_CACHE[key]
+
+def invalidateZoneIndex(provider=None):
+    """Remove spatial index of provider, and overlap weights computed with
+    it, from cache. If provider is None, all spatial indexes are removed."""
+
+    if provider is None:
+        ZONE_INDEX_CACHE.clear()
+        OVERLAP_WEIGHTS_CACHE.clear()
+    else:
+        ZONE_INDEX_CACHE.pop(id(provider), None)
+        for key in OVERLAP_WEIGHTS_CACHE.keys():
+            if key[0] == id(provider):
+                del OVERLAP_WEIGHTS_CACHE[key]
+
+def polygonKey(polygon):
+    """Return key that identifies zone geometry of Shapely polygon."""
+    return hashlib.sha1(polygon.wkb).hexdigest()
+
+class OverlapWeights(object):
+    """Sparse matrix of overlap weights between a list of Shapely polygons
+    (rows) and the zones of a ZoneIndex (columns), stored in compressed row
+    format: the zones overlapped by polygon i are 
+    zones[offsets[i]:offsets[i+1]]. The weight is the fraction of polygon 
+    area that lies inside the zone. Fractions are computed from areas in 
+    lon/lat coordinates, which is adequate for zones of limited extent.
+    """
+
+    def __init__(self, polygons, zone_index):
+
+        self.zone_index = zone_index
+        self.polygon_cnt = len(polygons)
+
+        row_zones = []
+        row_fractions = []
+        for polygon in polygons:
+            (zones, fractions) = self._overlaps(polygon)
+            row_zones.append(zones)
+            row_fractions.append(fractions)
+
+        self.offsets = numpy.cumsum([0] + [x.size for x in row_zones])
+        self.rows = numpy.repeat(numpy.arange(self.polygon_cnt), 
+            numpy.diff(self.offsets))
+        self.zones = numpy.concatenate(
+            [numpy.array([], dtype=int)] + row_zones).astype(int)
+        self.fractions = numpy.concatenate(
+            [numpy.array([], dtype=float)] + row_fractions)
+
+    def _overlaps(self, polygon):
+        """Return zone indices and area fractions of one polygon."""
+
+        zones = []
+        fractions = []
+
+        if polygon.is_empty or polygon.area == 0.0:
+            return (numpy.array(zones, dtype=int), 
+                numpy.array(fractions, dtype=float))
+
+        # candidates: zones with overlapping bounding box
+        for zone_idx in self.zone_index.query(polygon):
+            prepared = self.zone_index.prepared[zone_idx]
+            if not prepared.intersects(polygon):
+                continue
+            elif prepared.contains(polygon):
+                fraction = 1.0
             else:
-                print error_msg
-            continue
-        else:
-            bg_poly = bg_polylist[0]
-    
-        if point.within(bg_poly):
-            bg_zone = bgz
-            
-            # get polygon area in square kilometres
-            bg_area = polygonAreaFromWGS84(bg_poly) * 1.0e-6
-            break
+                fraction = self.zone_index.polygons[zone_idx].intersection(
+                    polygon).area / polygon.area
+
+            if fraction > 0.0:
+                zones.append(zone_idx)
+                fractions.append(fraction)
+
+        return (numpy.array(zones, dtype=int), 
+            numpy.array(fractions, dtype=float))
+
+    def row(self, polygon_idx):
+        """Return (zone indices, area fractions) of polygon."""
+        start = self.offsets[polygon_idx]
+        end = self.offsets[polygon_idx+1]
+        return (self.zones[start:end], self.fractions[start:end])
+
+    def dominantZones(self):
+        """Return array with index of zone that has the largest overlap 
+        with each polygon (-1 for polygons that overlap no zone)."""
+
+        dominant = -numpy.ones(self.polygon_cnt, dtype=int)
+
+        # entries sorted by polygon, then by fraction: last entry of each
+        # polygon has largest fraction
+        order = numpy.lexsort((self.fractions, self.rows))
+        nonempty = numpy.diff(self.offsets) > 0
+        dominant[nonempty] = self.zones[order[self.offsets[1:][nonempty]-1]]
+
+        return dominant
+
+    def weightedMean(self, values):
+        """Return area-weighted mean of zone values for each polygon.
+        values is an array with one value per zone of the ZoneIndex. Zones
+        with NaN values are ignored, polygons without valid zone values 
+        get NaN."""
+
+        values = numpy.asarray(values, dtype=float)[self.zones]
+        valid = ~numpy.isnan(values)
+
+        weight_sum = numpy.bincount(self.rows[valid], 
+            weights=self.fractions[valid], minlength=self.polygon_cnt)
+        value_sum = numpy.bincount(self.rows[valid], 
+            weights=self.fractions[valid] * values[valid], 
+            minlength=self.polygon_cnt)
+
+        with numpy.errstate(invalid='ignore', divide='ignore'):
+            return numpy.where(weight_sum > 0.0, value_sum / weight_sum, 
+                numpy.nan)
+
+def getOverlapWeights(polygons, provider):
+    """Return overlap weights (see OverlapWeights) of Shapely polygons
+    with the polygon features of provider. Weights are computed in one pass
+    over all polygons, using the spatial index of the provider, and cached 
+    by polygon geometry."""
+
+    zone_index = getZoneIndex(provider)
+    key = (id(provider), tuple([polygonKey(x) for x in polygons]))
+
+    weights = OVERLAP_WEIGHTS_CACHE.get(key, None)
+    if weights is None or weights.zone_index is not zone_index:
+        weights = OverlapWeights(polygons, zone_index)
+        OVERLAP_WEIGHTS_CACHE[key] = weights
+
+    return weights
+
+def findOverlappingZone(polygon, provider_back):
+    """Find background zone that has the largest overlap with a given 
+    Shapely polygon. Returns (i) zone as QGis feature, (ii) zone as Shapely 
+    polygon, (iii) zone area in square kilometres. If the polygon overlaps
+    no zone, (None, None, None) is returned.
+    """
 
-    return (bg_zone, bg_poly, bg_area)
+    weights = getOverlapWeights((polygon,), provider_back)
+    bgz_idx = weights.dominantZones()[0]
+
+    if bgz_idx < 0:
+        return (None, None, None)
+    else:
+        zone_index = weights.zone_index
+        return (zone_index.feature(bgz_idx), zone_index.polygons[bgz_idx],
+            zone_index.area(bgz_idx))
 
 def computeBufferZone(zone_poly_shapely, buffer_km):
     """Compute buffer zone polygon and its area in square km around given
-    polygon."""
-    
-    buffer_distance_deg = 360.0 * buffer_km / (
-        EARTH_CIRCUMFERENCE_EQUATORIAL_KM)
-    buffer_zone = zone_poly_shapely.buffer(buffer_distance_deg)
-    buffer_zone_area = polygonAreaFromWGS84(buffer_zone) * 1.0e-6
-    
-    return (buffer_zone, buffer_zone_area)
-    
-def getSelectedRefZoneIndices(reference_zones):
-    """Get indices of selected zones from list of all source zones.
-    reference_zones is list of selected QGis features."""
-    return []
+    polygon (see computeBufferZones())."""
+    return computeBufferZones((zone_poly_shapely,), buffer_km)[0]
 
+def computeBufferZones(polygons, buffer_km):
+    """Compute buffer zone polygons and their areas in square km around 
+    given Shapely polygons (WGS84 lon/lat), for all polygons at once.
+
+    Buffers are computed in metres, in a local azimuthal equidistant
+    projection centred at the centre of the bounding box of each polygon.
+    The vertices of all polygons are projected, and the vertices of all 
+    buffer zones are transformed back, in one vectorized step each. Buffer
+    zones are cached by polygon geometry and buffer distance.
+
+    Output:
+        list of (buffer zone as Shapely polygon, area in square km)
+    """
+
+    keys = [(polygonKey(x), float(buffer_km)) for x in polygons]
+    missing = [idx for idx, key in enumerate(keys) \
+        if key not in BUFFER_ZONE_CACHE]
+
+    if len(missing) > 0:
+
+        # projection centres
+        centres = numpy.array([((x.bounds[0] + x.bounds[2]) / 2.0, 
+            (x.bounds[1] + x.bounds[3]) / 2.0) for x in \
+                [polygons[idx] for idx in missing]]).reshape((-1, 2))
+
+        # buffer in projected coordinates
+        rings = [[numpy.array(polygons[idx].exterior.coords)[:, 0:2]] + \
+            [numpy.array(x.coords)[:, 0:2] for x in \
+                polygons[idx].interiors] for idx in missing]
+        projected = _transformRings(rings, centres, 
+            spatial.projectAzimuthalEquidistant)
+
+        # rings of buffer zone parts (more than one part only for invalid
+        # polygons), with index of their polygon
+        buffer_rings = []
+        buffer_owner = []
+        for buffer_idx, rings_projected in enumerate(projected):
+            buffer_zone = shapely.geometry.Polygon(rings_projected[0], 
+                rings_projected[1:]).buffer(1000.0 * buffer_km)
+
+            for part in getattr(buffer_zone, 'geoms', (buffer_zone,)):
+                buffer_rings.append(
+                    [numpy.array(part.exterior.coords)[:, 0:2]] + \
+                    [numpy.array(x.coords)[:, 0:2] for x in part.interiors])
+                buffer_owner.append(buffer_idx)
+
+        # back to lon/lat
+        parts = [shapely.geometry.Polygon(x[0], x[1:]) for x in \
+            _transformRings(buffer_rings, centres[buffer_owner], 
+                spatial.unprojectAzimuthalEquidistant)]
+
+        # parts are ordered by polygon
+        part_offsets = numpy.searchsorted(buffer_owner, 
+            numpy.arange(len(missing) + 1))
+
+        buffer_zones = []
+        for buffer_idx in xrange(len(missing)):
+            buffer_parts = parts[
+                part_offsets[buffer_idx]:part_offsets[buffer_idx+1]]
+            if len(buffer_parts) == 1:
+                buffer_zones.append(buffer_parts[0])
+            else:
+                buffer_zones.append(
+                    shapely.geometry.MultiPolygon(buffer_parts))
+
+        buffer_areas = polygonAreasFromWGS84(buffer_zones) * 1.0e-6
+
+        for buffer_idx, idx in enumerate(missing):
+            BUFFER_ZONE_CACHE[keys[idx]] = (buffer_zones[buffer_idx], 
+                buffer_areas[buffer_idx])
+
+    return [BUFFER_ZONE_CACHE[key] for key in keys]
+
+def _transformRings(rings, centres, transform):
+    """Apply coordinate transformation with per-polygon centre to the
+    rings of all polygons at once. rings is a list (one element per 
+    polygon) of lists of (vertices x 2) arrays. Returns transformed rings 
+    in the same structure."""
+
+    flat_rings = [ring for polygon_rings in rings for ring in polygon_rings]
+    ring_cnt = [len(x) for x in rings]
+
+    # centre of each vertex
+    vertex_cnt = [sum([ring.shape[0] for ring in polygon_rings]) for \
+        polygon_rings in rings]
+    vertex_centres = numpy.repeat(centres, vertex_cnt, axis=0)
+
+    coord = numpy.vstack(flat_rings)
+    (x, y) = transform(coord[:, 0], coord[:, 1], vertex_centres[:, 0], 
+        vertex_centres[:, 1])
+    coord = numpy.column_stack((x, y))
+
+    # split into rings, then group by polygon
+    ring_offsets = numpy.cumsum([0] + [x.shape[0] for x in flat_rings])
+    flat_result = [coord[ring_offsets[idx]:ring_offsets[idx+1]] for idx in \
+        xrange(len(flat_rings))]
+
+    polygon_offsets = numpy.cumsum([0] + ring_cnt)
+    return [flat_result[polygon_offsets[idx]:polygon_offsets[idx+1]] for \
+        idx in xrange(len(rings))]
+    
 def getAttributeIndex(provider, attributes, create=True):
     """Get indices of attributes in QGis layer. 
 
@@ -299,15 +695,63 @@ def polygonAreaFromWGS84(polygon):
     Output:
         area        Polygon area in square metres
     """
-    poly_area_deg = polygon.area
-    poly_center = polygon.centroid
+    return polygonAreasFromWGS84((polygon,))[0]
 
-    # get coordinates of polygon centre
-    area = poly_area_deg * \
-        numpy.power((EARTH_CIRCUMFERENCE_EQUATORIAL_KM * 1000 / 360.0), 2) * \
-        numpy.cos(numpy.pi * float(poly_center.y) / 180.0)
+def polygonAreasFromWGS84(polygons):
+    """Compute ellipsoidal areas of Shapely polygons or multipolygons 
+    given in WGS84 lon/lat, in square metres. The rings of all polygons 
+    that are not in the area cache are flattened into one coordinate array
+    and their areas are computed at once (see spatial.ringAreasWGS84()).
+
+    Input:
+        polygons    list of Shapely polygons
 
-    return area
+    Output:
+        array of polygon areas in square metres
+    """
+
+    keys = [polygonKey(x) for x in polygons]
+    areas = numpy.array([AREA_CACHE.get(x, numpy.nan) for x in keys])
+
+    missing = numpy.where(numpy.isnan(areas))[0]
+    if missing.size == 0:
+        return areas
+
+    # rings of polygons to compute, with their polygon index and sign 
+    # (exterior: +1, interior: -1)
+    rings = []
+    ring_polygon = []
+    ring_sign = []
+    for polygon_idx in missing:
+        polygon = polygons[polygon_idx]
+        if hasattr(polygon, 'geoms'):
+            parts = polygon.geoms
+        else:
+            parts = (polygon,)
+
+        for part in parts:
+            if part.is_empty:
+                continue
+            rings.append(numpy.array(part.exterior.coords)[:, 0:2])
+            ring_polygon.append(polygon_idx)
+            ring_sign.append(1.0)
+            for interior in part.interiors:
+                rings.append(numpy.array(interior.coords)[:, 0:2])
+                ring_polygon.append(polygon_idx)
+                ring_sign.append(-1.0)
+
+    areas[missing] = 0.0
+    if len(rings) > 0:
+        ring_areas = numpy.abs(spatial.ringAreasWGS84(numpy.vstack(rings), 
+            numpy.cumsum([0] + [x.shape[0] for x in rings])))
+        areas += numpy.bincount(ring_polygon, 
+            weights=numpy.array(ring_sign) * ring_areas, 
+            minlength=len(polygons))
+
+    for polygon_idx in missing:
+        AREA_CACHE[keys[polygon_idx]] = areas[polygon_idx]
+
+    return areas
 
 def writeLayerToShapefile(layer, path, crs=None, encoding=SHAPEFILE_ENCODING, 
     ui_mode=True):
@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+"""
+SHARE Seismic Source Toolkit
+
+Tests for completeness filtering and Weichert's method.
+
+Author: Fabian Euchner, fabian@sed.ethz.ch
+"""
+
+############################################################################
+#    This program is free software; you can redistribute it and/or modify  #
+#    it under the terms of the GNU General Public License as published by  #
+#    the Free Software Foundation; either version 2 of the License, or     #
+#    (at your option) any later version.                                   #
+#                                                                          #
+#    This program is distributed in the hope that it will be useful,       #
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of        #
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         #
+#    GNU General Public License for more details.                          #
+#                                                                          #
+#    You should have received a copy of the GNU General Public License     #
+#    along with this program; if not, write to the                         #
+#    Free Software Foundation, Inc.,                                       #
+#    59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.             #
+############################################################################
+
+import unittest
+
+import numpy
+
+from mt_seismicsource.algorithms import completeness
+from mt_seismicsource.algorithms import weichert
+
+BINSIZE = 0.1
+
+A_VALUE = 4.0
+B_VALUE = 1.0
+
+CATALOG_START = 1800.0
+CATALOG_END = 2000.0
+MAG_MIN = 2.0
+
+MCDIST = "3.0 1950 4.0 1900 5.0 1800"
+
+# a and b values are averaged over independent synthetic catalogs
+CATALOG_CNT = 10
+
+def syntheticCatalog(random_state):
+    """Gutenberg-Richter catalog with unrounded magnitudes, with events
+    above MAG_MIN between CATALOG_START and CATALOG_END."""
+
+    annual_rate = 10**(A_VALUE - B_VALUE * MAG_MIN)
+    event_cnt = random_state.poisson(annual_rate * (CATALOG_END - 
+        CATALOG_START))
+
+    magnitude = MAG_MIN + random_state.exponential(
+        1.0 / (B_VALUE * numpy.log(10.0)), event_cnt)
+    time = random_state.uniform(CATALOG_START, CATALOG_END, event_cnt)
+
+    return (magnitude, time)
+
+def binnedCounts(magnitude, mag_bins):
+    """Incremental counts in bins centred on multiples of BINSIZE."""
+    bin_idx = numpy.round((magnitude - mag_bins[0]) / BINSIZE).astype(int)
+    return numpy.bincount(bin_idx, minlength=mag_bins.size)[numpy.newaxis, :]
+
+class TestWeichertCompleteness(unittest.TestCase):
+
+    def setUp(self):
+        self.random_state = numpy.random.RandomState(7)
+
+    def _estimate(self, magnitude, time, binsize):
+        mag_bins = numpy.round(numpy.arange(MAG_MIN, 
+            magnitude.max() + BINSIZE, BINSIZE) / BINSIZE) * BINSIZE
+
+        events = numpy.arange(magnitude.size)
+        complete = completeness.completeZoneEvents([events], [MCDIST], 
+            magnitude, time, binsize)[0]
+
+        (mc_mag, mc_year) = completeness.parseMcdist([MCDIST])
+        duration = completeness.completenessDuration(mag_bins, mc_mag, 
+            mc_year, CATALOG_START, CATALOG_END)
+
+        (a, b, sigma_a, sigma_b, event_cnt) = weichert.estimateWeichert(
+            binnedCounts(magnitude[complete], mag_bins), mag_bins, 
+            duration, BINSIZE, mmin=3.0)
+        return (a[0], b[0])
+
+    def test_unrounded_magnitudes(self):
+        """Events are complete in the same magnitude bins that are used
+        for the observation times, so that a and b are not biased."""
+
+        estimates = numpy.array([self._estimate(magnitude, time, BINSIZE) \
+            for (magnitude, time) in [syntheticCatalog(self.random_state) \
+                for catalog_idx in xrange(CATALOG_CNT)]])
+        (a, b) = estimates.mean(axis=0)
+
+        self.assertAlmostEqual(a, A_VALUE, delta=0.08)
+        self.assertAlmostEqual(b, B_VALUE, delta=0.03)
+
+    def test_bin_centre_completeness(self):
+        """Event just below Mc is complete if its bin centre is at Mc."""
+
+        (mc_mag, mc_year) = completeness.parseMcdist([MCDIST])
+        zone_idx = numpy.zeros(2, dtype=int)
+        magnitude = numpy.array([2.97, 2.94])
+        time = numpy.array([1960.0, 1960.0])
+
+        self.assertEqual(completeness.completenessMask(zone_idx, magnitude, 
+            time, mc_mag, mc_year).tolist(), [False, False])
+        self.assertEqual(completeness.completenessMask(zone_idx, magnitude, 
+            time, mc_mag, mc_year, BINSIZE).tolist(), [True, False])
+
+if __name__ == '__main__':
+    unittest.main()
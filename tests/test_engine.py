@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+"""
+SHARE Seismic Source Toolkit
+
+Tests for recomputation of zone attributes after appending catalog events.
+
+Author: Fabian Euchner, fabian@sed.ethz.ch
+"""
+
+############################################################################
+#    This program is free software; you can redistribute it and/or modify  #
+#    it under the terms of the GNU General Public License as published by  #
+#    the Free Software Foundation; either version 2 of the License, or     #
+#    (at your option) any later version.                                   #
+#                                                                          #
+#    This program is distributed in the hope that it will be useful,       #
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of        #
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         #
+#    GNU General Public License for more details.                          #
+#                                                                          #
+#    You should have received a copy of the GNU General Public License     #
+#    along with this program; if not, write to the                         #
+#    Free Software Foundation, Inc.,                                       #
+#    59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.             #
+############################################################################
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy
+
+from PyQt4.QtCore import *
+
+from qgis.core import *
+
+from mt_seismicsource import engine
+from mt_seismicsource import features
+from mt_seismicsource import utils
+from mt_seismicsource.layers import eqcatalog
+
+# fault background zones: boxes of 1 x 1 degree along the equator
+ZONE_CNT = 3
+ZONE_EVENT_CNT = 400
+
+ML_ATTRIBUTES = (features.AREA_SOURCE_ATTR_A_ML, 
+    features.AREA_SOURCE_ATTR_B_ML, features.AREA_SOURCE_ATTR_MC_ML)
+
+def grMagnitudes(size, b_value, mmin, random_state):
+    """Gutenberg-Richter distributed magnitudes, rounded to 0.1."""
+    magnitudes = mmin - 0.05 + random_state.exponential(
+        1.0 / (b_value * numpy.log(10.0)), size)
+    return numpy.round(magnitudes, 1)
+
+class TestAppendCatalogEvents(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        QgsApplication.setPrefixPath(os.environ.get('QGIS_PREFIX_PATH', 
+            '/usr'), True)
+        QgsApplication.initQgis()
+
+    def setUp(self):
+        self.random_state = numpy.random.RandomState(42)
+        self.tempdir = tempfile.mkdtemp()
+
+        self.layer = QgsVectorLayer("Polygon", "Fault Background", "memory")
+        feature_list = []
+        for zone_idx in xrange(ZONE_CNT):
+            ring = [QgsPoint(x, y) for (x, y) in ((zone_idx, 0.0), 
+                (zone_idx + 1.0, 0.0), (zone_idx + 1.0, 1.0), 
+                (zone_idx, 1.0), (zone_idx, 0.0))]
+            f = QgsFeature()
+            f.setGeometry(QgsGeometry.fromPolygon([ring]))
+            feature_list.append(f)
+        self.layer.dataProvider().addFeatures(feature_list)
+
+        self.zone_ids = [feature.id() for zone_idx, feature in \
+            utils.walkValidPolygonFeatures(self.layer.dataProvider())]
+
+        # events in all zones, between 1950 and 2000
+        event_cnt = ZONE_CNT * ZONE_EVENT_CNT
+        lon = numpy.repeat(numpy.arange(ZONE_CNT), ZONE_EVENT_CNT) + \
+            self.random_state.uniform(0.1, 0.9, event_cnt)
+        lat = self.random_state.uniform(0.1, 0.9, event_cnt)
+        self.catalog = eqcatalog.ColumnarCatalog(lon, lat, 
+            self.random_state.uniform(0.0, 30.0, event_cnt),
+            grMagnitudes(event_cnt, 1.0, 3.0, self.random_state), 
+            self.random_state.uniform(1950.0, 2000.0, event_cnt))
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def _writeZMAP(self, lon, lat, magnitude, year):
+        catalog_path = os.path.join(self.tempdir, 'appended.zmap.dat')
+        fh = open(catalog_path, 'w')
+        for (curr_lon, curr_lat, curr_mag, curr_year) in zip(lon, lat, 
+            magnitude, year):
+            fh.write("%.4f %.4f %d 6 15 %.1f 10.0 12 0 0\n" % (curr_lon, 
+                curr_lat, curr_year, curr_mag))
+        fh.close()
+        return catalog_path
+
+    def _readAttributes(self):
+        provider = self.layer.dataProvider()
+        attribute_map = utils.getAttributeIndex(provider, ML_ATTRIBUTES, 
+            create=False)
+        values = {}
+        for zone_idx, feature in utils.walkValidPolygonFeatures(provider):
+            values[feature.id()] = [feature[attribute_map[x['name']][0]\
+                ].toDouble()[0] for x in ML_ATTRIBUTES]
+        return values
+
+    def test_only_affected_zones_change(self):
+
+        self.layer.setSelectedFeatures(self.zone_ids)
+        engine.computeFBZ(self.layer, self.catalog, ui_mode=False)
+        before = self._readAttributes()
+
+        # new events only in second zone, with larger magnitudes, inside
+        # time span of catalog
+        new_cnt = 200
+        catalog_path = self._writeZMAP(
+            self.random_state.uniform(1.1, 1.9, new_cnt),
+            self.random_state.uniform(0.1, 0.9, new_cnt),
+            grMagnitudes(new_cnt, 0.6, 3.0, self.random_state),
+            self.random_state.randint(1960, 1990, new_cnt))
+
+        updated = engine.appendCatalogEvents(self.catalog, catalog_path, 
+            layer_fault_background=self.layer, ui_mode=False)
+        after = self._readAttributes()
+
+        self.assertEqual(updated['fbz'], [self.zone_ids[1]])
+        self.assertEqual(updated['asz'], [])
+        self.assertEqual(updated['fsz'], [])
+
+        for zone_id in (self.zone_ids[0], self.zone_ids[2]):
+            self.assertEqual(after[zone_id], before[zone_id])
+
+        self.assertNotEqual(after[self.zone_ids[1]], 
+            before[self.zone_ids[1]])
+        self.assertEqual(self.catalog.size(), 
+            ZONE_CNT * ZONE_EVENT_CNT + new_cnt)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+"""
+SHARE Seismic Source Toolkit
+
+Tests for moment rate computation from strain rate grids.
+
+Author: Fabian Euchner, fabian@sed.ethz.ch
+"""
+
+############################################################################
+#    This program is free software; you can redistribute it and/or modify  #
+#    it under the terms of the GNU General Public License as published by  #
+#    the Free Software Foundation; either version 2 of the License, or     #
+#    (at your option) any later version.                                   #
+#                                                                          #
+#    This program is distributed in the hope that it will be useful,       #
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of        #
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         #
+#    GNU General Public License for more details.                          #
+#                                                                          #
+#    You should have received a copy of the GNU General Public License     #
+#    along with this program; if not, write to the                         #
+#    Free Software Foundation, Inc.,                                       #
+#    59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.             #
+############################################################################
+
+import unittest
+
+import numpy
+import shapely.geometry
+
+from mt_seismicsource.algorithms import momentrate
+from mt_seismicsource.algorithms import spatial
+from mt_seismicsource.algorithms import strain
+
+def momentrateBarbaPerNode(poly, strain_in, regime):
+    """Per-node summation with Shapely intersects(), as done before grid
+    nodes were selected in one vectorized pass."""
+
+    total = 0.0
+    for (lon, lat, value) in strain_in:
+        point = shapely.geometry.Point((lon, lat))
+        if poly.intersects(point) and value > 0.0:
+            regime_key = strain.tectonicRegimeForPoint(point, regime)
+            if regime_key == strain.DEFORMATION_REGIME_KEY_R:
+                cz = strain.BIRD_SEISMICITY_PARAMETERS[\
+                    strain.DEFORMATION_REGIME_KEY_OTF]['cz']
+            else:
+                cz = strain.BIRD_SEISMICITY_PARAMETERS[\
+                    strain.DEFORMATION_REGIME_KEY_CTF]['cz']
+            total += (cz * value)
+
+    return 1000 * momentrate.SHEAR_MODULUS * total
+
+class TestStrainRateGrid(unittest.TestCase):
+
+    def setUp(self):
+
+        # regular 0.5 degree grid, with distinct positive values
+        (lon, lat) = numpy.meshgrid(numpy.arange(0.0, 10.5, 0.5), 
+            numpy.arange(40.0, 50.5, 0.5))
+        value = 1.0e-15 * (1.0 + numpy.arange(lon.size))
+        self.strain_in = numpy.column_stack((lon.ravel(), lat.ravel(), 
+            value)).tolist()
+
+        # ridge-transform regime with edge on grid line lon = 5.0
+        self.regime = {strain.DEFORMATION_REGIME_KEY_R: 
+            shapely.geometry.Polygon(((5.0, 40.0), (10.0, 40.0), 
+                (10.0, 50.0), (5.0, 50.0)))}
+
+    def test_boundary_aligned_polygon(self):
+        """Zone with vertices and edges on grid nodes."""
+
+        poly = shapely.geometry.Polygon(((2.0, 42.0), (7.0, 42.0), 
+            (7.0, 46.5), (4.5, 48.0), (2.0, 46.5)))
+
+        expected = momentrateBarbaPerNode(poly, self.strain_in, self.regime)
+        computed = momentrate.momentrateFromStrainRateBarba(poly, 
+            self.strain_in, self.regime)
+
+        self.assertTrue(expected > 0.0)
+        self.assertAlmostEqual(computed / expected, 1.0, places=12)
+
+    def test_polygon_with_hole(self):
+        """Nodes on the boundary of a hole intersect the zone."""
+
+        poly = shapely.geometry.Polygon(
+            ((1.0, 41.0), (9.0, 41.0), (9.0, 49.0), (1.0, 49.0)), 
+            [((4.0, 44.0), (6.0, 44.0), (6.0, 46.0), (4.0, 46.0))])
+
+        expected = momentrateBarbaPerNode(poly, self.strain_in, self.regime)
+        computed = momentrate.momentrateFromStrainRateBarba(poly, 
+            self.strain_in, self.regime)
+
+        self.assertAlmostEqual(computed / expected, 1.0, places=12)
+
+    def test_points_in_polygon_boundary(self):
+
+        poly = shapely.geometry.Polygon(((0.0, 0.0), (2.0, 0.0), 
+            (2.0, 2.0), (0.0, 2.0)))
+        lon = numpy.array([1.0, 0.0, 2.0, 1.0, 3.0, 2.0 + 1.0e-6])
+        lat = numpy.array([1.0, 0.0, 1.0, 2.0, 1.0, 1.0])
+
+        strict = spatial.pointsInPolygon(lon, lat, poly)
+        inclusive = spatial.pointsInPolygon(lon, lat, poly, boundary=True)
+        intersects = [poly.intersects(shapely.geometry.Point(x, y)) \
+            for (x, y) in zip(lon, lat)]
+
+        self.assertEqual(inclusive.tolist(), intersects)
+        self.assertTrue(strict[0])
+        self.assertFalse(strict[4] or strict[5])
+
+if __name__ == '__main__':
+    unittest.main()